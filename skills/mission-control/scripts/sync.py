@@ -6,10 +6,15 @@ Mission Control 同步脚本
 
 import json
 import os
+import sys
 import glob
 from datetime import datetime
 from pathlib import Path
 
+# 复用 team-tasks 的项目路径解析（兼容 flat / sharded 布局）
+sys.path.insert(0, str(Path(__file__).resolve().parents[2] / "team-tasks" / "scripts"))
+from task_manager import get_store  # noqa: E402
+
 # 配置
 VAULT_PATH = Path("/Users/shengchun.sun/Library/Mobile Documents/iCloud~md~obsidian/Documents/ctovault")
 MISSION_CONTROL = VAULT_PATH / "Mission Control"
@@ -33,41 +38,38 @@ def read_team_tasks():
     """读取所有 team-tasks 项目"""
     tasks = []
     if TEAM_TASKS_DIR.exists():
-        for json_file in TEAM_TASKS_DIR.glob("*.json"):
+        # 通过 team-tasks TaskStore 读取（mtime 缓存 + 统一 project/name 等字段差异）
+        for project in get_store(TEAM_TASKS_DIR).projects():
             try:
-                with open(json_file) as f:
-                    data = json.load(f)
-                    project_id = json_file.stem
-                    project_name = data.get("name", project_id)
-                    project_status = data.get("status", "unknown")
+                for stage_id, stage_info in project.iter_stages():
+                    # 统一状态映射
+                    raw_status = stage_info.get("status", "unknown").lower()
+                    if raw_status == "cancelled":
+                        continue  # 上游失败被取消，看板不再展示
+                    if raw_status in ["done", "completed"]:
+                        status = "done"
+                    elif raw_status in ["in-progress", "running", "active"]:
+                        status = "in-progress"
+                    elif raw_status in ["todo", "pending", "waiting"]:
+                        status = "todo"
+                    elif raw_status in ["failed", "error"]:
+                        status = "review"  # 需要审查
+                    else:
+                        status = "todo"
                     
-                    for stage_id, stage_info in data.get("stages", {}).items():
-                        # 统一状态映射
-                        raw_status = stage_info.get("status", "unknown").lower()
-                        if raw_status in ["done", "completed"]:
-                            status = "done"
-                        elif raw_status in ["in-progress", "running", "active"]:
-                            status = "in-progress"
-                        elif raw_status in ["todo", "pending", "waiting"]:
-                            status = "todo"
-                        elif raw_status in ["failed", "error"]:
-                            status = "review"  # 需要审查
-                        else:
-                            status = "todo"
-                        
-                        tasks.append({
-                            "project": project_name,
-                            "project_id": project_id,
-                            "stage": stage_id,
-                            "status": status,
-                            "agent": stage_info.get("agent", "unknown"),
-                            "last_update": stage_info.get("completed_at") or stage_info.get("updated_at") or data.get("updated_at", ""),
-                            "notes": stage_info.get("notes") or stage_info.get("output") or stage_info.get("task", ""),
-                            "output": stage_info.get("output", ""),
-                            "task": stage_info.get("task", "")
-                        })
+                    tasks.append({
+                        "project": project.title,
+                        "project_id": project.name,
+                        "stage": stage_id,
+                        "status": status,
+                        "agent": stage_info.get("agent", "unknown"),
+                        "last_update": stage_info.get("completedAt") or stage_info.get("completed_at") or project.updated,
+                        "notes": stage_info.get("notes") or stage_info.get("output") or stage_info.get("task", ""),
+                        "output": stage_info.get("output", ""),
+                        "task": stage_info.get("task", "")
+                    })
             except Exception as e:
-                print(f"Error reading {json_file}: {e}")
+                print(f"Error reading {project.path}: {e}")
     return tasks
 
 def read_cron_jobs():
@@ -16,6 +16,10 @@ from pathlib import Path
 from datetime import datetime, timedelta
 from typing import Dict, List, Optional
 
+# 复用 team-tasks 的项目路径解析（兼容 flat / sharded 布局）
+sys.path.insert(0, str(Path(__file__).resolve().parents[2] / "team-tasks" / "scripts"))
+from task_manager import get_store, project_path, stale_stages  # noqa: E402
+
 # 配置
 PROJECTS_DIR = Path("/Users/shengchun.sun/.openclaw/workspace/data/team-tasks")
 LOGS_DIR = Path("/Users/shengchun.sun/.openclaw/workspace/logs")
@@ -107,31 +111,17 @@ def normalize_agent_name(agent: str) -> str:
     return alias.get(name, name)
 
 
-def get_last_log_time(stage: Dict) -> Optional[datetime]:
-    """获取最后活动时间（兼容旧/新 team-tasks 结构）"""
-    logs = stage.get('logs') or []
-    if logs:
-        last_log = logs[-1]
-        # 新版使用 time，旧版可能用 timestamp
-        dt = parse_iso_datetime(last_log.get('time') or last_log.get('timestamp'))
-        if dt:
-            return dt
-
-    # 兜底：用 startedAt / completedAt
-    return parse_iso_datetime(stage.get('startedAt') or stage.get('completedAt'))
-
-
 def check_project(project_file: Path) -> Optional[Dict]:
     """检查单个项目状态（兼容 linear / dag）"""
     try:
-        with open(project_file, 'r') as f:
-            project = json.load(f)
+        # 通过 team-tasks 的 TaskStore 读取（带 mtime 缓存，字段差异由 Project 统一）
+        project = get_store(PROJECTS_DIR).load(project_file)
+        if project is None:
+            raise ValueError("无法读取项目文件")
 
-        # 新版字段是 project，旧版可能是 name
-        project_name = project.get('project') or project.get('name') or project_file.stem
-        stages = project.get('stages', {})
+        project_name = project.title
 
-        for stage_name, stage in stages.items():
+        for stage_name, stage in project.iter_stages():
             status = stage.get('status')
 
             # 只检查 pending 或 in-progress 的阶段
@@ -139,9 +129,10 @@ def check_project(project_file: Path) -> Optional[Dict]:
                 continue
 
             # agent 优先使用 stage.agent（DAG/新版本），否则回退 stage_name
-            agent_name = normalize_agent_name(stage.get('agent') or stage_name)
+            agent_name = normalize_agent_name(project.agent_of(stage_name))
 
-            last_log_time = get_last_log_time(stage)
+            # 最后活动时间：最后一条日志（time/timestamp），兜底 startedAt/completedAt
+            last_log_time = project.last_activity(stage_name)
             if not last_log_time:
                 continue
 
@@ -278,27 +269,47 @@ Agent: {agent_name}
 
 
 def check_all_projects() -> List[Dict]:
-    """检查所有项目"""
+    """检查所有项目：从 team-tasks 的活动索引做一次范围查询，不再逐个打开项目文件"""
     results = []
     
     if not PROJECTS_DIR.exists():
         print(f"❌ 项目目录不存在: {PROJECTS_DIR}")
         return results
     
-    # 遍历所有项目文件
-    for project_file in PROJECTS_DIR.glob("*.json"):
-        print(f"\n🔍 检查项目: {project_file.stem}")
-        
-        stuck_task = check_project(project_file)
-        
-        if stuck_task:
-            print(f"  ⚠️  发现停滞任务: {stuck_task['stage']}")
-            print(f"     停滞时间: {stuck_task['stuck_duration']:.1f} 分钟")
-            print(f"     超时阈值: {stuck_task['timeout']} 分钟")
-            
-            results.append(stuck_task)
-        else:
-            print(f"  ✅ 状态正常")
+    # 按最小阈值取候选（索引缺失时 stale_stages 会全量重建），再按各 agent 阈值过滤
+    min_timeout = min([DEFAULT_TIMEOUT] + list(TIMEOUT_THRESHOLDS.values()))
+    seen = set()
+    for entry in stale_stages(min_timeout * 60, base_dir=PROJECTS_DIR):
+        if entry['project'] in seen:
+            continue  # 每个项目只报告最久未活动的一个阶段
+        stage_name = entry['stage']
+        agent_name = normalize_agent_name(entry['agent'])
+        timeout = TIMEOUT_THRESHOLDS.get(agent_name, TIMEOUT_THRESHOLDS.get(stage_name, DEFAULT_TIMEOUT))
+        last_log_time = datetime.fromtimestamp(entry['t']).astimezone()
+        stuck_minutes = (datetime.now().astimezone() - last_log_time).total_seconds() / 60
+        if stuck_minutes <= timeout:
+            continue
+
+        # 只为命中的项目读取任务描述
+        project = get_store(PROJECTS_DIR).get(entry['project'])
+        if project is None:
+            continue
+        seen.add(entry['project'])
+        stuck_task = {
+            'project': project.title,
+            'stage': stage_name,
+            'agent': agent_name,
+            'status': entry['status'],
+            'stuck_duration': stuck_minutes,
+            'task': project.stage(stage_name).get('task', ''),
+            'last_log_time': last_log_time.isoformat(),
+            'timeout': timeout
+        }
+        print(f"\n🔍 项目: {project.title}")
+        print(f"  ⚠️  发现停滞任务: {stuck_task['stage']}")
+        print(f"     停滞时间: {stuck_task['stuck_duration']:.1f} 分钟")
+        print(f"     超时阈值: {stuck_task['timeout']} 分钟")
+        results.append(stuck_task)
     
     return results
 
@@ -350,7 +361,7 @@ def main():
             print("\n✅ 所有项目状态正常")
     
     elif args.project:
-        project_file = PROJECTS_DIR / f"{args.project}.json"
+        project_file = Path(project_path(args.project, PROJECTS_DIR))
         
         if not project_file.exists():
             print(f"❌ 项目不存在: {args.project}")
@@ -380,18 +391,19 @@ def main():
         print(f"日志目录: {LOGS_DIR}")
         
         if PROJECTS_DIR.exists():
-            projects = list(PROJECTS_DIR.glob("*.json"))
+            projects = list(get_store(PROJECTS_DIR).projects())
             print(f"项目数量: {len(projects)}")
             
-            for project_file in projects:
-                with open(project_file, 'r') as f:
-                    project = json.load(f)
-                
-                print(f"\n  {project.get('project') or project.get('name') or project_file.stem}:")
-                for stage_name, stage in project.get('stages', {}).items():
+            for project in projects:
+                print(f"\n  {project.title}:")
+                # DAG 项目：可派发任务来自 TaskStore 按版本缓存的 CompactDag
+                ready = set(project.ready_tasks())
+                for stage_name, stage in project.iter_stages():
                     status = stage.get('status')
-                    agent_name = normalize_agent_name(stage.get('agent') or stage_name)
-                    icon = {'pending': '⬜', 'in-progress': '🔄', 'done': '✅'}.get(status, '❓')
+                    agent_name = normalize_agent_name(project.agent_of(stage_name))
+                    icon = {'pending': '⬜', 'in-progress': '🔄', 'done': '✅', 'cancelled': '🚫'}.get(status, '❓')
+                    if stage_name in ready:
+                        icon, status = '🟢', 'ready'
                     print(f"    {icon} {stage_name} ({agent_name}): {status}")
     
     else:
@@ -23,12 +23,16 @@ from datetime import datetime
 from pathlib import Path
 from typing import Dict, List, Optional, Any
 
+from task_manager import Project, get_store, project_path as resolve_project_path
+
 # 配置路径
 VAULT_PATH = Path("/Users/shengchun.sun/Library/Mobile Documents/iCloud~md~obsidian/Documents/ctovault")
 MISSION_CONTROL = VAULT_PATH / "Mission Control"
 TASKS_DIR = MISSION_CONTROL / "Tasks"
 TASKS_BOARD = MISSION_CONTROL / "Tasks Board.canvas"
 TEAM_TASKS_DATA = Path("/Users/shengchun.sun/.openclaw/workspace/data/team-tasks")
+# 任务输出只同步末尾部分（流式输出可能很大）
+OUTPUT_TAIL_BYTES = 4000
 
 
 def load_json(path: Path) -> dict:
@@ -54,6 +58,7 @@ def get_status_emoji(status: str) -> str:
         'done': '✅',
         'failed': '❌',
         'skipped': '⏭️',
+        'cancelled': '🚫',
         'completed': '✅'
     }
     return mapping.get(status, '❓')
@@ -70,26 +75,29 @@ def get_priority_color(priority: str) -> str:
     return mapping.get(priority, '⚪')
 
 
-def generate_task_md(project_data: dict, stage_name: str, stage_data: dict) -> str:
+def generate_task_md(project: Project, stage_name: str, stage_data: dict) -> str:
     """生成任务 Markdown 内容"""
     status = stage_data.get('status', 'pending')
-    agent = stage_data.get('agent', stage_name)
+    agent = project.agent_of(stage_name)
     task = stage_data.get('task', '')
-    output = stage_data.get('output', '')
+    output = project.read_output(stage_name, tail=OUTPUT_TAIL_BYTES)
+    if stage_data.get('outputLength', 0) > OUTPUT_TAIL_BYTES:
+        output = f"_…（共 {stage_data['outputLength']} 字节，仅显示末尾）_\n\n{output}"
     logs = stage_data.get('logs', [])
     started = stage_data.get('startedAt', '')
     completed = stage_data.get('completedAt', '')
     
     # 格式化时间
-    created = project_data.get('created_at', '')
-    updated = project_data.get('updated', '')
+    created = project.created
+    updated = project.updated
+    title = project.title
     
-    content = f"""# {project_data['name']} - {stage_name}
+    content = f"""# {title} - {stage_name}
 
 ## 元信息
 
-- **ID**: {project_data['name']}-{stage_name}
-- **项目**: [[{project_data['name']}]]
+- **ID**: {title}-{stage_name}
+- **项目**: [[{title}]]
 - **阶段**: {stage_name}
 - **Agent**: {agent}
 - **状态**: {status} {get_status_emoji(status)}
@@ -108,8 +116,8 @@ def generate_task_md(project_data: dict, stage_name: str, stage_data: dict) -> s
 
 """
     for log in logs[-5:]:  # 最近 5 条日志
-        ts = log.get('timestamp', log.get('time', ''))
-        action = log.get('action', log.get('event', ''))
+        ts = Project.log_time(log)
+        action = Project.log_event(log)
         content += f"- `{ts[:19] if ts else '-'}`: {action}\n"
     
     if not logs:
@@ -118,7 +126,7 @@ def generate_task_md(project_data: dict, stage_name: str, stage_data: dict) -> s
     content += f"""
 ---
 
-#openclaw #task #{project_data['name']} #{stage_name}
+#openclaw #task #{title} #{stage_name}
 """
     return content
 
@@ -127,7 +135,7 @@ def sync_project_to_obsidian(project_name: str, include_archive: bool = False) -
     """同步单个项目到 Obsidian"""
     # 检查是否是归档项目
     archive_path = TEAM_TASKS_DATA / "archive" / f"{project_name}.json"
-    active_path = TEAM_TASKS_DATA / f"{project_name}.json"
+    active_path = Path(resolve_project_path(project_name, TEAM_TASKS_DATA))
     
     if archive_path.exists() and not active_path.exists():
         if not include_archive:
@@ -139,17 +147,18 @@ def sync_project_to_obsidian(project_name: str, include_archive: bool = False) -
     if not project_path.exists():
         return 0
     
-    project_data = load_json(project_path)
-    stages = project_data.get('stages', {})
+    project = get_store(TEAM_TASKS_DATA).load(project_path, project_name)
+    if project is None:
+        return 0
     
     count = 0
-    for stage_name, stage_data in stages.items():
+    for stage_name, stage_data in project.iter_stages():
         # 生成文件名
         task_id = f"{project_name}-{stage_name}"
         task_file = TASKS_DIR / f"{task_id}.md"
         
         # 生成内容
-        content = generate_task_md(project_data, stage_name, stage_data)
+        content = generate_task_md(project, stage_name, stage_data)
         
         # 写入文件
         task_file.parent.mkdir(parents=True, exist_ok=True)
@@ -251,11 +260,10 @@ def sync_all(include_archive: bool = False) -> Dict[str, int]:
     results = {}
     
     # 扫描活跃项目
-    for json_file in TEAM_TASKS_DATA.glob("*.json"):
-        project_name = json_file.stem
-        count = sync_project_to_obsidian(project_name, include_archive)
+    for project in get_store(TEAM_TASKS_DATA).projects():
+        count = sync_project_to_obsidian(project.name, include_archive)
         if count > 0:
-            results[project_name] = count
+            results[project.name] = count
     
     # 扫描归档项目（如果需要）
     archive_dir = TEAM_TASKS_DATA / "archive"
@@ -279,7 +287,7 @@ def show_status():
     print("=" * 50)
     
     # 统计 Team-Tasks
-    active_projects = list(TEAM_TASKS_DATA.glob("*.json"))
+    active_projects = list(get_store(TEAM_TASKS_DATA).projects())
     archive_dir = TEAM_TASKS_DATA / "archive"
     archived_projects = list(archive_dir.glob("*.json")) if archive_dir.exists() else []
     
@@ -0,0 +1,409 @@
+#!/usr/bin/env python3
+"""Team Tasks — scenario checks for past locking and state bugs.
+
+Each check builds its own throwaway TASKS_DIR, drives task_manager.py
+through the CLI with a timeout (so a self-deadlock shows up as a failure,
+not a hang) and asserts on the resulting state.
+
+Usage:
+  python3 regression_check.py            # run every check
+  python3 regression_check.py -k skip    # only checks whose name contains "skip"
+  python3 regression_check.py --list
+"""
+
+import argparse
+import json
+import os
+import shutil
+import subprocess
+import sys
+import tempfile
+import time
+
+SCRIPT = os.path.join(os.path.dirname(os.path.abspath(__file__)), "task_manager.py")
+TIMEOUT = 30
+
+
+class CheckFailed(Exception):
+    pass
+
+
+class Env:
+    """A throwaway data dir plus helpers to run the CLI against it."""
+
+    def __init__(self):
+        self.root = tempfile.mkdtemp(prefix="team-tasks-check-")
+        config = os.path.join(self.root, "config.json")
+        with open(config, "w") as f:
+            json.dump({"hookWorker": {"autostart": False}}, f)
+        self.env = dict(os.environ, TEAM_TASKS_DIR=os.path.join(self.root, "data"), TEAM_TASKS_CONFIG=config)
+        self.env.pop("TEAM_TASKS_DURABILITY", None)
+
+    def run(self, *argv, expect: int = 0, timeout: float = TIMEOUT) -> str:
+        try:
+            proc = subprocess.run([sys.executable, SCRIPT] + list(argv), env=self.env,
+                                  capture_output=True, text=True, timeout=timeout)
+        except subprocess.TimeoutExpired:
+            raise CheckFailed(f"`{' '.join(argv)}` timed out after {timeout}s (deadlock?)")
+        if expect is not None and proc.returncode != expect:
+            raise CheckFailed(f"`{' '.join(argv)}` exited {proc.returncode}, expected {expect}\n"
+                              f"{proc.stdout}{proc.stderr}".rstrip())
+        return proc.stdout
+
+    def python(self, code: str, timeout: float = TIMEOUT) -> str:
+        """Run ``code`` in a fresh interpreter with task_manager importable."""
+        prelude = f"import sys; sys.path.insert(0, {os.path.dirname(SCRIPT)!r}); import task_manager as tm\n"
+        try:
+            proc = subprocess.run([sys.executable, "-c", prelude + code], env=self.env,
+                                  capture_output=True, text=True, timeout=timeout)
+        except subprocess.TimeoutExpired:
+            raise CheckFailed(f"library call timed out after {timeout}s (deadlock?)")
+        if proc.returncode:
+            raise CheckFailed(f"library call failed:\n{proc.stdout}{proc.stderr}".rstrip())
+        return proc.stdout
+
+    def project(self, name: str) -> dict:
+        return json.loads(self.run("status", name, "--json"))
+
+    def cleanup(self):
+        shutil.rmtree(self.root, ignore_errors=True)
+
+
+def expect_equal(actual, expected, what: str):
+    if actual != expected:
+        raise CheckFailed(f"{what}: got {actual!r}, expected {expected!r}")
+
+
+# ── Checks ──────────────────────────────────────────────────────────
+
+def check_skip_rest_with_memoize(env: Env):
+    """ready --target --skip-rest with a cache hit must not deadlock on the project lock."""
+    env.run("init", "p1", "-m", "dag", "--memoize")
+    env.run("add", "p1", "a")
+    env.run("add", "p1", "b", "-d", "a")
+    env.run("result", "p1", "a", "out")
+    env.run("update", "p1", "a", "done")
+    env.run("reset", "p1", "--all", "--no-cache")  # leaves a cache hit for ready to apply
+    env.run("ready", "p1", "--target", "b", "--skip-rest")
+    expect_equal(env.project("p1")["stages"]["a"]["status"], "done", "a after cache hit")
+    env.run("reset", "p1", "--all", "--no-cache")
+    env.run("claim", "p1", "--target", "b", "--skip-rest")
+
+
+def check_reentrant_project_lock(env: Env):
+    """Helpers that lock a project must be callable while the caller holds that lock."""
+    env.run("init", "p1", "-m", "dag", "--memoize")
+    env.run("add", "p1", "a")
+    env.run("result", "p1", "a", "out")
+    env.run("update", "p1", "a", "done")
+    env.run("reset", "p1", "--all", "--no-cache")
+    env.python(
+        "with tm.project_lock('p1'):\n"
+        "    with tm.project_lock('p1'):\n"
+        "        pass\n"
+        "    data = tm._ready_with_cache('p1', tm.load_project('p1'))\n"
+        "assert data['stages']['a']['status'] == 'done', data['stages']['a']\n"
+    )
+
+
+def check_upstream_failure_status(env: Env):
+    """A project whose cross-project dependency failed must not end up "completed"."""
+    env.run("init", "up", "-m", "dag")
+    env.run("add", "up", "q")
+    expected = {"block": "blocked", "skip-downstream": "failed", "continue-independent": "completed"}
+    for policy in expected:
+        name = f"down-{policy}"
+        env.run("init", name, "-m", "dag", "--on-failure", policy)
+        env.run("add", name, "w", "-d", "up:q")
+        env.run("add", name, "i")
+        env.run("update", name, "i", "done")
+    env.run("update", "up", "q", "failed")
+    for policy, status in expected.items():
+        expect_equal(env.project(f"down-{policy}")["status"], status, f"{policy} after upstream failure")
+    env.run("reset", "up", "q")
+    for policy in expected:
+        expect_equal(env.project(f"down-{policy}")["status"], "active", f"{policy} after upstream reset")
+
+
+def check_run_map_bad_output(env: Env):
+    """run: a map task with non-list output fails on its own; the run keeps going."""
+    env.run("init", "r2", "-m", "dag")
+    env.run("add", "r2", "m", "--map", "--command", "echo notjson")
+    env.run("add", "r2", "x", "--command", "sleep 2")
+    env.run("run", "r2", "-j", "2", expect=1)
+    stages = env.project("r2")["stages"]
+    expect_equal(stages["m"]["status"], "failed", "map task status")
+    expect_equal(stages["x"]["status"], "done", "sibling status")
+    if not any("JSON list" in entry.get("event", "") for entry in stages["m"]["logs"]):
+        raise CheckFailed("map task log does not record why it failed")
+
+
+def check_run_cleanup_on_error(env: Env):
+    """run: an unexpected error stops the children and releases their leases."""
+    env.run("init", "r3", "-m", "dag")
+    env.run("add", "r3", "a", "--command", "true")
+    env.run("add", "r3", "b", "--command", "sleep 30 && touch survived")
+    env.python(
+        "import os, sys\n"
+        "flush = tm._run_flush\n"
+        "def boom(project, task, *a, **kw):\n"
+        "    if task.tid == 'a' and a[1:2] == ('done',):\n"
+        "        raise RuntimeError('boom')\n"
+        "    return flush(project, task, *a, **kw)\n"
+        "tm._run_flush = boom\n"
+        "sys.argv = ['task_manager.py', 'run', 'r3', '-j', '2']\n"
+        "try:\n"
+        "    tm.main()\n"
+        "except RuntimeError:\n"
+        "    pass\n"
+        "else:\n"
+        "    raise AssertionError('run swallowed the error')\n"
+    )
+    stage = env.project("r3")["stages"]["b"]
+    expect_equal(stage["status"], "pending", "interrupted task status")
+    expect_equal(stage.get("lease"), None, "interrupted task lease")
+
+
+def check_activity_index(env: Env):
+    """Saves only rewrite the activity index when their rows change; stale is one range query."""
+    env.run("init", "a1", "-m", "dag")
+    env.run("add", "a1", "x")
+    env.run("log", "a1", "x", "working")
+    env.run("init", "b1", "-m", "dag")
+    env.run("add", "b1", "y")
+    env.run("update", "b1", "y", "in-progress")
+    env.run("init", "c1", "-m", "dag")  # no active stages: no rows
+    env.python(
+        "data = tm.load_project('a1')\n"
+        "assert tm.update_activity_index('a1', data) is False, 'unchanged rows were rewritten'\n"
+        "data['stages']['x']['status'] = 'done'\n"
+        "assert tm.update_activity_index('a1', data) is True\n"
+        "assert tm.update_activity_index('a1', tm.load_project('a1')) is True\n"
+        "projects = {p for (p,) in tm._activity_db().execute('SELECT DISTINCT project FROM activity')}\n"
+        "assert projects == {'a1', 'b1'}, projects\n"
+    )
+    rows = json.loads(env.run("stale", "--older-than", "0", "--json"))
+    expect_equal(sorted(r["project"] + "/" + r["stage"] for r in rows), ["a1/x", "b1/y"], "stale stages")
+    expect_equal([r["t"] for r in rows], sorted(r["t"] for r in rows), "stale order")
+    env.run("update", "b1", "y", "done")
+    rows = json.loads(env.run("stale", "--older-than", "0", "--json"))
+    expect_equal([r["stage"] for r in rows], ["x"], "stale stages after done")
+    os.remove(os.path.join(env.env["TEAM_TASKS_DIR"], ".team-tasks", "activity.db"))
+    rows = json.loads(env.run("stale", "--older-than", "0", "--json"))
+    expect_equal([r["stage"] for r in rows], ["x"], "stale stages after losing the index")
+
+
+def check_if_changed_since_lease_expiry(env: Env):
+    """--if-changed-since must report a change once a lease has expired."""
+    env.run("init", "l1", "-m", "dag")
+    env.run("add", "l1", "a")
+    env.run("claim", "l1", "--lease", "2s")
+    version = str(env.project("l1")["version"])
+    env.run("ready", "l1", "--if-changed-since", version, expect=3)
+    time.sleep(2.5)
+    out = env.run("ready", "l1", "--json", "--if-changed-since", version)
+    expect_equal([t["taskId"] for t in json.loads(out)], ["a"], "ready after lease expiry")
+
+
+def check_compact_dag_parity(env: Env):
+    """CompactDag (TaskStore projects) must agree with the dict path, including project:task refs."""
+    env.python(
+        "import copy, json, random\n"
+        "rng = random.Random(7)\n"
+        "statuses = ['pending', 'pending', 'in-progress', 'done', 'done', 'failed', 'skipped', 'cancelled']\n"
+        "for trial in range(300):\n"
+        "    n = rng.randint(0, 12)\n"
+        "    stages, ext = {}, {}\n"
+        "    for i in range(n):\n"
+        "        deps = [f't{j}' for j in range(i) if rng.random() < 0.3]\n"
+        "        if rng.random() < 0.3:\n"
+        "            ref = f'up:q{rng.randint(0, 2)}'\n"
+        "            deps.append(ref)\n"
+        "            if rng.random() < 0.8:\n"
+        "                ext[ref] = rng.choice(['pending', 'in-progress', 'done', 'failed', 'cancelled'])\n"
+        "        if rng.random() < 0.05:\n"
+        "            deps.append('missing')\n"
+        "        stages[f't{i}'] = tm.make_stage(f'a{i % 3}', '', deps)\n"
+        "        stages[f't{i}']['status'] = rng.choice(statuses)\n"
+        "    data = {'project': 'p', 'mode': 'dag', 'status': 'active', 'stages': stages,\n"
+        "            'failurePolicy': rng.choice(tm.FAILURE_POLICIES), 'externalDeps': ext}\n"
+        "    plain = copy.deepcopy(data)\n"
+        "    project = tm.Project('p', '/nonexistent', copy.deepcopy(data))\n"
+        "    fast = project.data\n"
+        "    assert tm.compact_for(fast) is project.compact() and tm.compact_for(plain) is None\n"
+        "    assert json.dumps(project.compact().to_project()) == json.dumps(fast), trial\n"
+        "    for step in range(4):\n"
+        "        assert tm.compute_ready_tasks(fast) == tm.compute_ready_tasks(plain), (trial, step)\n"
+        "        assert tm.upstream_failed(fast) == tm.upstream_failed(plain), (trial, step)\n"
+        "        tm.check_dag_completion(fast); tm.check_dag_completion(plain)\n"
+        "        assert fast['status'] == plain['status'], (trial, step)\n"
+        "        if not stages:\n"
+        "            break\n"
+        "        roll = rng.random()\n"
+        "        if roll < 0.4:\n"
+        "            root = rng.choice(list(stages) + ['up:q0', 'up:q1'])\n"
+        "            assert tm.cancel_downstream(fast, root) == tm.cancel_downstream(plain, root), (trial, step)\n"
+        "        elif roll < 0.7:\n"
+        "            updates = {f'up:q{rng.randint(0, 2)}': rng.choice(['done', 'failed', 'pending'])}\n"
+        "            tm._apply_xdep_statuses(fast, dict(updates)); tm._apply_xdep_statuses(plain, dict(updates))\n"
+        "        else:\n"
+        "            root = rng.choice(list(stages) + ['up:q0'])\n"
+        "            assert tm.restore_cancelled(fast, [root]) == tm.restore_cancelled(plain, [root]), (trial, step)\n"
+        "        assert {t: s['status'] for t, s in fast['stages'].items()} == \\\n"
+        "               {t: s['status'] for t, s in plain['stages'].items()}, (trial, step)\n"
+    )
+
+
+def check_migrate_layout_online(env: Env):
+    """migrate-layout while writers keep saving loses no update and leaves one copy per project."""
+    env.run("init", "ml", "-m", "dag")
+    env.run("add", "ml", "a")
+    env.run("add", "ml", "b")
+    writer = (
+        "tid = sys.argv[1]\n"
+        "for i in range(40):\n"
+        "    sys.argv = ['task_manager.py', 'log', 'ml', tid, f'{tid}-{i}']\n"
+        "    tm.main()\n"
+    )
+    prelude = f"import sys; sys.path.insert(0, {os.path.dirname(SCRIPT)!r}); import task_manager as tm\n"
+    procs = [subprocess.Popen([sys.executable, "-c", prelude + writer, tid], env=env.env,
+                              stdout=subprocess.DEVNULL, stderr=subprocess.PIPE, text=True)
+             for tid in ("a", "b")]
+    for layout in ("sharded", "flat") * 4:
+        env.run("migrate-layout", "--to", layout)
+    for proc in procs:
+        _, err = proc.communicate(timeout=TIMEOUT)
+        if proc.returncode:
+            raise CheckFailed(f"writer failed: {err.strip()[-300:]}")
+    stages = env.project("ml")["stages"]
+    for tid in ("a", "b"):
+        events = {entry.get("event") for entry in stages[tid]["logs"]}
+        missing = [i for i in range(40) if f"{tid}-{i}" not in events]
+        if missing:
+            raise CheckFailed(f"{tid}: lost log writes {missing}")
+    copies = [root for root, _, files in os.walk(env.env["TEAM_TASKS_DIR"])
+              if "ml.json" in files and ".team-tasks" not in root]
+    expect_equal(len(copies), 1, "project file copies")
+
+
+def check_group_commit_once_per_op(env: Env):
+    """After a grouped log commits, later main() calls in the same process must not wait again."""
+    with open(env.env["TEAM_TASKS_CONFIG"], "w") as f:
+        json.dump({"hookWorker": {"autostart": False}, "durability": {"mode": "grouped", "windowMs": 300}}, f)
+    env.run("init", "g1", "-m", "dag")
+    env.run("add", "g1", "a")
+    env.python(
+        "import contextlib, io, sys, time\n"
+        "def call(*argv):\n"
+        "    sys.argv = ['task_manager.py', *argv]\n"
+        "    t0 = time.perf_counter()\n"
+        "    with contextlib.redirect_stdout(io.StringIO()):\n"
+        "        tm.main()\n"
+        "    return time.perf_counter() - t0\n"
+        "call('log', 'g1', 'a', 'grouped op')\n"
+        "took = max(call('status', 'g1') for _ in range(3))\n"
+        "assert took < 0.25, f'status took {took:.3f}s after a grouped log'\n"
+        "assert not tm._pending_group_commits and not tm._hooks_enqueued\n"
+    )
+
+
+def check_compact_uses_cli_policy(env: Env):
+    """compact --keep N keeps N entries even with a tighter auto policy, and never reports negative bytes."""
+    env.run("init", "cp", "-m", "dag")
+    env.run("add", "cp", "a")
+    for i in range(5):
+        env.run("log", "cp", "a", f"entry {i}")
+    with open(env.env["TEAM_TASKS_CONFIG"], "w") as f:
+        json.dump({"hookWorker": {"autostart": False}, "retention": {"maxEntries": 1, "auto": True}}, f)
+    out = env.run("compact", "cp", "--keep", "3")
+    expect_equal(len(env.project("cp")["stages"]["a"]["logs"]), 3, "logs kept")
+    if ", -" in out:
+        raise CheckFailed(f"negative byte count reported:\n{out}")
+
+
+def check_run_pool_agent(env: Env):
+    """run --agent picks pool tasks with that agent as a member and assigns it, like claim."""
+    with open(env.env["TEAM_TASKS_CONFIG"], "w") as f:
+        json.dump({"hookWorker": {"autostart": False}, "pools": {"code": ["c1", "c2"]}}, f)
+    env.run("init", "rp", "-m", "dag")
+    env.run("add", "rp", "a", "--agent", "pool:code", "--command", "true")
+    env.run("add", "rp", "b", "--agent", "other", "--command", "true")
+    env.run("run", "rp", "--agent", "c2")
+    stages = env.project("rp")["stages"]
+    expect_equal(stages["a"]["status"], "done", "pool task status")
+    expect_equal(stages["a"].get("assignedAgent"), "c2", "pool task assignee")
+    expect_equal(stages["b"]["status"], "pending", "other agent's task status")
+
+
+def check_export_broken_pipe(env: Env):
+    """export into a reader that stops early exits quietly without closing stderr."""
+    env.run("init", "ex", "-m", "dag")
+    env.python(
+        "with tm.project_lock('ex'):\n"
+        "    data = tm.load_project('ex')\n"
+        "    for i in range(5000):\n"
+        "        data['stages'][f't{i}'] = {'agent': 'a', 'status': 'pending', 'task': 'x' * 40,\n"
+        "                                   'dependsOn': [], 'logs': [], 'output': ''}\n"
+        "    tm.save_project('ex', data)\n"
+    )
+    proc = subprocess.Popen([sys.executable, SCRIPT, "export"], env=env.env,
+                            stdout=subprocess.PIPE, stderr=subprocess.PIPE, text=True)
+    proc.stdout.readline()
+    proc.stdout.close()
+    try:
+        err = proc.stderr.read()
+        code = proc.wait(timeout=TIMEOUT)
+    except subprocess.TimeoutExpired:
+        proc.kill()
+        raise CheckFailed("export hung after its reader went away")
+    expect_equal(err, "", "stderr after broken pipe")
+    expect_equal(code, 1, "exit code after broken pipe")
+
+
+CHECKS = {
+    "skip-rest-with-memoize": check_skip_rest_with_memoize,
+    "reentrant-project-lock": check_reentrant_project_lock,
+    "upstream-failure-status": check_upstream_failure_status,
+    "run-map-bad-output": check_run_map_bad_output,
+    "run-cleanup-on-error": check_run_cleanup_on_error,
+    "activity-index": check_activity_index,
+    "if-changed-since-lease-expiry": check_if_changed_since_lease_expiry,
+    "compact-dag-parity": check_compact_dag_parity,
+    "migrate-layout-online": check_migrate_layout_online,
+    "group-commit-once-per-op": check_group_commit_once_per_op,
+    "compact-uses-cli-policy": check_compact_uses_cli_policy,
+    "run-pool-agent": check_run_pool_agent,
+    "export-broken-pipe": check_export_broken_pipe,
+}
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Scenario checks for team-tasks regressions")
+    parser.add_argument("-k", help="Only run checks whose name contains this string")
+    parser.add_argument("--list", action="store_true", help="List checks and exit")
+    args = parser.parse_args()
+
+    selected = {name: fn for name, fn in CHECKS.items() if not args.k or args.k in name}
+    if args.list:
+        for name, fn in selected.items():
+            print(f"  {name}: {fn.__doc__}")
+        return
+
+    failed = 0
+    for name, fn in selected.items():
+        env = Env()
+        try:
+            fn(env)
+            print(f"✅ {name}")
+        except CheckFailed as e:
+            failed += 1
+            print(f"❌ {name}: {e}")
+        finally:
+            env.cleanup()
+    print(f"\n{len(selected) - failed}/{len(selected)} checks passed")
+    if failed:
+        sys.exit(1)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,293 @@
+#!/usr/bin/env python3
+"""Team Tasks — concurrency stress harness.
+
+Spawns many concurrent writers against a throwaway TASKS_DIR and checks
+the final state for lost updates and corrupt JSON, reporting throughput.
+
+Each writer owns one DAG task and one debater:
+  update <task> in-progress
+  log / result --append   (--ops times, alternating, each with a unique marker)
+  update <task> done
+  round collect <debater>
+
+Afterwards every project file must parse, every task must be done with all
+of its log markers and output chunks present, and the debate round must hold
+every debater's response. Any miss is reported as a lost write.
+
+Modes:
+  inproc  Worker processes import task_manager once and run commands through
+          its main() — measures the storage/locking ceiling.
+  cli     One `python3 task_manager.py ...` subprocess per op — what agents
+          actually do, including interpreter startup.
+
+Usage:
+  python3 stress_test.py [-w 16] [-n 20] [--mode inproc|cli]
+                         [--durability strict|grouped|both] [--keep] [--json]
+"""
+
+import argparse
+import contextlib
+import io
+import json
+import multiprocessing
+import os
+import shutil
+import subprocess
+import sys
+import tempfile
+import time
+
+SCRIPT = os.path.join(os.path.dirname(os.path.abspath(__file__)), "task_manager.py")
+DAG_PROJECT = "stress-dag"
+DEBATE_PROJECT = "stress-debate"
+
+
+# ── Workload ────────────────────────────────────────────────────────
+
+def _task(w: int) -> str:
+    return f"t{w:03d}"
+
+
+def _debater(w: int) -> str:
+    return f"d{w:03d}"
+
+
+def _marker(w: int, i: int) -> str:
+    return f"w{w:03d}-op{i:04d}"
+
+
+def writer_ops(w: int, ops: int) -> list:
+    """Ordered (kind, argv) pairs for writer ``w``."""
+    task = _task(w)
+    out = [("update", ["update", DAG_PROJECT, task, "in-progress"])]
+    for i in range(ops):
+        if i % 2 == 0:
+            out.append(("log", ["log", DAG_PROJECT, task, _marker(w, i)]))
+        else:
+            out.append(("result", ["result", DAG_PROJECT, task, _marker(w, i) + "\n", "--append"]))
+    out.append(("update", ["update", DAG_PROJECT, task, "done"]))
+    out.append(("round collect", ["round", DEBATE_PROJECT, "collect", _debater(w), f"position of {_debater(w)}"]))
+    return out
+
+
+def _run_setup(argv: list, env: dict):
+    result = subprocess.run([sys.executable, SCRIPT] + argv, env=env, capture_output=True, text=True)
+    if result.returncode != 0:
+        print(f"❌ setup failed: {' '.join(argv)}\n{result.stderr}", file=sys.stderr)
+        sys.exit(1)
+
+
+def setup(env: dict, writers: int):
+    _run_setup(["init", DAG_PROJECT, "-m", "dag", "-g", "stress"], env)
+    for w in range(writers):
+        _run_setup(["add", DAG_PROJECT, _task(w), "-a", f"agent-{w % 4}"], env)
+    _run_setup(["init", DEBATE_PROJECT, "-m", "debate", "-g", "stress"], env)
+    for w in range(writers):
+        _run_setup(["add-debater", DEBATE_PROJECT, _debater(w)], env)
+    _run_setup(["round", DEBATE_PROJECT, "start"], env)
+
+
+# ── Writers ─────────────────────────────────────────────────────────
+
+def _inproc_writer(w: int, ops: int, env: dict, start, results):
+    os.environ.update(env)
+    sys.path.insert(0, os.path.dirname(SCRIPT))
+    import task_manager  # imported after TEAM_TASKS_DIR is set; it is read at import time
+
+    timings, errors = [], []
+    start.wait()
+    for kind, argv in writer_ops(w, ops):
+        sys.argv = [SCRIPT] + argv
+        t0 = time.perf_counter()
+        try:
+            with contextlib.redirect_stdout(io.StringIO()), contextlib.redirect_stderr(io.StringIO()) as err:
+                task_manager.main()
+            code = 0
+        except SystemExit as e:
+            code = e.code or 0
+        timings.append((kind, time.perf_counter() - t0))
+        if code:
+            errors.append(f"{' '.join(argv[:3])}: exit {code} {err.getvalue().strip()[:200]}")
+    results.put((w, timings, errors))
+
+
+def _cli_writer(w: int, ops: int, env: dict, start, results):
+    timings, errors = [], []
+    start.wait()
+    for kind, argv in writer_ops(w, ops):
+        t0 = time.perf_counter()
+        proc = subprocess.run([sys.executable, SCRIPT] + argv, env=env, capture_output=True, text=True)
+        timings.append((kind, time.perf_counter() - t0))
+        if proc.returncode:
+            errors.append(f"{' '.join(argv[:3])}: exit {proc.returncode} {proc.stderr.strip()[:200]}")
+    results.put((w, timings, errors))
+
+
+def run_writers(env: dict, writers: int, ops: int, mode: str):
+    # spawn, not fork: each worker must import task_manager fresh with its TEAM_TASKS_DIR.
+    ctx = multiprocessing.get_context("spawn")
+    start = ctx.Event()
+    results = ctx.Queue()
+    target = _inproc_writer if mode == "inproc" else _cli_writer
+    procs = [ctx.Process(target=target, args=(w, ops, env, start, results)) for w in range(writers)]
+    for p in procs:
+        p.start()
+    time.sleep(1.0)  # let workers start and import before the gun
+    t0 = time.perf_counter()
+    start.set()
+    collected = [results.get() for _ in procs]
+    elapsed = time.perf_counter() - t0
+    for p in procs:
+        p.join()
+    return collected, elapsed
+
+
+# ── Verification ────────────────────────────────────────────────────
+
+def verify(env: dict, writers: int, ops: int) -> dict:
+    """Check the final state; returns {"corrupt": [...], "lost": [...]}."""
+    tasks_dir = env["TEAM_TASKS_DIR"]
+    corrupt, lost = [], []
+    for root, dirs, files in os.walk(tasks_dir):
+        dirs[:] = [d for d in dirs if d != ".team-tasks"]
+        for name in files:
+            if name.endswith(".json"):
+                try:
+                    with open(os.path.join(root, name), encoding="utf-8") as f:
+                        json.load(f)
+                except ValueError as e:
+                    corrupt.append(f"{name}: {e}")
+
+    # Read through the library so pending group-commit journals are replayed.
+    sys.path.insert(0, os.path.dirname(SCRIPT))
+    import task_manager
+    store = task_manager.TaskStore(tasks_dir)
+
+    dag = store.get(DAG_PROJECT)
+    if dag is None:
+        corrupt.append(f"{DAG_PROJECT}: unreadable")
+    else:
+        for w in range(writers):
+            tid = _task(w)
+            stage = dag.stage(tid)
+            if stage.get("status") != "done":
+                lost.append(f"{tid}: status {stage.get('status')!r}, expected 'done'")
+            events = {task_manager.Project.log_event(e) for e in stage.get("logs", [])}
+            output = dag.read_output(tid)
+            for i in range(ops):
+                marker = _marker(w, i)
+                if i % 2 == 0 and marker not in events:
+                    lost.append(f"{tid}: log {marker} missing")
+                elif i % 2 == 1 and marker + "\n" not in output:
+                    lost.append(f"{tid}: output chunk {marker} missing")
+
+    debate = store.get(DEBATE_PROJECT)
+    if debate is None:
+        corrupt.append(f"{DEBATE_PROJECT}: unreadable")
+    else:
+        responses = (debate.data.get("rounds") or [{}])[0].get("responses", {})
+        for w in range(writers):
+            if _debater(w) not in responses:
+                lost.append(f"{DEBATE_PROJECT}: response from {_debater(w)} missing")
+    return {"corrupt": corrupt, "lost": lost}
+
+
+# ── Report ──────────────────────────────────────────────────────────
+
+def _percentile(values: list, pct: float) -> float:
+    if not values:
+        return 0.0
+    values = sorted(values)
+    return values[min(len(values) - 1, int(round(pct / 100 * (len(values) - 1))))]
+
+
+def run_once(args, durability: str) -> dict:
+    tmp = tempfile.mkdtemp(prefix="team-tasks-stress-")
+    config = os.path.join(tmp, "config.json")
+    with open(config, "w") as f:
+        json.dump({"durability": {"mode": durability}, "hookWorker": {"autostart": False}}, f)
+    env = dict(os.environ, TEAM_TASKS_DIR=os.path.join(tmp, "data"), TEAM_TASKS_CONFIG=config)
+    env.pop("TEAM_TASKS_DURABILITY", None)
+    try:
+        setup(env, args.writers)
+        collected, elapsed = run_writers(env, args.writers, args.ops, args.mode)
+        checks = verify(env, args.writers, args.ops)
+    finally:
+        if args.keep:
+            print(f"📁 Kept {tmp}", file=sys.stderr)
+        else:
+            shutil.rmtree(tmp, ignore_errors=True)
+
+    by_kind, errors = {}, []
+    for _, timings, errs in collected:
+        errors.extend(errs)
+        for kind, seconds in timings:
+            by_kind.setdefault(kind, []).append(seconds)
+    total = sum(len(v) for v in by_kind.values())
+    return {
+        "durability": durability,
+        "mode": args.mode,
+        "writers": args.writers,
+        "ops": total,
+        "elapsedSec": round(elapsed, 3),
+        "opsPerSec": round(total / elapsed, 1) if elapsed else 0,
+        "latencyMs": {
+            kind: {
+                "count": len(v),
+                "p50": round(_percentile(v, 50) * 1000, 1),
+                "p95": round(_percentile(v, 95) * 1000, 1),
+                "max": round(max(v) * 1000, 1),
+            }
+            for kind, v in sorted(by_kind.items())
+        },
+        "errors": errors,
+        "corrupt": checks["corrupt"],
+        "lost": checks["lost"],
+    }
+
+
+def print_report(report: dict):
+    ok = not (report["errors"] or report["corrupt"] or report["lost"])
+    print(f"{'✅' if ok else '❌'} {report['durability']} / {report['mode']}: "
+          f"{report['ops']} ops from {report['writers']} writers in {report['elapsedSec']:.2f}s "
+          f"→ {report['opsPerSec']:.1f} ops/sec")
+    for kind, lat in report["latencyMs"].items():
+        print(f"    {kind:<14} n={lat['count']:<5} p50={lat['p50']:.1f}ms p95={lat['p95']:.1f}ms max={lat['max']:.1f}ms")
+    for label in ("errors", "corrupt", "lost"):
+        items = report[label]
+        if items:
+            print(f"  ⚠️  {len(items)} {label}:")
+            for item in items[:10]:
+                print(f"    - {item}")
+            if len(items) > 10:
+                print(f"    … {len(items) - 10} more")
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Concurrency stress test for team-tasks writes")
+    parser.add_argument("--writers", "-w", type=int, default=16, help="Concurrent writer processes (default: 16)")
+    parser.add_argument("--ops", "-n", type=int, default=20, help="log/result ops per writer (default: 20)")
+    parser.add_argument("--mode", choices=["inproc", "cli"], default="inproc",
+                        help="inproc: call main() in worker processes; cli: one subprocess per op")
+    parser.add_argument("--durability", choices=["strict", "grouped", "both"], default="both",
+                        help="Durability mode(s) to test (default: both)")
+    parser.add_argument("--keep", action="store_true", help="Keep the temp TASKS_DIR for inspection")
+    parser.add_argument("--json", "-j", action="store_true", help="Output JSON")
+    args = parser.parse_args()
+    if args.writers < 1 or args.ops < 0:
+        print("Error: --writers must be >= 1 and --ops >= 0", file=sys.stderr)
+        sys.exit(1)
+
+    modes = ["strict", "grouped"] if args.durability == "both" else [args.durability]
+    reports = [run_once(args, mode) for mode in modes]
+    if args.json:
+        print(json.dumps(reports, indent=2, ensure_ascii=False))
+    else:
+        for report in reports:
+            print_report(report)
+    if any(r["errors"] or r["corrupt"] or r["lost"] for r in reports):
+        sys.exit(1)
+
+
+if __name__ == "__main__":
+    main()
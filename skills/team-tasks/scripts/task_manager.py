@@ -10,36 +10,186 @@ Commands:
   init      Create a new project (--mode linear|dag|debate)
   add       Add a task to a DAG project
   add-debater Add a debater to a debate project
-  round     Debate round actions (start/collect/cross-review/synthesize)
-  status    Show current pipeline/DAG status
+  round     Debate round actions (start/collect/cross-review/synthesize [--cluster])
+  status    Show current pipeline/DAG status (--if-changed-since for pollers)
   assign    Set task description for a stage/task
   update    Update stage/task status (pending/in-progress/done/failed)
   next      Get next actionable stage (linear mode)
   ready     Get all tasks whose dependencies are met (dag mode)
   log       Append a log entry to a stage/task
-  result    Set the output/result of a stage/task
+  result    Set the output/result of a stage/task (--append / --stdin to stream)
+  output    Read a stage/task output (byte range or tail)
   reset     Reset a stage/task (or all) back to pending
   history   Show full log history for a stage/task
   graph     Show DAG dependency graph (dag mode)
-  list      List all projects
+  list      List all projects (sub-projects nested under their parent)
+  parent    Set or clear a project's parent (rollup progress into it)
+  claim     Atomically claim ready task(s) under a lease (renew/release)
+  stats     Per-agent wait/run latency, failure rate and throughput
+  burndown  Per-project status counts over time (ring buffer, downsampled)
+  commit-stats  Durability mode and ops-per-commit metrics
+  hooks     Transition hooks: list, queue status, run worker, retry failed
+  cache     Show or clear the result memoization cache
+  compact   Archive old logs/debate responses into a compressed side file
+  export    Stream stage/log rows across projects as NDJSON or CSV
+  simulate  Discrete-event makespan/utilisation forecast for a project
+  run       Execute ready tasks with a shell command, -j N at a time
+  stale     List pending/in-progress stages idle longer than a threshold
+  xdeps     Show (or rebuild) the cross-project dependency index
+  migrate-layout  Switch TASKS_DIR between flat and hash-sharded layouts
 """
 
 import argparse
+import csv
+import fnmatch
+import gzip
+import hashlib
+import heapq
 import json
+import math
 import os
+import random
+import re
+import selectors
+import signal
+import socket
+import sqlite3
+import struct
+import subprocess
 import sys
-from datetime import datetime, timezone
+import threading
+import time
+import weakref
+from array import array
+from collections import deque
+from contextlib import contextmanager
+from datetime import datetime, timedelta, timezone
+
+try:
+    import fcntl
+except ImportError:  # non-POSIX platforms: locking degrades to a no-op
+    fcntl = None
 
 DEFAULT_PIPELINE = ["code-agent", "test-agent", "docs-agent", "monitor-bot"]
 TASKS_DIR = os.environ.get("TEAM_TASKS_DIR", "/Users/shengchun.sun/.openclaw/workspace/data/team-tasks")
+STATE_DIR_NAME = ".team-tasks"
 
 
 def now_iso():
     return datetime.now(timezone.utc).isoformat()
 
 
+# ── Storage layout ──────────────────────────────────────────────────
+#
+# Projects live either flat (<TASKS_DIR>/<project>.json, the default) or
+# sharded by hash prefix (<TASKS_DIR>/<ab>/<project>.json). The active layout
+# is recorded in <TASKS_DIR>/.team-tasks/layout.json. Reads fall back to the
+# other location so a migration can run while agents keep working; writes
+# always go to the active layout and drop the stale copy.
+
+SHARD_WIDTH = 2
+_SHARD_RE = re.compile(r"^[0-9a-f]{%d}$" % SHARD_WIDTH)
+_layout_cache = {}
+
+
+def storage_layout(base_dir=None) -> str:
+    """Return 'flat' or 'sharded' for a tasks directory.
+
+    Revalidated by the marker's mtime/inode on every call, so long-running
+    importers follow a migrate-layout run by another process.
+    """
+    base = os.fspath(base_dir or TASKS_DIR)
+    path = os.path.join(base, STATE_DIR_NAME, "layout.json")
+    try:
+        st = os.stat(path)
+        key = (st.st_mtime_ns, st.st_ino)
+    except OSError:
+        key = None
+    cached = _layout_cache.get(base)
+    if cached and cached[0] == key:
+        return cached[1]
+    layout = "flat"
+    if key is not None:
+        try:
+            with open(path) as f:
+                layout = json.load(f).get("layout", "flat")
+        except (OSError, ValueError):
+            pass
+    _layout_cache[base] = (key, layout)
+    return layout
+
+
+def shard_for(project: str) -> str:
+    return hashlib.sha1(project.encode("utf-8")).hexdigest()[:SHARD_WIDTH]
+
+
+def project_path(project: str, base_dir=None, for_write: bool = False) -> str:
+    """Resolve a project's JSON path under the active layout.
+
+    For reads, falls back to the other layout's location if the file has not
+    been migrated yet. ``for_write`` always returns the active-layout path.
+    """
+    base = os.fspath(base_dir or TASKS_DIR)
+    flat = os.path.join(base, f"{project}.json")
+    sharded = os.path.join(base, shard_for(project), f"{project}.json")
+    preferred, legacy = (sharded, flat) if storage_layout(base) == "sharded" else (flat, sharded)
+    if for_write or os.path.exists(preferred) or not os.path.exists(legacy):
+        return preferred
+    return legacy
+
+
+def iter_project_files(base_dir=None):
+    """Yield (project, path) for every project file, in either layout.
+
+    Uses os.scandir so sharded directories are listed one shard at a time.
+    When a project exists in both locations (mid-migration) only the
+    active-layout copy is yielded.
+    """
+    base = os.fspath(base_dir or TASKS_DIR)
+    if not os.path.isdir(base):
+        return
+
+    def flat_files():
+        with os.scandir(base) as it:
+            for entry in it:
+                if entry.name.endswith(".json") and entry.is_file():
+                    yield entry.name[:-5], entry.path
+
+    def sharded_files():
+        with os.scandir(base) as it:
+            shards = sorted(e.path for e in it if _SHARD_RE.match(e.name) and e.is_dir())
+        for shard in shards:
+            with os.scandir(shard) as it:
+                for entry in it:
+                    if entry.name.endswith(".json") and entry.is_file():
+                        yield entry.name[:-5], entry.path
+
+    if storage_layout(base) == "sharded":
+        sources = (sharded_files, flat_files)
+    else:
+        sources = (flat_files, sharded_files)
+    seen = set()
+    for source in sources:
+        for project, path in source():
+            if project in seen:
+                continue
+            seen.add(project)
+            yield project, path
+
+
+def _inactive_layout_path(project: str, active_path: str, base_dir=None) -> str:
+    """The project's path under the other layout than ``active_path``.
+
+    Derived from the path just written rather than from a second layout read,
+    so a concurrent migrate-layout flip cannot make a save delete its own file.
+    """
+    base = os.fspath(base_dir or TASKS_DIR)
+    flat = os.path.join(base, f"{project}.json")
+    return os.path.join(base, shard_for(project), f"{project}.json") if active_path == flat else flat
+
+
 def task_file(project: str) -> str:
-    return os.path.join(TASKS_DIR, f"{project}.json")
+    return project_path(project)
 
 
 def load_project(project: str) -> dict:
@@ -48,14 +198,1286 @@ def load_project(project: str) -> dict:
         print(f"Error: project '{project}' not found at {path}", file=sys.stderr)
         sys.exit(1)
     with open(path) as f:
-        return json.load(f)
+        data = json.load(f)
+    apply_journal(data, read_journal(project))
+    _loaded_statuses[project] = _stage_statuses(data)
+    _loaded_rollups[project] = (data.get("parent"), rollup_summary(data))
+    return data
+
+
+def save_project(project: str, data: dict, auto_compact: bool = True):
+    """Atomically replace the project file (temp file + fsync + rename).
+
+    ``data`` must have been loaded with load_project under the project lock,
+    so it already includes any journaled ops; the journal is cleared here.
+    Pass ``auto_compact=False`` when the caller already applied its own
+    retention policy (``compact``), so the configured one isn't layered on top.
+    """
+    if auto_compact:
+        _auto_compact(project, data)
+    path = project_path(project, for_write=True)
+    previous = data.get("version")
+    if previous is None:  # legacy file or init --force: continue the on-disk sequence
+        previous = project_version(project) or 0
+    data["version"] = previous + 1
+    expiry = earliest_lease_expiry(data)
+    if expiry is None:
+        data.pop("leaseExpiry", None)
+    else:
+        data["leaseExpiry"] = expiry
+    # "version" (and "leaseExpiry") go first so conditional reads only need the file header.
+    header = {"version": data["version"]} if expiry is None else {"version": data["version"], "leaseExpiry": expiry}
+    write_json_atomic(path, {**header, **data}, indent=2, fsync=True)
+    stale = _inactive_layout_path(project, path)
+    if os.path.exists(stale):
+        os.remove(stale)
+    try:
+        os.remove(journal_path(project))
+    except FileNotFoundError:
+        pass
+    update_activity_index(project, data)
+    queue_xdep_updates(project, data, _loaded_statuses.get(project) or {})
+    record_burndown(project, data, _loaded_statuses.get(project))
+    enqueue_transition_hooks(project, data)
+    propagate_rollup(project, data)
+
+
+# ── Project versions ────────────────────────────────────────────────
+#
+# Every save bumps data["version"], written as the first key of the file.
+# Pollers pass the last version they saw as --if-changed-since to status /
+# next / ready; if the header still shows it (and no group-commit journal is
+# pending) the command exits with NOT_MODIFIED_EXIT without parsing the project.
+# Lease expiry changes what those commands report without a save, so the
+# earliest live lease expiry (epoch seconds) follows as "leaseExpiry"; once it
+# has passed the project counts as changed.
+
+NOT_MODIFIED_EXIT = 3
+_VERSION_RE = re.compile(rb'^\{\s*"version":\s*(\d+)(?:,\s*"leaseExpiry":\s*(\d+))?')
+
+
+def earliest_lease_expiry(data: dict):
+    """Epoch second at which the first live lease expires; None if nothing is leased."""
+    times = []
+    for stage in data.get("stages", {}).values():
+        lease = stage.get("lease")
+        if lease and stage.get("status") == "in-progress":
+            expires = parse_iso(lease.get("expiresAt"))
+            if expires is not None:
+                times.append(expires)
+    return int(min(times).timestamp()) if times else None
+
+
+def project_header(project: str, base_dir=None) -> tuple:
+    """(version, leaseExpiry) from the project file header; version is None if unknown
+    (missing, legacy, or journal pending)."""
+    if os.path.exists(journal_path(project, base_dir)):
+        return None, None
+    try:
+        with open(project_path(project, base_dir), "rb") as f:
+            match = _VERSION_RE.match(f.read(96))
+    except OSError:
+        return None, None
+    if not match:
+        return None, None
+    return int(match.group(1)), (int(match.group(2)) if match.group(2) else None)
 
 
-def save_project(project: str, data: dict):
-    path = task_file(project)
+def project_version(project: str, base_dir=None):
+    """Version from the project file header; None if unknown (missing, legacy, or journal pending)."""
+    return project_header(project, base_dir)[0]
+
+
+def exit_if_unchanged(args):
+    """Handle --if-changed-since: exit NOT_MODIFIED_EXIT, or report the version being rendered on stderr."""
+    since = getattr(args, "if_changed_since", None)
+    if since is None:
+        return
+    version, lease_expiry = project_header(args.project)
+    if version is not None and version == since and (lease_expiry is None or lease_expiry > time.time()):
+        sys.exit(NOT_MODIFIED_EXIT)
+    print(f"🔖 Version: {version if version is not None else 'unknown'}", file=sys.stderr)
+
+
+def state_path(*parts: str) -> str:
+    """Path inside TASKS_DIR's hidden state directory (caches, indexes, config)."""
+    path = os.path.join(TASKS_DIR, STATE_DIR_NAME, *parts)
+    os.makedirs(os.path.dirname(path), exist_ok=True)
+    return path
+
+
+_config_cache = {}
+
+
+def config_path() -> str:
+    return os.environ.get("TEAM_TASKS_CONFIG") or os.path.join(TASKS_DIR, STATE_DIR_NAME, "config.json")
+
+
+def load_config() -> dict:
+    """Global tool config (pools, policies, hooks). Missing file means defaults."""
+    path = config_path()
+    try:
+        mtime = os.stat(path).st_mtime_ns
+    except OSError:
+        return {}
+    cached = _config_cache.get(path)
+    if cached and cached[0] == mtime:
+        return cached[1]
+    try:
+        with open(path) as f:
+            config = json.load(f)
+    except ValueError as e:
+        print(f"Error: invalid config {path}: {e}", file=sys.stderr)
+        sys.exit(1)
+    _config_cache[path] = (mtime, config)
+    return config
+
+
+def write_json_atomic(path: str, data, indent: int = None, fsync: bool = False):
+    """Write JSON via temp file + rename so readers never see a partial file.
+
+    With ``fsync`` the data is flushed to disk before the rename, so a crash
+    leaves either the old or the new file, never a torn one.
+    """
+    os.makedirs(os.path.dirname(path), exist_ok=True)
+    tmp = f"{path}.tmp.{os.getpid()}"
+    with open(tmp, "w") as f:
+        if indent is None:
+            json.dump(data, f, ensure_ascii=False, separators=(",", ":"))
+        else:
+            json.dump(data, f, indent=indent, ensure_ascii=False)
+        if fsync:
+            f.flush()
+            os.fsync(f.fileno())
+    os.replace(tmp, path)
+
+
+def parse_iso(value):
+    """Parse an ISO-8601 timestamp (tolerates trailing 'Z'); None on failure."""
+    if not value:
+        return None
+    try:
+        dt = datetime.fromisoformat(value.replace("Z", "+00:00"))
+    except (TypeError, ValueError):
+        return None
+    return dt if dt.tzinfo else dt.replace(tzinfo=timezone.utc)
+
+
+_held_locks = {}
+
+
+@contextmanager
+def project_lock(project: str, base_dir=None):
+    """Exclusive advisory lock serialising read-modify-write cycles on a project.
+
+    Uses flock on <TASKS_DIR>/.team-tasks/locks/<project>.lock. On platforms
+    without fcntl this degrades to no locking.
+
+    Re-entrant per thread: flock is per open file description, so a
+    nested acquire through a second fd (e.g. a helper called while main()
+    holds the lock for the command) would block on ourselves forever.
+    """
+    if fcntl is None:
+        yield
+        return
+    path = os.path.join(os.fspath(base_dir or TASKS_DIR), STATE_DIR_NAME, "locks", f"{project}.lock")
+    key = (path, threading.get_ident())  # other threads must still wait on flock
+    if key in _held_locks:
+        _held_locks[key] += 1
+        try:
+            yield
+        finally:
+            _held_locks[key] -= 1
+        return
+    os.makedirs(os.path.dirname(path), exist_ok=True)
+    with open(path, "a") as fh:
+        fcntl.flock(fh, fcntl.LOCK_EX)
+        _held_locks[key] = 1
+        try:
+            yield
+        finally:
+            del _held_locks[key]
+            fcntl.flock(fh, fcntl.LOCK_UN)
+
+
+_DURATION_RE = re.compile(r"^\s*(\d+(?:\.\d+)?)\s*([smhd]?)\s*$")
+_DURATION_UNITS = {"": 1, "s": 1, "m": 60, "h": 3600, "d": 86400}
+
+
+def parse_duration(text: str) -> float:
+    """Parse '90', '30s', '10m', '2h' or '1d' into seconds; exits on bad input."""
+    match = _DURATION_RE.match(text or "")
+    if not match:
+        print(f"Error: invalid duration '{text}' (use e.g. 30s, 10m, 2h)", file=sys.stderr)
+        sys.exit(1)
+    return float(match.group(1)) * _DURATION_UNITS[match.group(2)]
+
+
+# ── Group commit ────────────────────────────────────────────────────
+#
+# Durability modes (config "durability": {"mode": ..., "windowMs": ...} or
+# TEAM_TASKS_DURABILITY):
+#   strict  — every command rewrites the project file (fsync + rename).
+#   grouped — high-frequency ops (log, result --append) append one line to
+#             .team-tasks/journal/<project>.jsonl and return. One process then
+#             becomes commit leader, waits windowMs for more ops to arrive and
+#             folds them all into a single atomic project write.
+# Readers replay any pending journal ops on load, so grouped mode never shows
+# stale data; the next full save of the project also clears the journal.
+
+_pending_group_commits = set()
+
+
+def durability_settings():
+    """Return (mode, window_seconds)."""
+    cfg = load_config().get("durability", {})
+    mode = os.environ.get("TEAM_TASKS_DURABILITY") or cfg.get("mode", "strict")
+    if mode not in ("strict", "grouped"):
+        print(f"Error: durability mode must be 'strict' or 'grouped', got '{mode}'", file=sys.stderr)
+        sys.exit(1)
+    return mode, cfg.get("windowMs", 50) / 1000.0
+
+
+def journal_path(project: str, base_dir=None) -> str:
+    return os.path.join(os.fspath(base_dir or TASKS_DIR), STATE_DIR_NAME, "journal", f"{project}.jsonl")
+
+
+def read_journal(project: str, base_dir=None) -> list:
+    try:
+        with open(journal_path(project, base_dir), encoding="utf-8") as f:
+            lines = f.read().splitlines()
+    except FileNotFoundError:
+        return []
+    ops = []
+    for line in lines:
+        try:
+            ops.append(json.loads(line))
+        except ValueError:
+            continue  # torn trailing line from a crashed writer
+    return ops
+
+
+def apply_journal(data: dict, ops: list, base_dir=None):
+    """Replay journaled ops onto a freshly loaded project dict."""
+    stages = data.get("stages", {})
+    for op in ops:
+        stage = stages.get(op.get("stage"))
+        if stage is None:
+            continue
+        if op["op"] == "log":
+            stage.setdefault("logs", []).append(op["entry"])
+        elif op["op"] == "output":
+            stage["outputRef"] = op["ref"]
+            _refresh_output_meta(stage, base_dir)
+        data["updated"] = op.get("time", data.get("updated"))
+
+
+def journal_append(project: str, op: dict):
+    """Record an op for group commit. Caller holds the project lock."""
+    path = journal_path(project)
     os.makedirs(os.path.dirname(path), exist_ok=True)
-    with open(path, "w") as f:
-        json.dump(data, f, indent=2, ensure_ascii=False)
+    with open(path, "a", encoding="utf-8") as f:
+        f.write(json.dumps(op, ensure_ascii=False) + "\n")
+    _pending_group_commits.add(project)
+
+
+def group_commit(project: str):
+    """Fold pending journal ops into one project write, unless another process leads."""
+    _, window = durability_settings()
+    if fcntl is None:
+        with project_lock(project):
+            if read_journal(project):
+                save_project(project, load_project(project))
+        return
+
+    while True:
+        with open(state_path("locks", f"{project}.commit"), "a") as fh:
+            try:
+                fcntl.flock(fh, fcntl.LOCK_EX | fcntl.LOCK_NB)
+            except BlockingIOError:
+                return  # the current leader will pick our op up
+            try:
+                time.sleep(window)
+                with project_lock(project):
+                    ops = read_journal(project)
+                    if ops:
+                        save_project(project, load_project(project))
+                        _record_commit_metrics(project, len(ops))
+            finally:
+                fcntl.flock(fh, fcntl.LOCK_UN)
+        # Ops appended while we held the leader lock but after our commit
+        # would otherwise wait for the next write; loop to take them too.
+        if not os.path.exists(journal_path(project)):
+            return
+
+
+def _record_commit_metrics(project: str, ops: int):
+    path = state_path("commit-metrics.json")
+    with project_lock(".commit-metrics"):
+        try:
+            with open(path) as f:
+                metrics = json.load(f)
+        except (OSError, ValueError):
+            metrics = {"commits": 0, "ops": 0, "maxOps": 0, "histogram": {}, "projects": {}}
+        bucket = "1" if ops == 1 else "2-4" if ops <= 4 else "5-16" if ops <= 16 else "17+"
+        for m in (metrics, metrics["projects"].setdefault(project, {"commits": 0, "ops": 0, "maxOps": 0})):
+            m["commits"] += 1
+            m["ops"] += ops
+            m["maxOps"] = max(m["maxOps"], ops)
+        metrics["histogram"][bucket] = metrics["histogram"].get(bucket, 0) + 1
+        metrics["lastCommit"] = {"project": project, "ops": ops, "time": now_iso()}
+        write_json_atomic(path, metrics)
+
+
+def cmd_commit_stats(args):
+    """Show group-commit metrics (ops coalesced per write)."""
+    mode, window = durability_settings()
+    print(f"💾 Durability: {mode}" + (f" (window {window * 1000:.0f}ms)" if mode == "grouped" else ""))
+    try:
+        with open(os.path.join(TASKS_DIR, STATE_DIR_NAME, "commit-metrics.json")) as f:
+            metrics = json.load(f)
+    except (OSError, ValueError):
+        print("  No group commits recorded yet.")
+        return
+    if args.json:
+        print(json.dumps(metrics, indent=2, ensure_ascii=False))
+        return
+    avg = metrics["ops"] / metrics["commits"] if metrics["commits"] else 0
+    print(f"  Commits: {metrics['commits']}  Ops: {metrics['ops']}  Avg ops/commit: {avg:.1f}  Max: {metrics['maxOps']}")
+    for bucket in ("1", "2-4", "5-16", "17+"):
+        print(f"    {bucket:>5} ops: {metrics['histogram'].get(bucket, 0)}")
+    for name, m in sorted(metrics["projects"].items()):
+        print(f"  {name}: {m['commits']} commits, {m['ops']} ops, max {m['maxOps']}")
+
+
+# ── Transition hooks ────────────────────────────────────────────────
+#
+# Hooks are declared under "hooks" in the global config or in a project file:
+#   {"name": "sync-obsidian", "command": "python3 obsidian_sync.py",
+#    "match": {"project": "*", "stage": "*", "agent": "*", "from": "*", "to": "done"},
+#    "timeout": 60, "retries": 3}
+# Match fields are globs; missing ones match anything. Status changes are
+# detected in save_project by diffing against what load_project saw, so every
+# path (update, claim, run, reset, cancellation, cache hits) fires hooks.
+# Each matching (event, hook) pair is written as one fsynced job file under
+# .team-tasks/hooks/queue/; a detached worker drains the queue with a thread
+# pool, so the CLI call never waits on a hook. Failed jobs are retried with
+# exponential backoff, then parked in hooks/failed/ ("hooks retry" requeues).
+# The hook gets TT_PROJECT/TT_STAGE/TT_AGENT/TT_FROM/TT_TO in its environment
+# and the event JSON on stdin.
+
+_loaded_statuses = {}
+_hooks_enqueued = False
+HOOK_DEFAULT_TIMEOUT = 60
+HOOK_DEFAULT_RETRIES = 3
+
+
+def _stage_statuses(data: dict) -> dict:
+    return {sid: st.get("status") for sid, st in data.get("stages", {}).items()}
+
+
+def _hooks_dir(*parts: str) -> str:
+    return os.path.join(TASKS_DIR, STATE_DIR_NAME, "hooks", *parts)
+
+
+def configured_hooks(data: dict = None) -> list:
+    return list(load_config().get("hooks", [])) + list((data or {}).get("hooks", []))
+
+
+def _hook_matches(hook: dict, event: dict) -> bool:
+    match = hook.get("match", {})
+    for field in ("project", "stage", "agent", "from", "to"):
+        pattern = match.get(field)
+        if pattern is not None and not fnmatch.fnmatchcase(str(event.get(field) or ""), pattern):
+            return False
+    return True
+
+
+def enqueue_transition_hooks(project: str, data: dict):
+    """Queue a job for every hook matching a status change in ``data``. Called by save_project."""
+    global _hooks_enqueued
+    before = _loaded_statuses.get(project)
+    after = _stage_statuses(data)
+    _loaded_statuses[project] = after
+    hooks = configured_hooks(data)
+    if before is None or not hooks:
+        return
+    now = now_iso()
+    for sid, status in after.items():
+        old = before.get(sid)
+        if old is None or old == status:
+            continue
+        stage = data["stages"][sid]
+        event = {
+            "project": project,
+            "stage": sid,
+            "agent": stage.get("assignedAgent") or stage.get("agent", sid),
+            "from": old,
+            "to": status,
+            "time": now,
+        }
+        for index, hook in enumerate(hooks):
+            if not hook.get("command") or not _hook_matches(hook, event):
+                continue
+            job_id = f"{time.time_ns()}-{os.getpid()}-{sid}-{index}"
+            job = {
+                "id": job_id,
+                "hook": hook.get("name") or f"hook-{index}",
+                "command": hook["command"],
+                "timeout": hook.get("timeout", HOOK_DEFAULT_TIMEOUT),
+                "retries": hook.get("retries", HOOK_DEFAULT_RETRIES),
+                "attempts": 0,
+                "notBefore": 0,
+                "event": event,
+            }
+            write_json_atomic(os.path.join(_hooks_dir("queue"), f"{_safe_job_name(job_id)}.json"), job, fsync=True)
+            _hooks_enqueued = True
+
+
+def _safe_job_name(job_id: str) -> str:
+    return re.sub(r"[^A-Za-z0-9_.-]", "_", job_id)
+
+
+def spawn_hook_worker():
+    """Start a detached worker unless one is already draining the queue."""
+    settings = load_config().get("hookWorker", {})
+    if not settings.get("autostart", True) or fcntl is None:
+        return
+    with open(state_path("hooks", "worker.lock"), "a") as fh:
+        try:
+            fcntl.flock(fh, fcntl.LOCK_EX | fcntl.LOCK_NB)
+        except BlockingIOError:
+            return  # a worker is running and will see the new jobs
+        fcntl.flock(fh, fcntl.LOCK_UN)
+    env = dict(os.environ, TEAM_TASKS_DIR=os.fspath(TASKS_DIR))
+    subprocess.Popen([sys.executable, os.path.abspath(__file__), "hooks", "work"],
+                     stdin=subprocess.DEVNULL, stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL,
+                     start_new_session=True, env=env)
+
+
+def _run_hook_job(path: str) -> str:
+    """Run one claimed job; returns "done", "retry" or "failed"."""
+    with open(path) as f:
+        job = json.load(f)
+    event = job["event"]
+    env = dict(os.environ, TEAM_TASKS_DIR=os.fspath(TASKS_DIR), TT_PROJECT=event["project"],
+               TT_STAGE=event["stage"], TT_AGENT=str(event["agent"]), TT_FROM=event["from"], TT_TO=event["to"])
+    job["attempts"] += 1
+    try:
+        proc = subprocess.run(job["command"], shell=True, env=env, input=json.dumps(event).encode("utf-8"),
+                              stdout=subprocess.DEVNULL, stderr=subprocess.PIPE, timeout=job["timeout"])
+        error = None if proc.returncode == 0 else f"exit {proc.returncode}: {proc.stderr.decode('utf-8', 'replace')[-500:]}"
+    except subprocess.TimeoutExpired:
+        error = f"timed out after {job['timeout']}s"
+    name = os.path.basename(path)
+    if error is None:
+        os.remove(path)
+        return "done"
+    job["lastError"] = error
+    job["lastAttempt"] = now_iso()
+    if job["attempts"] <= job["retries"]:
+        job["notBefore"] = time.time() + min(2 ** job["attempts"], 300)
+        write_json_atomic(os.path.join(_hooks_dir("queue"), name), job, fsync=True)
+        os.remove(path)
+        return "retry"
+    write_json_atomic(os.path.join(_hooks_dir("failed"), name), job, fsync=True)
+    os.remove(path)
+    return "failed"
+
+
+def _due_jobs() -> tuple:
+    """(due job names, seconds until the next deferred job or None)."""
+    queue_dir = _hooks_dir("queue")
+    try:
+        names = sorted(n for n in os.listdir(queue_dir) if n.endswith(".json"))
+    except FileNotFoundError:
+        return [], None
+    due, wait = [], None
+    now = time.time()
+    for name in names:
+        try:
+            with open(os.path.join(queue_dir, name)) as f:
+                not_before = json.load(f).get("notBefore", 0)
+        except (OSError, ValueError):
+            continue
+        if not_before <= now:
+            due.append(name)
+        else:
+            wait = min(wait, not_before - now) if wait is not None else not_before - now
+    return due, wait
+
+
+def drain_hook_queue(concurrency: int, once: bool = False) -> dict:
+    """Worker loop: claim jobs (rename into running/) and run them on a thread pool."""
+    from concurrent.futures import ThreadPoolExecutor
+
+    counts = {"done": 0, "retry": 0, "failed": 0}
+    running_dir = _hooks_dir("running")
+    os.makedirs(running_dir, exist_ok=True)
+    # We hold the worker lock, so anything left in running/ is from a crashed worker.
+    for name in os.listdir(running_dir):
+        os.replace(os.path.join(running_dir, name), os.path.join(_hooks_dir("queue"), name))
+
+    with ThreadPoolExecutor(max_workers=max(concurrency, 1)) as pool:
+        while True:
+            due, wait = _due_jobs()
+            claimed = []
+            for name in due:
+                dest = os.path.join(running_dir, name)
+                try:
+                    os.replace(os.path.join(_hooks_dir("queue"), name), dest)
+                except FileNotFoundError:
+                    continue
+                claimed.append(dest)
+            for outcome in pool.map(_run_hook_job, claimed):
+                counts[outcome] += 1
+            if claimed:
+                continue
+            if wait is None or once:
+                return counts
+            time.sleep(min(wait, 5.0))
+
+
+def cmd_hooks(args):
+    """Inspect hooks, drain the queue in the foreground, or requeue failed jobs."""
+    if args.action == "list":
+        hooks = configured_hooks(load_project(args.project) if args.project else None)
+        if not hooks:
+            print(f"No hooks configured (add \"hooks\" to {config_path()} or a project file).")
+            return
+        for hook in hooks:
+            match = ", ".join(f"{k}={v}" for k, v in hook.get("match", {}).items()) or "any transition"
+            print(f"  🪝 {hook.get('name', '(unnamed)')}: [{match}] → {hook.get('command')}")
+        return
+
+    if args.action == "work":
+        if fcntl is None:
+            counts = drain_hook_queue(args.concurrency or load_config().get("hookWorker", {}).get("concurrency", 4))
+        else:
+            counts = {"done": 0, "retry": 0, "failed": 0}
+            while True:
+                with open(state_path("hooks", "worker.lock"), "a") as fh:
+                    try:
+                        fcntl.flock(fh, fcntl.LOCK_EX | fcntl.LOCK_NB)
+                    except BlockingIOError:
+                        break  # another worker owns the queue
+                    try:
+                        concurrency = args.concurrency or load_config().get("hookWorker", {}).get("concurrency", 4)
+                        for key, n in drain_hook_queue(concurrency, once=args.once).items():
+                            counts[key] += n
+                    finally:
+                        fcntl.flock(fh, fcntl.LOCK_UN)
+                # Jobs enqueued after our last scan but before we released the
+                # lock would otherwise wait for the next enqueue; go round again.
+                if args.once or not _due_jobs()[0]:
+                    break
+        print(f"🪝 Hooks: {counts['done']} done, {counts['retry']} to retry, {counts['failed']} failed")
+        return
+
+    if args.action == "retry":
+        moved = 0
+        failed_dir = _hooks_dir("failed")
+        for name in sorted(os.listdir(failed_dir)) if os.path.isdir(failed_dir) else []:
+            path = os.path.join(failed_dir, name)
+            with open(path) as f:
+                job = json.load(f)
+            job["attempts"] = 0
+            job["notBefore"] = 0
+            write_json_atomic(os.path.join(_hooks_dir("queue"), name), job, fsync=True)
+            os.remove(path)
+            moved += 1
+        print(f"🔁 Requeued {moved} failed hook job{'s' if moved != 1 else ''}")
+        if moved:
+            spawn_hook_worker()
+        return
+
+    # status
+    def listing(sub):
+        path = _hooks_dir(sub)
+        return sorted(n for n in os.listdir(path) if n.endswith(".json")) if os.path.isdir(path) else []
+
+    queued, running, failed = listing("queue"), listing("running"), listing("failed")
+    print(f"🪝 Hook queue: {len(queued)} queued, {len(running)} running, {len(failed)} failed")
+    for name in failed[-args.limit:]:
+        with open(os.path.join(_hooks_dir("failed"), name)) as f:
+            job = json.load(f)
+        ev = job["event"]
+        print(f"  ❌ {job['hook']} {ev['project']}/{ev['stage']} {ev['from']}→{ev['to']}"
+              f" after {job['attempts']} attempts: {job.get('lastError', '')[:120]}")
+
+
+# ── Activity index ──────────────────────────────────────────────────
+#
+# .team-tasks/activity.db (SQLite, WAL mode) holds one row per pending/
+# in-progress stage that has any recorded activity:
+#   activity(project, stage, t <epoch>, time iso, agent, status), indexed on t
+# save_project replaces the saved project's rows in one short transaction, and
+# skips the write when they are unchanged. WAL lets the coordinator's cron
+# tick and "stale" read while writers commit, so finding stuck work is a
+# single range query on t instead of opening every project. A full rebuild
+# records "complete" in the meta table; while that is missing (first run, or
+# the database was lost) the next read rebuilds from a full scan.
+
+ACTIVE_STATUSES = ("pending", "in-progress")
+
+
+def stage_last_activity(stage: dict):
+    """Most recent activity time for a stage dict: last log entry, else startedAt/completedAt."""
+    logs = stage.get("logs") or []
+    if logs:
+        dt = parse_iso(Project.log_time(logs[-1]))
+        if dt:
+            return dt
+    return parse_iso(stage.get("startedAt") or stage.get("completedAt"))
+
+
+def activity_db_path(base_dir=None) -> str:
+    return os.path.join(os.fspath(base_dir or TASKS_DIR), STATE_DIR_NAME, "activity.db")
+
+
+_activity_dbs = {}
+
+
+def _activity_db(base_dir=None):
+    """Per-process connection to the activity index (created on first use)."""
+    path = activity_db_path(base_dir)
+    key = (path, os.getpid())  # never share a connection across fork
+    conn = _activity_dbs.get(key)
+    if conn is None:
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        conn = sqlite3.connect(path, timeout=30, isolation_level=None, check_same_thread=False)
+        conn.execute("PRAGMA journal_mode=WAL")
+        conn.execute("PRAGMA synchronous=NORMAL")  # rebuildable index: no fsync per commit
+        conn.execute("CREATE TABLE IF NOT EXISTS activity (project TEXT NOT NULL, stage TEXT NOT NULL,"
+                     " t REAL NOT NULL, time TEXT, agent TEXT, status TEXT, PRIMARY KEY (project, stage))")
+        conn.execute("CREATE INDEX IF NOT EXISTS activity_t ON activity (t)")
+        conn.execute("CREATE TABLE IF NOT EXISTS meta (key TEXT PRIMARY KEY, value TEXT)")
+        _activity_dbs[key] = conn
+    return conn
+
+
+def _activity_entries(project: str, data: dict) -> list:
+    entries = []
+    for sid, stage in data.get("stages", {}).items():
+        if stage.get("status", "pending") not in ACTIVE_STATUSES:
+            continue
+        last = stage_last_activity(stage)
+        if last is None:
+            continue
+        entries.append({
+            "t": last.timestamp(),
+            "time": last.isoformat(),
+            "project": project,
+            "stage": sid,
+            "agent": stage.get("assignedAgent") or stage.get("agent") or sid,
+            "status": stage.get("status", "pending"),
+        })
+    entries.sort(key=lambda e: e["t"])
+    return entries
+
+
+_ACTIVITY_COLUMNS = ("t", "time", "project", "stage", "agent", "status")
+
+
+def _activity_rows(entries: list) -> list:
+    return [tuple(e[c] for c in _ACTIVITY_COLUMNS) for e in entries]
+
+
+def _replace_activity_rows(conn, project: str, rows: list) -> bool:
+    """Swap ``project``'s rows for ``rows`` unless identical; returns whether it wrote."""
+    conn.execute("BEGIN IMMEDIATE")
+    try:
+        current = conn.execute("SELECT t, time, project, stage, agent, status FROM activity"
+                               " WHERE project = ? ORDER BY t, stage", (project,)).fetchall()
+        if current == sorted(rows, key=lambda r: (r[0], r[3])):
+            conn.execute("ROLLBACK")
+            return False
+        conn.execute("DELETE FROM activity WHERE project = ?", (project,))
+        conn.executemany("INSERT INTO activity (t, time, project, stage, agent, status)"
+                         " VALUES (?, ?, ?, ?, ?, ?)", rows)
+        conn.execute("COMMIT")
+    except BaseException:
+        conn.execute("ROLLBACK")
+        raise
+    return True
+
+
+def rebuild_activity_index(base_dir=None) -> list:
+    """Rescan every project and rewrite the index; returns all entries, oldest first."""
+    conn = _activity_db(base_dir)
+    seen = []
+    for name, path in iter_project_files(base_dir):
+        # Under the project's lock, so a concurrent save cannot be overwritten
+        # with the older state read here.
+        with project_lock(name, base_dir):
+            project = get_store(base_dir).load(path, name)
+            if project is None:
+                continue
+            _replace_activity_rows(conn, name, _activity_rows(_activity_entries(name, project.data)))
+        seen.append(name)
+    conn.execute("BEGIN IMMEDIATE")
+    conn.execute(f"DELETE FROM activity WHERE project NOT IN ({','.join('?' * len(seen))})", seen)
+    conn.execute("INSERT OR REPLACE INTO meta (key, value) VALUES ('complete', ?)", (now_iso(),))
+    conn.execute("COMMIT")
+    _drop_legacy_activity_files(base_dir)
+    return _query_stale(conn, None)
+
+
+def _drop_legacy_activity_files(base_dir=None):
+    """Remove the JSON index files older versions kept next to the database."""
+    state = os.path.join(os.fspath(base_dir or TASKS_DIR), STATE_DIR_NAME)
+    legacy = os.path.join(state, "activity-index.json")
+    if os.path.exists(legacy):
+        os.remove(legacy)
+    shards = os.path.join(state, "activity")
+    if os.path.isdir(shards):
+        for entry in os.scandir(shards):
+            os.remove(entry.path)
+        os.rmdir(shards)
+
+
+def update_activity_index(project: str, data: dict) -> bool:
+    """Replace ``project``'s rows in the index if they changed. Called by save_project."""
+    return _replace_activity_rows(_activity_db(), project, _activity_rows(_activity_entries(project, data)))
+
+
+def _query_stale(conn, cutoff) -> list:
+    sql = "SELECT t, time, project, stage, agent, status FROM activity"
+    params = ()
+    if cutoff is not None:
+        sql += " WHERE t <= ?"
+        params = (cutoff,)
+    rows = conn.execute(sql + " ORDER BY t, project, stage", params).fetchall()
+    return [dict(zip(_ACTIVITY_COLUMNS, row)) for row in rows]
+
+
+def stale_stages(older_than: float, base_dir=None, now: float = None) -> list:
+    """Active stages whose last activity is at least ``older_than`` seconds ago, oldest first."""
+    conn = _activity_db(base_dir)
+    if conn.execute("SELECT 1 FROM meta WHERE key = 'complete'").fetchone() is None:
+        rebuild_activity_index(base_dir)
+    cutoff = (now if now is not None else time.time()) - older_than
+    return _query_stale(conn, cutoff)
+
+
+def cmd_stale(args):
+    """List pending/in-progress stages with no activity for --older-than."""
+    if args.rebuild:
+        rebuild_activity_index()
+    rows = stale_stages(parse_duration(args.older_than))
+    if args.agent:
+        agents = set(args.agent.split(","))
+        rows = [r for r in rows if r["agent"] in agents]
+    if args.json:
+        print(json.dumps(rows, indent=2, ensure_ascii=False))
+        return
+    if not rows:
+        print(f"✅ No stages idle for {args.older_than} or longer.")
+        return
+    now = time.time()
+    print(f"⏰ {len(rows)} stage(s) idle for {args.older_than} or longer:")
+    for r in rows:
+        print(f"  {r['project']}/{r['stage']} ({r['agent']}, {r['status']}): "
+              f"idle {_fmt_duration(now - r['t'])} since {r['time']}")
+
+
+# ── Sub-projects ────────────────────────────────────────────────────
+#
+# A project may name a "parent" project. Each parent caches a summary of
+# every child under data["children"]:
+#   {"<child>": {"status": ..., "counts": {status: n}, "children": {...}}}
+# where counts cover the child's own stages plus its whole subtree. When a
+# save changes a project's summary (status counts, project status, or its own
+# children) save_project rewrites just that entry in the parent, under the
+# parent's lock, and the parent's save carries the change further up. Plain
+# log/result writes leave the summary alone and never touch the parent.
+# Locks are only ever taken child → parent, and cycles are refused, so
+# propagation cannot deadlock.
+
+_loaded_rollups = {}
+
+
+def rollup_summary(data: dict) -> dict:
+    """Subtree summary of a project as its parent caches it."""
+    counts = {}
+    for stage in data.get("stages", {}).values():
+        status = stage.get("status", "pending")
+        counts[status] = counts.get(status, 0) + 1
+    children = data.get("children") or {}
+    for child in children.values():
+        for status, n in child.get("counts", {}).items():
+            counts[status] = counts.get(status, 0) + n
+    summary = {"status": data.get("status", "unknown"), "counts": counts}
+    if children:
+        summary["children"] = children
+    return summary
+
+
+def rollup_progress(counts: dict) -> tuple:
+    """(done, total) for a counts dict; skipped counts as done, like the progress bar."""
+    return counts.get("done", 0) + counts.get("skipped", 0), sum(counts.values())
+
+
+def _set_child_summary(parent: str, child: str, summary):
+    if not os.path.exists(task_file(parent)):
+        print(f"Warning: parent project '{parent}' of '{child}' not found; rollup not updated", file=sys.stderr)
+        return
+    with project_lock(parent):
+        pdata = load_project(parent)
+        children = pdata.setdefault("children", {})
+        if summary is None:
+            children.pop(child, None)
+        else:
+            children[child] = summary
+        if not children:
+            del pdata["children"]
+        save_project(parent, pdata)
+
+
+def propagate_rollup(project: str, data: dict):
+    """Push ``project``'s summary to its parent if it changed. Called by save_project."""
+    old_parent, old_summary = _loaded_rollups.get(project, (None, None))
+    parent = data.get("parent")
+    summary = rollup_summary(data)
+    _loaded_rollups[project] = (parent, summary)
+    if old_parent and old_parent != parent:
+        _set_child_summary(old_parent, project, None)
+    if parent and (parent != old_parent or summary != old_summary):
+        _set_child_summary(parent, project, summary)
+
+
+def check_parent(project: str, parent: str):
+    """Exit with an error if ``parent`` is missing or would make the hierarchy cyclic."""
+    seen = [project]
+    current = parent
+    while current:
+        if current in seen:
+            print(f"Error: parent '{parent}' would create a cycle: {' → '.join(seen + [current])}", file=sys.stderr)
+            sys.exit(1)
+        path = task_file(current)
+        if not os.path.exists(path):
+            print(f"Error: parent project '{current}' not found", file=sys.stderr)
+            sys.exit(1)
+        seen.append(current)
+        with open(path) as f:
+            current = json.load(f).get("parent")
+
+
+def print_subproject_tree(children: dict, indent: str = "  "):
+    items = sorted(children.items())
+    for i, (name, summary) in enumerate(items):
+        last = i == len(items) - 1
+        done, total = rollup_progress(summary.get("counts", {}))
+        print(f"{indent}{'└─' if last else '├─'} {name} [{summary.get('status', '?')}] ({done}/{total})")
+        print_subproject_tree(summary.get("children") or {}, indent + ("   " if last else "│  "))
+
+
+def cmd_parent(args):
+    """Set or clear a project's parent; rollups are moved by save_project."""
+    data = load_project(args.project)
+    if args.clear:
+        if not data.pop("parent", None):
+            print(f"ℹ️  {args.project} has no parent")
+            return
+        print(f"✅ {args.project} is now a top-level project")
+    else:
+        if not args.parent:
+            print("Error: give a parent project or --clear", file=sys.stderr)
+            sys.exit(1)
+        check_parent(args.project, args.parent)
+        data["parent"] = args.parent
+        print(f"✅ {args.project} → parent {args.parent}")
+    save_project(args.project, data)
+
+
+# ── Cross-project dependencies ──────────────────────────────────────
+#
+# A DAG task may list "<project>:<task>" in dependsOn (names that are local
+# task ids always win). The dependent project caches the upstream status in
+# data["externalDeps"]["<project>:<task>"], so readiness never loads another
+# project. .team-tasks/xdeps-index.json maps each upstream "<project>:<task>"
+# to the "<project>:<task>" entries that wait on it. When save_project sees an
+# indexed task change status it queues the new status for every dependent
+# project; main() delivers the queue after the command's own lock is released
+# (one dependent lock at a time, so projects that depend on each other in both
+# directions cannot deadlock). Delivery may cascade further. A missing index
+# is rebuilt from a full scan; "xdeps --rebuild" also re-syncs every cached
+# status.
+
+_pending_xdep_updates = {}
+
+
+def split_ref(data: dict, dep: str):
+    """(project, task) for a cross-project reference, None for a local task id."""
+    if dep in data.get("stages", {}) or ":" not in dep:
+        return None
+    project, task = dep.split(":", 1)
+    return project, task
+
+
+def dep_satisfied(data: dict, dep: str) -> bool:
+    if split_ref(data, dep):
+        return data.get("externalDeps", {}).get(dep) in ("done", "skipped")
+    return data["stages"].get(dep, {}).get("status") in ("done", "skipped")
+
+
+def upstream_failed(data: dict) -> bool:
+    """True if an unfinished task depends on a failed or cancelled cross-project task."""
+    dag = compact_for(data)
+    if dag is not None:
+        return dag.upstream_failed()
+    ext = data.get("externalDeps") or {}
+    for stage in data["stages"].values():
+        if stage["status"] in ("done", "skipped"):
+            continue
+        if any(ext.get(dep) in ("failed", "cancelled") for dep in stage.get("dependsOn") or []
+               if split_ref(data, dep)):
+            return True
+    return False
+
+
+def dep_stage(data: dict, dep: str) -> dict:
+    """The stage a dependency names, loading the other project for cross-project refs."""
+    ref = split_ref(data, dep)
+    if ref is None:
+        return data["stages"].get(dep, {})
+    upstream = get_store().get(ref[0])
+    return upstream.stage(ref[1]) if upstream else {}
+
+
+def xdeps_index_path() -> str:
+    return state_path("xdeps-index.json")
+
+
+def _scan_xdeps() -> dict:
+    index = {}
+    for project in get_store().projects():
+        for tid, stage in project.stages.items():
+            for dep in stage.get("dependsOn") or []:
+                if split_ref(project.data, dep):
+                    index.setdefault(dep, []).append(f"{project.name}:{tid}")
+    return index
+
+
+def read_xdeps_index(rebuild: bool = False) -> dict:
+    path = xdeps_index_path()
+    if not rebuild:
+        try:
+            with open(path, encoding="utf-8") as f:
+                return json.load(f)
+        except (OSError, ValueError):
+            pass
+    with project_lock(".xdeps-index"):
+        index = _scan_xdeps()
+        write_json_atomic(path, index)
+    return index
+
+
+def register_xdeps(project: str, task_id: str, refs: list):
+    """Record ``project:task_id`` as waiting on each of ``refs``."""
+    read_xdeps_index()  # make sure an index exists before the incremental edit
+    with project_lock(".xdeps-index"):
+        with open(xdeps_index_path(), encoding="utf-8") as f:
+            index = json.load(f)
+        for ref in refs:
+            waiting = index.setdefault(ref, [])
+            if f"{project}:{task_id}" not in waiting:
+                waiting.append(f"{project}:{task_id}")
+        write_json_atomic(xdeps_index_path(), index)
+
+
+def find_xdep_cycle(project: str, data: dict, task_id: str, deps: list) -> list:
+    """Path back to ``project:task_id`` through ``deps`` across projects, or []."""
+    target = (project, task_id)
+
+    def deps_of(node):
+        name, tid = node
+        pdata = data if name == project else getattr(get_store().get(name), "data", None)
+        if not pdata:
+            return []
+        out = []
+        for dep in pdata.get("stages", {}).get(tid, {}).get("dependsOn") or []:
+            ref = split_ref(pdata, dep)
+            out.append(ref if ref else (name, dep))
+        return out
+
+    start = [split_ref(data, d) or (project, d) for d in deps]
+    stack = [(node, [node]) for node in start]
+    seen = set()
+    while stack:
+        node, path = stack.pop()
+        if node == target:
+            return [target] + path
+        if node in seen:
+            continue
+        seen.add(node)
+        stack.extend((nxt, path + [nxt]) for nxt in deps_of(node))
+    return []
+
+
+def queue_xdep_updates(project: str, data: dict, before: dict):
+    """Queue status changes of indexed tasks for their dependents. Called by save_project."""
+    changed = {sid: st.get("status") for sid, st in data.get("stages", {}).items()
+               if st.get("status") != before.get(sid)}
+    if not changed:
+        return
+    index = read_xdeps_index()
+    for sid, status in changed.items():
+        ref = f"{project}:{sid}"
+        for waiting in index.get(ref, []):
+            dependent = waiting.split(":", 1)[0]
+            _pending_xdep_updates.setdefault(dependent, {})[ref] = status
+
+
+def _apply_xdep_statuses(data: dict, updates: dict) -> bool:
+    ext = data.setdefault("externalDeps", {})
+    changed = False
+    for ref, status in updates.items():
+        old = ext.get(ref)
+        if old == status:
+            continue
+        ext[ref] = status
+        changed = True
+        dag = compact_for(data)
+        if dag is not None:
+            dag.set_external(ref, status)
+        if status not in TERMINAL_STATUSES and old not in TERMINAL_STATUSES:
+            continue  # upstream still in flight; nothing changes for our tasks
+        for tid, stage in data["stages"].items():
+            if ref in (stage.get("dependsOn") or []) and stage.get("status") == "pending":
+                stage["logs"].append({"time": now_iso(), "event": f"upstream {ref}: {old or 'unknown'} → {status}"})
+        if status in ("failed", "cancelled") and failure_policy(data) != "block":
+            cancel_downstream(data, ref)
+        elif old in ("failed", "cancelled"):
+            restore_cancelled(data, [ref])
+    if changed:
+        check_dag_completion(data)
+        data["updated"] = now_iso()
+    return changed
+
+
+def flush_xdep_updates() -> list:
+    """Deliver queued upstream statuses to dependent projects; returns projects touched."""
+    touched = []
+    while _pending_xdep_updates:
+        project = min(_pending_xdep_updates)
+        updates = _pending_xdep_updates.pop(project)
+        if not os.path.exists(task_file(project)):
+            continue
+        with project_lock(project):
+            data = load_project(project)
+            if _apply_xdep_statuses(data, updates):
+                save_project(project, data)
+                touched.append(project)
+    return touched
+
+
+def cmd_xdeps(args):
+    """Show the cross-project dependency index; --rebuild rescans and re-syncs cached statuses."""
+    index = read_xdeps_index(rebuild=args.rebuild)
+    if args.rebuild:
+        for ref, waiting in index.items():
+            upstream_project, upstream_task = ref.split(":", 1)
+            upstream = get_store().get(upstream_project)
+            status = upstream.stage(upstream_task).get("status", "missing") if upstream else "missing"
+            for entry in waiting:
+                _pending_xdep_updates.setdefault(entry.split(":", 1)[0], {})[ref] = status
+        touched = flush_xdep_updates()
+        print(f"🔁 Rebuilt index: {len(index)} upstream task(s); re-synced {len(touched)} project(s)")
+    if args.json:
+        print(json.dumps(index, indent=2, ensure_ascii=False))
+        return
+    if not index:
+        print("No cross-project dependencies.")
+        return
+    for ref, waiting in sorted(index.items()):
+        if args.project and not any(w.startswith(f"{args.project}:") for w in [ref] + waiting):
+            continue
+        print(f"  {ref} → {', '.join(waiting)}")
+
+
+# ── Library API ─────────────────────────────────────────────────────
+#
+# Other tools (task-coordinator, obsidian_sync, mission-control sync) import
+# this module and read projects through TaskStore instead of parsing JSON
+# themselves. Loads are cached per process and revalidated by mtime/size, so
+# tools running together share one parse per project.
+
+class Project:
+    """Read-only view of a project file with accessors that paper over schema drift."""
+
+    __slots__ = ("name", "path", "data", "base_dir", "_compact", "__weakref__")
+
+    def __init__(self, name: str, path: str, data: dict, base_dir=None):
+        self.name = name
+        self.path = path
+        self.data = data
+        self.base_dir = os.fspath(base_dir or TASKS_DIR)
+        self._compact = None
+        _store_projects[id(data)] = self
+
+    def __repr__(self):
+        return f"Project({self.name!r}, mode={self.mode!r}, status={self.status!r})"
+
+    @property
+    def title(self) -> str:
+        """Display name: ``project`` (current schema), ``name`` (legacy) or the file stem."""
+        return self.data.get("project") or self.data.get("name") or self.name
+
+    @property
+    def mode(self) -> str:
+        return get_mode(self.data)
+
+    @property
+    def status(self) -> str:
+        return self.data.get("status", "unknown")
+
+    @property
+    def version(self) -> int:
+        """Save counter bumped by every write (0 for files never saved since versioning)."""
+        return self.data.get("version", 0)
+
+    @property
+    def goal(self) -> str:
+        return self.data.get("goal", "")
+
+    @property
+    def workspace(self) -> str:
+        return self.data.get("workspace", "")
+
+    @property
+    def created(self) -> str:
+        return self.data.get("created") or self.data.get("created_at") or ""
+
+    @property
+    def updated(self) -> str:
+        return self.data.get("updated") or self.data.get("updated_at") or ""
+
+    @property
+    def stages(self) -> dict:
+        return self.data.get("stages", {})
+
+    def iter_stages(self):
+        """Yield (stage_id, stage) in file order."""
+        return iter(self.stages.items())
+
+    def stage(self, stage_id: str) -> dict:
+        return self.stages.get(stage_id, {})
+
+    def agent_of(self, stage_id: str) -> str:
+        """Agent doing the work: the pool member assigned at dispatch, else the declared agent."""
+        stage = self.stage(stage_id)
+        return stage.get("assignedAgent") or stage.get("agent") or stage_id
+
+    def status_counts(self) -> dict:
+        counts = {}
+        for stage in self.stages.values():
+            status = stage.get("status", "pending")
+            counts[status] = counts.get(status, 0) + 1
+        return counts
+
+    def done_count(self) -> int:
+        return sum(1 for t in self.stages.values() if t.get("status") in ("done", "skipped"))
+
+    def last_activity(self, stage_id: str):
+        """Most recent activity time for a stage: last log entry, else startedAt/completedAt."""
+        return stage_last_activity(self.stage(stage_id))
+
+    def read_output(self, stage_id: str, offset: int = 0, length: int = None, tail: int = None) -> str:
+        """Stage output (or a byte range / tail of it), reading streamed sidecars lazily."""
+        return read_stage_output(self.stage(stage_id), self.base_dir, offset, length, tail)
+
+    def compact(self) -> "CompactDag":
+        """Array-backed stage model for this project, built once per loaded version."""
+        if self._compact is None:
+            self._compact = CompactDag.from_project(self.data)
+        return self._compact
+
+    def ready_tasks(self) -> list:
+        """Dispatchable DAG task ids (empty for linear/debate projects)."""
+        return compute_ready_tasks(self.data) if is_dag(self.data) else []
+
+    @staticmethod
+    def log_time(entry: dict) -> str:
+        """Log timestamp: ``time`` (current schema) or ``timestamp`` (legacy)."""
+        return entry.get("time") or entry.get("timestamp") or ""
+
+    @staticmethod
+    def log_event(entry: dict) -> str:
+        """Log message: ``event`` (current schema) or ``action`` (legacy)."""
+        return entry.get("event") or entry.get("action") or ""
+
+
+class TaskStore:
+    """Cached, mtime-validated access to every project under a tasks directory."""
+
+    def __init__(self, base_dir=None):
+        self.base_dir = os.fspath(base_dir or TASKS_DIR)
+        self._cache = {}
+
+    def load(self, path, name: str = None):
+        """Load a project file, reusing the cached parse if mtime/size are unchanged.
+
+        Pending group-commit journal ops are replayed, so readers see every
+        acknowledged write.
+
+        Returns None if the file is missing or is not valid JSON.
+        """
+        path = os.fspath(path)
+        try:
+            st = os.stat(path)
+        except OSError:
+            self._cache.pop(path, None)
+            return None
+        name = name or os.path.basename(path)[:-5]
+        jpath = journal_path(name, self.base_dir)
+        try:
+            jst = os.stat(jpath)
+            journal_key = (jst.st_mtime_ns, jst.st_size)
+        except OSError:
+            journal_key = None
+        key = (st.st_mtime_ns, st.st_size, journal_key)
+        cached = self._cache.get(path)
+        if cached and cached[0] == key:
+            return cached[1]
+        try:
+            with open(path, encoding="utf-8") as f:
+                data = json.load(f)
+        except (OSError, ValueError):
+            return None
+        if journal_key:
+            apply_journal(data, read_journal(name, self.base_dir), self.base_dir)
+        project = Project(name, path, data, self.base_dir)
+        self._cache[path] = (key, project)
+        return project
+
+    def get(self, project: str):
+        """Project by name, or None if it does not exist."""
+        return self.load(project_path(project, self.base_dir), project)
+
+    def projects(self):
+        """Iterate every readable project (flat or sharded layout)."""
+        for name, path in iter_project_files(self.base_dir):
+            project = self.load(path, name)
+            if project is not None:
+                yield project
+
+    def invalidate(self, path=None):
+        if path is None:
+            self._cache.clear()
+        else:
+            self._cache.pop(os.fspath(path), None)
+
+
+_stores = {}
+
+
+def get_store(base_dir=None) -> TaskStore:
+    """Process-wide shared TaskStore for a tasks directory."""
+    base = os.fspath(base_dir or TASKS_DIR)
+    if base not in _stores:
+        _stores[base] = TaskStore(base)
+    return _stores[base]
 
 
 def make_stage(agent_id: str, task: str = "", depends_on: list = None) -> dict:
@@ -103,30 +1525,87 @@ def ensure_debate_mode(data: dict, command: str):
         sys.exit(1)
 
 
+# ── Linear pipeline groups ──────────────────────────────────────────
+#
+# A linear pipeline entry is either a stage id or a list of stage ids that run
+# side by side, e.g. ["code-agent", ["docs-agent", "test-agent"], "monitor-bot"]
+# (CLI: --pipeline code-agent,docs-agent+test-agent,monitor-bot). currentStage
+# still names a single stage; when it is inside a group, every unfinished
+# member of that group is active, and the pipeline moves on only once all of
+# them are done.
+
+def parse_pipeline(text: str) -> list:
+    entries = []
+    for item in text.split(","):
+        members = [m.strip() for m in item.split("+") if m.strip()]
+        if members:
+            entries.append(members[0] if len(members) == 1 else members)
+    return entries
+
+
+def pipeline_entries(data: dict) -> list:
+    """Pipeline as a list of groups (single stages become one-member groups)."""
+    return [[e] if isinstance(e, str) else list(e) for e in data.get("pipeline", [])]
+
+
+def pipeline_stages(data: dict) -> list:
+    """Flat pipeline order."""
+    return [sid for group in pipeline_entries(data) for sid in group]
+
+
+def pipeline_index(data: dict, stage_id: str) -> int:
+    for idx, group in enumerate(pipeline_entries(data)):
+        if stage_id in group:
+            return idx
+    return -1
+
+
+def pipeline_upstream(data: dict, stage_id: str) -> list:
+    """Stages that must finish before ``stage_id`` can start (the previous entry)."""
+    idx = pipeline_index(data, stage_id)
+    return pipeline_entries(data)[idx - 1] if idx > 0 else []
+
+
+def current_stages(data: dict) -> list:
+    """All active linear stages: currentStage plus its unfinished group siblings."""
+    current = data.get("currentStage")
+    idx = pipeline_index(data, current) if current else -1
+    if idx < 0:
+        return [current] if current else []
+    return [sid for sid in pipeline_entries(data)[idx]
+            if data["stages"].get(sid, {}).get("status") not in ("done", "skipped")]
+
+
 def compute_ready_tasks(data: dict) -> list:
     """Return task IDs whose dependencies are all done and status is pending."""
+    dag = compact_for(data)
+    if dag is not None:
+        return dag.ready()
     ready = []
     for task_id, task in data["stages"].items():
         if task["status"] != "pending":
             continue
-        deps = task.get("dependsOn", [])
-        all_deps_done = all(
-            data["stages"].get(d, {}).get("status") in ("done", "skipped")
-            for d in deps
-        )
-        if all_deps_done:
+        if all(dep_satisfied(data, d) for d in task.get("dependsOn", [])):
             ready.append(task_id)
     return ready
 
 
 def check_dag_completion(data: dict):
     """Update project status based on DAG task states."""
+    dag = compact_for(data)
+    if dag is not None:
+        data["status"] = dag.completion_status(data.get("status"))
+        return
     all_tasks = data["stages"]
     statuses = [t["status"] for t in all_tasks.values()]
 
+    has_failure = "failed" in statuses or upstream_failed(data)
+
     if all(s in ("done", "skipped") for s in statuses):
         data["status"] = "completed"
-    elif any(s == "failed" for s in statuses):
+    elif all(s in TERMINAL_STATUSES for s in statuses):
+        data["status"] = _terminal_project_status(data, has_failure)
+    elif has_failure:
         # Check if any ready tasks remain despite failure
         ready = compute_ready_tasks(data)
         if not ready and not any(s == "in-progress" for s in statuses):
@@ -135,6 +1614,121 @@ def check_dag_completion(data: dict):
         data["status"] = "active"
 
 
+# ── Failure policy ──────────────────────────────────────────────────
+#
+#   block                 (default) dependents of a failed task stay pending;
+#                         the project is "blocked" once nothing else can run.
+#   skip-downstream       transitive dependents are cancelled at once; the
+#                         project ends "failed" when the rest has finished.
+#   continue-independent  as skip-downstream, but the failure is contained:
+#                         the project ends "completed" once independent work is
+#                         done (the failed/cancelled branch is still visible).
+#
+# Cancelled tasks are terminal, so scanners and dashboards can ignore them;
+# resetting the failed task restores the tasks it cancelled.
+
+FAILURE_POLICIES = ("block", "skip-downstream", "continue-independent")
+STATUS_NAMES = ["pending", "in-progress", "done", "failed", "skipped", "cancelled"]
+TERMINAL_STATUSES = ("done", "skipped", "failed", "cancelled")
+
+
+def failure_policy(data: dict) -> str:
+    return data.get("failurePolicy") or load_config().get("failurePolicy", "block")
+
+
+def _terminal_project_status(data: dict, has_failure: bool) -> str:
+    if has_failure and failure_policy(data) != "continue-independent":
+        return "failed"
+    return "completed"
+
+
+def _reverse_deps(data: dict) -> dict:
+    if not is_dag(data):
+        entries = pipeline_entries(data)
+        return {a: list(nxt) for group, nxt in zip(entries, entries[1:]) for a in group}
+    rdeps = {}
+    for tid, stage in data["stages"].items():
+        for dep in stage.get("dependsOn", []):
+            rdeps.setdefault(dep, []).append(tid)
+    return rdeps
+
+
+def cancel_downstream(data: dict, failed_id: str) -> list:
+    """Cancel every pending transitive dependent of ``failed_id`` in one BFS pass."""
+    stages = data["stages"]
+    dag = compact_for(data)
+    cancelled = []
+    for child in (dag.downstream(failed_id) if dag is not None else _downstream(data, failed_id)):
+        stage = stages[child]
+        if stage["status"] != "pending":
+            continue
+        stage["status"] = "cancelled"
+        if dag is not None:
+            dag.set_status(child, "cancelled")
+        stage["cancelledBy"] = failed_id
+        stage["completedAt"] = now_iso()
+        stage["logs"].append({
+            "time": now_iso(),
+            "event": f"cancelled: upstream {failed_id} {dep_stage_status(data, failed_id)}",
+        })
+        cancelled.append(child)
+    return cancelled
+
+
+def _downstream(data: dict, root: str):
+    """Transitive dependents of ``root`` (a task id or project:task ref), breadth first."""
+    rdeps = _reverse_deps(data)
+    stages = data["stages"]
+    seen = {root}
+    queue = deque([root])
+    while queue:
+        for child in rdeps.get(queue.popleft(), []):
+            if child in seen or child not in stages:
+                continue
+            seen.add(child)
+            queue.append(child)
+            yield child
+
+
+def dep_stage_status(data: dict, dep: str) -> str:
+    if split_ref(data, dep):
+        return data.get("externalDeps", {}).get(dep, "unknown")
+    return data["stages"][dep]["status"]
+
+
+def propagate_failure(data: dict, stage_id: str) -> list:
+    """Apply the project's failure policy after ``stage_id`` failed or was cancelled."""
+    if stage_id not in data["stages"] or failure_policy(data) == "block":
+        return []
+    cancelled = cancel_downstream(data, stage_id)
+    if is_dag(data):
+        check_dag_completion(data)
+    else:
+        # Group siblings may still be running; the project ends when they do.
+        live = [sid for sid in current_stages(data) if data["stages"][sid]["status"] not in TERMINAL_STATUSES]
+        data["currentStage"] = live[0] if live else None
+        if not live:
+            data["status"] = _terminal_project_status(data, True)
+    return cancelled
+
+
+def restore_cancelled(data: dict, stage_ids) -> list:
+    """Return tasks cancelled because of ``stage_ids`` to pending."""
+    roots = set(stage_ids)
+    dag = compact_for(data)
+    restored = []
+    for tid, stage in data["stages"].items():
+        if stage.get("status") == "cancelled" and stage.get("cancelledBy") in roots:
+            stage["status"] = "pending"
+            if dag is not None:
+                dag.set_status(tid, "pending")
+            stage["completedAt"] = None
+            stage.pop("cancelledBy", None)
+            stage["logs"].append({"time": now_iso(), "event": "restored: upstream was reset"})
+            restored.append(tid)
+    return restored
+
+
 def detect_cycles(data: dict) -> list:
     """Detect cycles in DAG using DFS. Returns list of nodes in cycle or empty list."""
     WHITE, GRAY, BLACK = 0, 1, 2
@@ -166,6 +1760,414 @@ def detect_cycles(data: dict) -> list:
     return []
 
 
+def ancestor_closure(data: dict, targets: list) -> set:
+    """Targets plus everything they transitively depend on."""
+    stages = data["stages"]
+    missing = [t for t in targets if t not in stages]
+    if missing:
+        print(f"Error: target task(s) not found: {', '.join(missing)}", file=sys.stderr)
+        sys.exit(1)
+    closure = set()
+    stack = list(targets)
+    while stack:
+        tid = stack.pop()
+        if tid in closure or tid not in stages:
+            continue
+        closure.add(tid)
+        stack.extend(stages[tid].get("dependsOn", []))
+    return closure
+
+
+def skip_outside_closure(data: dict, closure: set, targets: list) -> list:
+    """Mark pending tasks that don't feed any target as skipped."""
+    skipped = []
+    for tid, stage in data["stages"].items():
+        if tid in closure or stage["status"] != "pending":
+            continue
+        stage["status"] = "skipped"
+        stage["logs"].append({
+            "time": now_iso(),
+            "event": f"skipped: not needed for target {', '.join(targets)}",
+        })
+        skipped.append(tid)
+    if skipped:
+        check_dag_completion(data)
+        data["updated"] = now_iso()
+    return skipped
+
+
+def _target_filter(args, data: dict):
+    """Apply ready/claim --target: returns (targets, closure, skipped); closure is None without --target."""
+    if not getattr(args, "target", None):
+        return [], None, []
+    if not is_dag(data):
+        print("Error: --target requires a DAG project", file=sys.stderr)
+        sys.exit(1)
+    targets = [t.strip() for t in args.target.split(",") if t.strip()]
+    closure = ancestor_closure(data, targets)
+    skipped = skip_outside_closure(data, closure, targets) if args.skip_rest else []
+    return targets, closure, skipped
+
+
+# ── Map / reduce fan-out ────────────────────────────────────────────
+#
+# A DAG task added with --map carries stage["map"] = {"agent", "task",
+# "reduce": {"id", "agent", "task"}}. When it is marked done, its output must
+# be a JSON list; each item becomes a child task "<id>.<n>" depending on the
+# map task, and a reduce task depending on every child is created. Tasks that
+# depended on the map task are rewired onto the reduce task, so they still
+# wait for the whole fan-out. All of this happens in the same write as the
+# status change. Resetting the map task removes what it generated.
+
+def _render_item_task(template: str, item, index: int) -> str:
+    text = item if isinstance(item, str) else json.dumps(item, ensure_ascii=False)
+    return template.replace("{item}", text).replace("{index}", str(index))
+
+
+def plan_map_expansion(data: dict, map_id: str, raw: str) -> tuple:
+    """(items, child ids, reduce id) for expanding ``map_id`` with output ``raw``.
+
+    Raises ValueError if the output is not a JSON list or a generated id is taken.
+    """
+    try:
+        items = json.loads(raw) if raw.strip() else None
+    except ValueError:
+        items = None
+    if not isinstance(items, list):
+        raise ValueError(f"map task '{map_id}' output must be a JSON list (set it with 'result' first)")
+    reduce_spec = data["stages"][map_id]["map"].get("reduce", {})
+    reduce_id = reduce_spec.get("id") or f"{map_id}.reduce"
+    width = len(str(max(len(items) - 1, 0)))
+    children = [f"{map_id}.{i:0{width}d}" for i in range(len(items))]
+    clash = [tid for tid in children + [reduce_id] if tid in data["stages"]]
+    if clash:
+        raise ValueError(f"cannot expand '{map_id}': task id(s) already exist: {', '.join(clash[:5])}")
+    return items, children, reduce_id
+
+
+def expand_map_task(data: dict, map_id: str) -> list:
+    """Expand a finished map task into child tasks plus a reduce task; returns newly ready ids.
+
+    Raises ValueError (leaving ``data`` untouched) if the map output cannot be expanded.
+    """
+    stage = data["stages"][map_id]
+    spec = stage["map"]
+    if spec.get("expanded"):
+        return []
+    items, children, reduce_id = plan_map_expansion(data, map_id, read_stage_output(stage))
+
+    stages = data["stages"]
+    reduce_spec = spec.get("reduce", {})
+    rewired = [tid for tid, t in stages.items() if map_id in t.get("dependsOn", [])]
+    item_agent = spec.get("agent") or stage.get("agent", map_id)
+    template = spec.get("task") or "{item}"
+    for index, (tid, item) in enumerate(zip(children, items)):
+        child = make_stage(item_agent, _render_item_task(template, item, index), [map_id])
+        child["item"] = item
+        child["mapParent"] = map_id
+        stages[tid] = child
+    reduce_stage = make_stage(reduce_spec.get("agent") or stage.get("agent", map_id),
+                              reduce_spec.get("task", ""), children or [map_id])
+    reduce_stage["mapParent"] = map_id
+    stages[reduce_id] = reduce_stage
+    for tid in rewired:
+        stages[tid]["dependsOn"] = [reduce_id if d == map_id else d for d in stages[tid]["dependsOn"]]
+
+    spec["expanded"] = {"children": len(children), "reduce": reduce_id, "rewired": rewired, "time": now_iso()}
+    stage["logs"].append({
+        "time": now_iso(),
+        "event": f"expanded into {len(children)} task{'s' if len(children) != 1 else ''} + {reduce_id}",
+    })
+    # Only the new tasks can have become ready: children depend solely on the
+    # (done) map task, and an empty fan-out leaves just the reduce task.
+    return children or [reduce_id]
+
+
+def collapse_map_task(data: dict, map_id: str) -> list:
+    """Undo expand_map_task (on reset): drop generated tasks and restore rewired deps."""
+    stages = data["stages"]
+    spec = stages[map_id].get("map") or {}
+    expanded = spec.pop("expanded", None)
+    if not expanded:
+        return []
+    generated = [tid for tid, t in stages.items() if t.get("mapParent") == map_id]
+    for tid in generated:
+        del stages[tid]
+    for tid in expanded.get("rewired", []):
+        if tid in stages:
+            stages[tid]["dependsOn"] = [map_id if d == expanded["reduce"] else d
+                                        for d in stages[tid].get("dependsOn", [])]
+    return generated
+
+
+# ── Compact stage model ─────────────────────────────────────────────
+#
+# For long-running processes that hold very large DAGs in memory (TaskStore
+# users: the coordinator, dashboards, sync scripts). Stages become __slots__
+# objects with interned agent/status strings, task ids become dense integers,
+# and dependencies are CSR-style int arrays (forward and reverse). Every
+# project:task ref a task depends on is an extra node after the tasks whose
+# status comes from data["externalDeps"]. Ready set and status counts are
+# maintained incrementally, so a status change costs O(out-degree) instead of
+# a full rescan.
+#
+# Each TaskStore Project builds its model once per loaded version (a new file
+# version is a new Project). compute_ready_tasks, check_dag_completion,
+# upstream_failed, cancel_downstream and restore_cancelled use it whenever they
+# are handed such a project's data, and keep it in step with their own
+# changes; dicts from load_project go through the plain dict path.
+
+PENDING, IN_PROGRESS, DONE, FAILED, SKIPPED, CANCELLED = range(len(STATUS_NAMES))
+_STAGE_FIELDS = ("agent", "status", "task", "startedAt", "completedAt", "output", "logs", "dependsOn")
+_MISSING = object()
+_store_projects = weakref.WeakValueDictionary()  # id(project.data) → TaskStore Project
+
+
+def compact_for(data: dict):
+    """The cached CompactDag for a TaskStore project's data, else None."""
+    project = _store_projects.get(id(data))
+    if project is None or project.data is not data or not is_dag(data):
+        return None
+    return project.compact()
+
+
+class CompactStage:
+    __slots__ = ("agent", "task", "started_at", "completed_at", "output", "logs",
+                 "has_deps", "raw_deps", "extra", "key_order")
+
+    def __init__(self):
+        self.raw_deps = None   # original dependsOn, kept only if it names unknown tasks
+        self.extra = None      # unknown keys, preserved verbatim
+        self.key_order = None  # interned tuple of the original key order
+
+
+class CompactDag:
+    """Array-backed in-memory representation of a project's stages."""
+
+    def __init__(self):
+        self.meta = {}                   # project-level fields except "stages"
+        self._stages_pos = None          # position of "stages" among top-level keys
+        self.ids = []                    # int id → task id, then project:task refs (interned)
+        self.index = {}                  # task id / ref → int id
+        self.n = 0                       # number of tasks; ids[n:] are external refs
+        self.stages = []                 # int id → CompactStage (tasks only)
+        self.status = bytearray()        # int id → status code
+        self.status_names = list(STATUS_NAMES)
+        self._status_codes = {name: i for i, name in enumerate(STATUS_NAMES)}
+        self.dep_offsets = array("i", [0])
+        self.dep_targets = array("i")
+        self.rdep_offsets = array("i", [0])
+        self.rdep_targets = array("i")
+        self.unmet = array("i")          # unsatisfied dependency count per task
+        self.counts = []                 # tasks per status code
+        self._ready = set()
+        self._orders = {}
+
+    # -- conversion ---------------------------------------------------
+
+    @classmethod
+    def from_project(cls, data: dict) -> "CompactDag":
+        dag = cls()
+        stages = data.get("stages", {})
+        dag.meta = {k: v for k, v in data.items() if k != "stages"}
+        external = dict(data.get("externalDeps") or {})
+        if "externalDeps" in data:
+            dag.meta["externalDeps"] = external
+        dag._stages_pos = list(data).index("stages") if "stages" in data else None
+
+        for tid in stages:
+            tid = sys.intern(tid)
+            dag.index[tid] = len(dag.ids)
+            dag.ids.append(tid)
+        dag.n = len(dag.ids)
+
+        deps_per_task = []
+        for tid, raw in stages.items():
+            st = CompactStage()
+            order = tuple(raw)
+            st.key_order = dag._orders.setdefault(order, order)
+            st.agent = sys.intern(raw["agent"]) if isinstance(raw.get("agent"), str) else raw.get("agent", _MISSING)
+            st.task = raw.get("task", _MISSING)
+            st.started_at = raw.get("startedAt", _MISSING)
+            st.completed_at = raw.get("completedAt", _MISSING)
+            st.output = raw.get("output", _MISSING)
+            st.logs = raw.get("logs", _MISSING)
+            st.has_deps = "dependsOn" in raw
+            deps = raw.get("dependsOn") or []
+            known = []
+            for d in deps:
+                if d not in dag.index and split_ref(data, d):
+                    dag.index[d] = len(dag.ids)
+                    dag.ids.append(sys.intern(d))
+                if d in dag.index:
+                    known.append(dag.index[d])
+            if len(known) != len(deps) or (st.has_deps and not isinstance(raw["dependsOn"], list)):
+                st.raw_deps = raw["dependsOn"]
+            extra = {k: v for k, v in raw.items() if k not in _STAGE_FIELDS}
+            st.extra = extra or None
+            dag.stages.append(st)
+            dag.status.append(dag._code(raw.get("status", "pending")))
+            deps_per_task.append((known, len(deps) - len(known)))
+        for ref in dag.ids[dag.n:]:
+            dag.status.append(dag._code(external.get(ref, "unknown")))
+
+        rdeps = [[] for _ in dag.ids]
+        for i, (known, _) in enumerate(deps_per_task):
+            dag.dep_targets.extend(known)
+            dag.dep_offsets.append(len(dag.dep_targets))
+            for d in known:
+                rdeps[d].append(i)
+        for targets in rdeps:
+            dag.rdep_targets.extend(targets)
+            dag.rdep_offsets.append(len(dag.rdep_targets))
+
+        dag.counts = [0] * len(dag.status_names)
+        for code in dag.status[:dag.n]:
+            dag.counts[code] += 1
+        for i, (known, unknown) in enumerate(deps_per_task):
+            # Unknown local dependencies can never be satisfied, matching compute_ready_tasks.
+            dag.unmet.append(unknown + sum(1 for d in known if not dag._satisfies(dag.status[d])))
+            if dag.status[i] == PENDING and dag.unmet[i] == 0:
+                dag._ready.add(i)
+        return dag
+
+    def to_project(self) -> dict:
+        stages = {}
+        for i in range(self.n):
+            st = self.stages[i]
+            values = {
+                "agent": st.agent,
+                "status": self.status_names[self.status[i]],
+                "task": st.task,
+                "startedAt": st.started_at,
+                "completedAt": st.completed_at,
+                "output": st.output,
+                "logs": st.logs,
+            }
+            if st.has_deps:
+                values["dependsOn"] = (
+                    st.raw_deps if st.raw_deps is not None
+                    else [self.ids[d] for d in self.deps_of(i)]
+                )
+            if st.extra:
+                values.update(st.extra)
+            stages[self.ids[i]] = {k: values[k] for k in st.key_order if values.get(k, _MISSING) is not _MISSING}
+        data = {}
+        items = list(self.meta.items())
+        pos = len(items) if self._stages_pos is None else self._stages_pos
+        for k, v in items[:pos]:
+            data[k] = v
+        data["stages"] = stages
+        for k, v in items[pos:]:
+            data[k] = v
+        return data
+
+    # -- queries ------------------------------------------------------
+
+    def _code(self, status) -> int:
+        code = self._status_codes.get(status)
+        if code is None:
+            code = len(self.status_names)
+            self.status_names.append(sys.intern(status) if isinstance(status, str) else status)
+            self._status_codes[status] = code
+            if self.counts:
+                self.counts.append(0)
+        return code
+
+    @staticmethod
+    def _satisfies(code: int) -> bool:
+        return code == DONE or code == SKIPPED
+
+    def deps_of(self, i: int):
+        return self.dep_targets[self.dep_offsets[i]:self.dep_offsets[i + 1]]
+
+    def dependents_of(self, i: int):
+        return self.rdep_targets[self.rdep_offsets[i]:self.rdep_offsets[i + 1]]
+
+    def status_of(self, task_id: str) -> str:
+        return self.status_names[self.status[self.index[task_id]]]
+
+    def ready(self) -> list:
+        """Task ids ready to dispatch, in stage order (same as compute_ready_tasks)."""
+        return [self.ids[i] for i in sorted(self._ready)]
+
+    def downstream(self, root: str) -> list:
+        """Transitive dependents of a task id or project:task ref, breadth first."""
+        start = self.index.get(root)
+        if start is None:
+            return []
+        seen = {start}
+        queue = deque([start])
+        out = []
+        while queue:
+            for j in self.dependents_of(queue.popleft()):
+                if j not in seen:
+                    seen.add(j)
+                    queue.append(j)
+                    out.append(self.ids[j])
+        return out
+
+    def upstream_failed(self) -> bool:
+        """Same as upstream_failed(): an unfinished task waits on a failed/cancelled ref."""
+        for j in range(self.n, len(self.ids)):
+            if self.status[j] in (FAILED, CANCELLED):
+                if any(not self._satisfies(self.status[i]) for i in self.dependents_of(j)):
+                    return True
+        return False
+
+    def _set(self, i: int, new: int):
+        old = self.status[i]
+        self.status[i] = new
+        if i < self.n:
+            self.counts[old] -= 1
+            self.counts[new] += 1
+            if new == PENDING and self.unmet[i] == 0:
+                self._ready.add(i)
+            else:
+                self._ready.discard(i)
+
+        was_ok, now_ok = self._satisfies(old), self._satisfies(new)
+        if was_ok == now_ok:
+            return
+        delta = -1 if now_ok else 1
+        for j in self.dependents_of(i):
+            self.unmet[j] += delta
+            if self.unmet[j] == 0 and self.status[j] == PENDING:
+                self._ready.add(j)
+            else:
+                self._ready.discard(j)
+
+    def set_status(self, task_id: str, status: str):
+        """Change a task's status, updating counts and dependents' readiness incrementally."""
+        i = self.index[task_id]
+        new = self._code(status)
+        if self.status[i] != new:
+            self._set(i, new)
+
+    def set_external(self, ref: str, status: str):
+        """Record a new cached status for a project:task ref (see _apply_xdep_statuses)."""
+        self.meta.setdefault("externalDeps", {})[ref] = status
+        i = self.index.get(ref)
+        if i is not None and self.status[i] != self._code(status):
+            self._set(i, self._code(status))
+
+    def completion_status(self, current: str) -> str:
+        """Project status after a change; same rules as check_dag_completion."""
+        n = self.n
+        if self.counts[DONE] + self.counts[SKIPPED] == n:
+            return "completed"
+        has_failure = bool(self.counts[FAILED]) or self.upstream_failed()
+        if self.counts[DONE] + self.counts[SKIPPED] + self.counts[FAILED] + self.counts[CANCELLED] == n:
+            return _terminal_project_status(self.meta, has_failure)
+        if has_failure:
+            if not self._ready and not self.counts[IN_PROGRESS]:
+                return "blocked"
+            return current
+        if self.counts[IN_PROGRESS] or self.counts[PENDING]:
+            return "active"
+        return current
+
+
 # ── Commands ────────────────────────────────────────────────────────
 
 def cmd_init(args):
@@ -182,10 +2184,11 @@ def cmd_init(args):
     workspace = args.workspace or ""
 
     if mode == "linear":
-        pipeline = args.pipeline.split(",") if args.pipeline else DEFAULT_PIPELINE
+        pipeline = parse_pipeline(args.pipeline) if args.pipeline else DEFAULT_PIPELINE
         stages = {}
-        for agent in pipeline:
-            stages[agent] = make_stage(agent)
+        for entry in pipeline:
+            for agent in ([entry] if isinstance(entry, str) else entry):
+                stages[agent] = make_stage(agent)
         data = {
             "project": project,
             "goal": goal,
@@ -195,7 +2198,7 @@ def cmd_init(args):
             "mode": "linear",
             "workspace": workspace,
             "pipeline": pipeline,
-            "currentStage": pipeline[0] if pipeline else None,
+            "currentStage": (pipeline[0] if isinstance(pipeline[0], str) else pipeline[0][0]) if pipeline else None,
             "stages": stages,
         }
     elif mode == "dag":
@@ -226,6 +2229,14 @@ def cmd_init(args):
         print(f"Error: mode must be 'linear', 'dag', or 'debate'", file=sys.stderr)
         sys.exit(1)
 
+    if getattr(args, "parent", None):
+        check_parent(project, args.parent)
+        data["parent"] = args.parent
+    if getattr(args, "memoize", False) and mode != "debate":
+        data["memoize"] = True
+    if getattr(args, "on_failure", None) and mode != "debate":
+        data["failurePolicy"] = args.on_failure
+
     save_project(project, data)
     print(json.dumps(data, indent=2, ensure_ascii=False))
 
@@ -272,6 +2283,145 @@ def _all_debaters_responded(data: dict, round_data: dict) -> bool:
     return all(agent in round_data["responses"] for agent in data["debaters"])
 
 
+# ── Debate synthesis clustering ─────────────────────────────────────
+
+_WORD_RE = re.compile(r"[a-z0-9]+(?:['’][a-z]+)?")
+_CJK_RE = re.compile(r"[\u3400-\u9fff]+")
+_SENTENCE_RE = re.compile(r"[^.!?。！？\n]+[.!?。！？]*")
+_STOPWORDS = frozenset(
+    "a an and are as at be but by for from has have in is it its of on or that the "
+    "this to was were will with i we you they he she not no do does should would "
+    "can could also very more most than then so if".split()
+)
+
+
+def _text_terms(text: str) -> list:
+    """Tokenize text into lexical terms: lowercase words plus CJK character bigrams."""
+    lowered = text.lower()
+    terms = [w for w in _WORD_RE.findall(lowered) if w not in _STOPWORDS]
+    for run in _CJK_RE.findall(lowered):
+        if len(run) == 1:
+            terms.append(run)
+        else:
+            terms.extend(run[i:i + 2] for i in range(len(run) - 1))
+    return terms
+
+
+def _tfidf_vectors(texts: list) -> list:
+    """Return one L2-normalised sparse TF-IDF vector (dict) per text."""
+    term_lists = [_text_terms(t) for t in texts]
+    doc_freq = {}
+    for terms in term_lists:
+        for term in set(terms):
+            doc_freq[term] = doc_freq.get(term, 0) + 1
+
+    n_docs = len(texts)
+    vectors = []
+    for terms in term_lists:
+        counts = {}
+        for term in terms:
+            counts[term] = counts.get(term, 0) + 1
+        vec = {
+            term: (1 + math.log(count)) * (math.log((1 + n_docs) / (1 + doc_freq[term])) + 1)
+            for term, count in counts.items()
+        }
+        norm = math.sqrt(sum(v * v for v in vec.values()))
+        if norm:
+            vec = {term: v / norm for term, v in vec.items()}
+        vectors.append(vec)
+    return vectors
+
+
+def _cosine(a: dict, b: dict) -> float:
+    if len(a) > len(b):
+        a, b = b, a
+    return sum(v * b.get(term, 0.0) for term, v in a.items())
+
+
+def _cluster_responses(responses: dict, threshold: float) -> list:
+    """Group debater responses by lexical similarity.
+
+    Uses single-link clustering over TF-IDF cosine similarity. Returns a list of
+    clusters ``{"representative": agent_id, "members": [agent_id, ...]}`` in
+    debater order; the representative is the member most similar to the rest.
+    """
+    agents = list(responses)
+    vectors = _tfidf_vectors([responses[a] for a in agents])
+    n = len(agents)
+    sim = [[_cosine(vectors[i], vectors[j]) if i != j else 1.0 for j in range(n)] for i in range(n)]
+
+    parent = list(range(n))
+
+    def find(i):
+        while parent[i] != i:
+            parent[i] = parent[parent[i]]
+            i = parent[i]
+        return i
+
+    for i in range(n):
+        for j in range(i + 1, n):
+            if sim[i][j] >= threshold:
+                parent[find(j)] = find(i)
+
+    groups = {}
+    for i in range(n):
+        groups.setdefault(find(i), []).append(i)
+
+    clusters = []
+    for members in sorted(groups.values(), key=lambda m: m[0]):
+        rep = max(members, key=lambda i: sum(sim[i][j] for j in members))
+        clusters.append({
+            "representative": agents[rep],
+            "members": [agents[i] for i in members],
+        })
+    return clusters
+
+
+def _unique_points(responses: dict, threshold: float) -> dict:
+    """Return sentences per debater that no other debater makes a similar point to."""
+    sentences = []
+    for agent_id, text in responses.items():
+        for match in _SENTENCE_RE.findall(text):
+            sentence = match.strip()
+            if _text_terms(sentence):
+                sentences.append((agent_id, sentence))
+
+    vectors = _tfidf_vectors([s for _, s in sentences])
+    unique = {}
+    for i, (agent_id, sentence) in enumerate(sentences):
+        echoed = any(
+            other_agent != agent_id and _cosine(vectors[i], vectors[j]) >= threshold
+            for j, (other_agent, _) in enumerate(sentences)
+        )
+        if not echoed:
+            unique.setdefault(agent_id, []).append(sentence)
+    return unique
+
+
+def _print_clustered_section(data: dict, responses: dict, threshold: float):
+    present = {a: responses[a] for a in data["debaters"] if a in responses}
+    missing = [a for a in data["debaters"] if a not in responses]
+
+    clusters = _cluster_responses(present, threshold) if present else []
+    print(f"  ({len(present)} responses → {len(clusters)} cluster{'s' if len(clusters) != 1 else ''})")
+    for cluster in clusters:
+        rep = cluster["representative"]
+        print(f"- {rep} ({_debate_role(data, rep)}): {present[rep]}")
+        supporters = [m for m in cluster["members"] if m != rep]
+        if supporters:
+            names = ", ".join(f"{m} ({_debate_role(data, m)})" for m in supporters)
+            print(f"    Supported by: {names}")
+    for agent_id in missing:
+        print(f"- {agent_id} ({_debate_role(data, agent_id)}): (missing)")
+
+    unique = _unique_points(present, threshold) if len(present) > 1 else {}
+    if unique:
+        print("  Unique points:")
+        for agent_id in data["debaters"]:
+            for sentence in unique.get(agent_id, []):
+                print(f"    ◆ {agent_id}: {sentence}")
+
+
 def cmd_add_debater(args):
     """Add a debater to a debate project."""
     data = load_project(args.project)
@@ -442,6 +2592,23 @@ def cmd_round(args):
         print(f"🧾 Synthesis package for {data['project']}")
         if data.get("goal"):
             print(f"Question: {data['goal']}")
+
+        if getattr(args, "cluster", False):
+            threshold = args.threshold
+            print("\nInitial positions (clustered):")
+            _print_clustered_section(data, initial["responses"], threshold)
+            print("\nCross-reviews (clustered):")
+            if not cross or cross.get("type") != "cross-review":
+                print("- (cross-review round not started)")
+            else:
+                _print_clustered_section(data, cross["responses"], threshold)
+            print(
+                "\nTask: Synthesize the strongest points, resolve disagreements, "
+                "and produce a final recommendation. Weigh each cluster by its "
+                "supporters and address every unique point explicitly."
+            )
+            return
+
         print("\nInitial positions:")
         for agent_id in data["debaters"]:
             role = _debate_role(data, agent_id)
@@ -481,16 +2648,43 @@ def cmd_add(args):
         sys.exit(1)
 
     agent = args.agent or task_id
+    if is_pool(agent) and not pool_members(agent):
+        print(f"Error: pool '{agent}' has no members. Define it under \"pools\" in {config_path()}", file=sys.stderr)
+        sys.exit(1)
     depends_on = args.depends.split(",") if args.depends else []
     task_desc = args.desc or ""
 
-    # Validate dependencies exist
+    # Validate dependencies exist; project:task references may point ahead
+    external = [dep for dep in depends_on if split_ref(data, dep)]
     for dep in depends_on:
-        if dep not in data["stages"]:
+        ref = split_ref(data, dep)
+        if ref is None and dep not in data["stages"]:
+            print(f"Error: dependency '{dep}' not found. Add it first.", file=sys.stderr)
+            sys.exit(1)
+        if ref and ref[0] == args.project:
             print(f"Error: dependency '{dep}' not found. Add it first.", file=sys.stderr)
             sys.exit(1)
+    if external:
+        cycle = find_xdep_cycle(args.project, data, task_id, depends_on)
+        if cycle:
+            path = " → ".join(f"{p}:{t}" for p, t in cycle)
+            print(f"Error: adding '{task_id}' creates a cross-project cycle: {path}", file=sys.stderr)
+            sys.exit(1)
 
     data["stages"][task_id] = make_stage(agent, task_desc, depends_on)
+    if args.shell_command:
+        data["stages"][task_id]["command"] = args.shell_command
+    if args.map:
+        reduce_spec = {"id": args.reduce_id or f"{task_id}.reduce"}
+        if args.reduce_agent:
+            reduce_spec["agent"] = args.reduce_agent
+        if args.reduce_task:
+            reduce_spec["task"] = args.reduce_task
+        data["stages"][task_id]["map"] = {
+            "agent": args.item_agent or agent,
+            "task": args.item_task or "{item}",
+            "reduce": reduce_spec,
+        }
 
     # Check for cycles
     cycles = detect_cycles(data)
@@ -499,10 +2693,21 @@ def cmd_add(args):
         print(f"Error: adding '{task_id}' creates a cycle: {' → '.join(cycles + [cycles[0]])}", file=sys.stderr)
         sys.exit(1)
 
+    if external:
+        ext = data.setdefault("externalDeps", {})
+        for dep in external:
+            ext[dep] = dep_stage(data, dep).get("status", "missing")
+        register_xdeps(args.project, task_id, external)
+
     data["updated"] = now_iso()
     save_project(args.project, data)
     dep_str = f" (depends on: {', '.join(depends_on)})" if depends_on else " (no dependencies — root task)"
     print(f"✅ Added task '{task_id}' → agent: {agent}{dep_str}")
+    for dep in external:
+        if data["externalDeps"][dep] == "missing":
+            print(f"⚠️  {dep} does not exist yet; '{task_id}' waits until it is created and done")
+    if args.map:
+        print(f"🗺️  Map task: its JSON-list output fans out to {task_id}.<n>, reduced by {reduce_spec['id']}")
 
 
 def cmd_status(args):
@@ -520,9 +2725,15 @@ def cmd_status(args):
     print(f"📊 Status: {data['status']}  |  Mode: {mode}")
     if data.get("workspace"):
         print(f"🗂️  Workspace: {data['workspace']}")
+    if data.get("parent"):
+        print(f"⬆️  Parent: {data['parent']}")
+    if data.get("children"):
+        done, total = rollup_progress(rollup_summary(data)["counts"])
+        print(f"🌳 Sub-projects: {len(data['children'])}  |  Rollup: {done}/{total} done")
+        print_subproject_tree(data["children"], "   ")
 
     if mode == "linear":
-        print(f"▶️  Current: {data.get('currentStage', 'N/A')}")
+        print(f"▶️  Current: {', '.join(current_stages(data)) or data.get('currentStage', 'N/A')}")
     print()
 
     status_icons = {
@@ -531,6 +2742,7 @@ def cmd_status(args):
         "done": "✅",
         "failed": "❌",
         "skipped": "⏭️",
+        "cancelled": "🚫",
     }
 
     if mode == "debate":
@@ -573,7 +2785,11 @@ def cmd_status(args):
             deps = task.get("dependsOn", [])
             dep_str = f" ← [{', '.join(deps)}]" if deps else ""
             prefix = "  " * indent
-            print(f"{prefix}  {icon} {tid} ({task.get('agent', '?')}): {task.get('status', 'pending')}{ready_mark}{dep_str}")
+            agent_str = task.get("agent", "?")
+            if task.get("assignedAgent"):
+                agent_str += f" → {task['assignedAgent']}"
+            cached_mark = " ⚡ cached" if task.get("cached") else ""
+            print(f"{prefix}  {icon} {tid} ({agent_str}): {task.get('status', 'pending')}{cached_mark}{ready_mark}{dep_str}")
             task_preview = task.get("task", "")[:60]
             if task_preview:
                 print(f"{prefix}     Task: {task_preview}{'...' if len(task.get('task', '')) > 60 else ''}")
@@ -593,13 +2809,15 @@ def cmd_status(args):
             print(f"\n  🟢 Ready to dispatch: {', '.join(ready)}")
 
     else:  # linear
-        for i, agent in enumerate(data.get("pipeline", [])):
+        parallel = {sid for group in pipeline_entries(data) if len(group) > 1 for sid in group}
+        for agent in pipeline_stages(data):
             stage = data["stages"].get(agent, {})
             icon = status_icons.get(stage.get("status", "pending"), "❓")
             task_preview = stage.get("task", "")[:60]
             if len(stage.get("task", "")) > 60:
                 task_preview += "..."
-            print(f"  {icon} {agent}: {stage.get('status', 'pending')}")
+            group_mark = " ∥" if agent in parallel else ""
+            print(f"  {icon} {agent}: {stage.get('status', 'pending')}{group_mark}")
             if task_preview:
                 print(f"     Task: {task_preview}")
             if stage.get("output"):
@@ -627,11 +2845,81 @@ def cmd_assign(args):
         sys.exit(1)
 
     data["stages"][stage_id]["task"] = args.task
+    if args.shell_command is not None:
+        if args.shell_command:
+            data["stages"][stage_id]["command"] = args.shell_command
+        else:
+            data["stages"][stage_id].pop("command", None)
     data["updated"] = now_iso()
     save_project(args.project, data)
     print(f"✅ Assigned task to {stage_id}")
 
 
+def transition_stage(project: str, data: dict, stage_id: str, new_status: str) -> dict:
+    """Apply a status change and everything it triggers (pipeline advance, failure
+    policy, map fan-out, result cache, completion). Caller holds the project lock
+    and saves. Returns what happened, for reporting.
+
+    Raises ValueError, before changing anything, if finishing a map task whose
+    output cannot be fanned out.
+    """
+    stage = data["stages"][stage_id]
+    if new_status == "done" and stage.get("map") and not stage["map"].get("expanded"):
+        plan_map_expansion(data, stage_id, read_stage_output(stage))
+    old_status = stage["status"]
+    effects = {"old": old_status, "assigned": None, "cancelled": [], "fannedOut": [], "cached": []}
+    stage["status"] = new_status
+    if new_status != "in-progress":
+        stage.pop("lease", None)
+
+    if new_status == "in-progress" and not stage["startedAt"]:
+        stage["startedAt"] = now_iso()
+    elif new_status in TERMINAL_STATUSES:
+        stage["completedAt"] = now_iso()
+
+    if new_status != "done":
+        stage.pop("cached", None)
+    if new_status == "pending":
+        stage.pop("assignedAgent", None)
+    elif new_status == "in-progress" and is_pool(stage.get("agent")) and not stage.get("assignedAgent"):
+        effects["assigned"] = assign_pool_agent(project, data, stage)
+
+    stage["logs"].append({
+        "time": now_iso(),
+        "event": f"status: {old_status} → {new_status}",
+    })
+
+    if new_status == "done" and not is_dag(data):
+        # Linear mode: auto-advance currentStage
+        advance_pipeline(data, stage_id)
+
+    if new_status in ("failed", "cancelled"):
+        effects["cancelled"] = propagate_failure(data, stage_id)
+    elif old_status in ("failed", "cancelled"):
+        restore_cancelled(data, [stage_id])
+        if not is_dag(data) and data.get("currentStage") is None and new_status != "done":
+            data["currentStage"] = stage_id
+            data["status"] = "active"
+
+    if stage.get("map"):
+        if new_status == "done":
+            effects["fannedOut"] = expand_map_task(data, stage_id)
+        else:
+            collapse_map_task(data, stage_id)
+
+    if new_status == "done" and memoize_enabled(data):
+        if not stage.get("cached"):
+            store_cached_result(data, stage_id)
+        effects["cached"] = apply_cached_results(data)
+
+    if is_dag(data):
+        check_dag_completion(data)
+    elif new_status == "failed" and not effects["cancelled"] and failure_policy(data) == "block":
+        data["status"] = "blocked"
+    data["updated"] = now_iso()
+    return effects
+
+
 def cmd_update(args):
     """Update stage/task status."""
     data = load_project(args.project)
@@ -643,32 +2931,34 @@ def cmd_update(args):
         print(f"Error: stage '{stage_id}' not found", file=sys.stderr)
         sys.exit(1)
 
-    valid = ("pending", "in-progress", "done", "failed", "skipped")
+    valid = ("pending", "in-progress", "done", "failed", "skipped", "cancelled")
     if new_status not in valid:
         print(f"Error: status must be one of {valid}", file=sys.stderr)
         sys.exit(1)
 
     stage = data["stages"][stage_id]
-    old_status = stage["status"]
-    stage["status"] = new_status
-
-    if new_status == "in-progress" and not stage["startedAt"]:
-        stage["startedAt"] = now_iso()
-    elif new_status in ("done", "failed", "skipped"):
-        stage["completedAt"] = now_iso()
+    try:
+        effects = transition_stage(args.project, data, stage_id, new_status)
+    except ValueError as e:
+        print(f"Error: {e}", file=sys.stderr)
+        sys.exit(1)
+    old_status = effects["old"]
+    save_project(args.project, data)
 
-    stage["logs"].append({
-        "time": now_iso(),
-        "event": f"status: {old_status} → {new_status}",
-    })
+    if effects["assigned"]:
+        print(f"👥 {stage_id}: {stage['agent']} → {effects['assigned']}")
+    print(f"✅ {stage_id}: {old_status} → {new_status}")
+    if effects["cached"]:
+        print(f"⚡ Completed from result cache: {', '.join(effects['cached'])}")
+    if effects["cancelled"]:
+        print(f"🚫 Cancelled downstream ({failure_policy(data)}): {', '.join(effects['cancelled'])}")
+    if effects["fannedOut"]:
+        spec = stage["map"]["expanded"]
+        print(f"🗺️  Fanned out into {spec['children']} task{'s' if spec['children'] != 1 else ''}"
+              f" → reduce: {spec['reduce']}")
 
     if is_dag(data):
-        # DAG mode: check completion and show newly ready tasks
-        check_dag_completion(data)
-        data["updated"] = now_iso()
-        save_project(args.project, data)
-        print(f"✅ {stage_id}: {old_status} → {new_status}")
-
+        # DAG mode: show newly ready tasks
         if new_status == "done":
             ready = compute_ready_tasks(data)
             if ready:
@@ -680,31 +2970,45 @@ def cmd_update(args):
             ready = compute_ready_tasks(data)
             if ready:
                 print(f"⚠️  Failed, but these tasks can still run: {', '.join(ready)}")
+            elif data["status"] in ("failed", "completed"):
+                print(f"🏁 Project finished: {data['status']}")
             else:
                 print(f"❌ Pipeline blocked — no tasks can proceed")
     else:
-        # Linear mode: auto-advance currentStage
-        if new_status == "done":
-            pipeline = data.get("pipeline", [])
-            idx = pipeline.index(stage_id) if stage_id in pipeline else -1
-            if idx >= 0 and idx < len(pipeline) - 1:
-                data["currentStage"] = pipeline[idx + 1]
-            elif idx == len(pipeline) - 1:
-                data["status"] = "completed"
-                data["currentStage"] = None
-        elif new_status == "failed":
-            data["status"] = "blocked"
-
-        data["updated"] = now_iso()
-        save_project(args.project, data)
-        print(f"✅ {stage_id}: {old_status} → {new_status}")
-
         if new_status == "done" and data.get("currentStage"):
             print(f"▶️  Next: {data['currentStage']}")
         elif data["status"] == "completed":
             print("🎉 Pipeline completed!")
 
 
+def advance_pipeline(data: dict, stage_id: str):
+    """Linear mode: move currentStage past a finished stage (or complete the project)."""
+    entries = pipeline_entries(data)
+    idx = pipeline_index(data, stage_id)
+    if idx < 0:
+        return
+    group = entries[idx]
+    statuses = [data["stages"].get(sid, {}).get("status") for sid in group]
+    waiting = [sid for sid, status in zip(group, statuses) if status not in TERMINAL_STATUSES]
+    broken = [sid for sid, status in zip(group, statuses) if status in ("failed", "cancelled")]
+    if waiting:
+        # Parallel group: stay on it until every member is done.
+        data["currentStage"] = waiting[0]
+    elif broken:
+        # A sibling failed, so the group can never complete.
+        if failure_policy(data) == "block":
+            data["status"] = "blocked"
+            data["currentStage"] = broken[0]
+        else:
+            data["status"] = _terminal_project_status(data, True)
+            data["currentStage"] = None
+    elif idx < len(entries) - 1:
+        data["currentStage"] = entries[idx + 1][0]
+    else:
+        data["status"] = "completed"
+        data["currentStage"] = None
+
+
 def cmd_next(args):
     """Get next actionable stage (linear mode)."""
     data = load_project(args.project)
@@ -722,19 +3026,32 @@ def cmd_next(args):
             print("❌ No current stage (pipeline may be blocked)")
         return
 
-    stage = data["stages"].get(current, {})
-    result = {
-        "stage": current,
-        "agent": stage.get("agent", current),
-        "task": stage.get("task", ""),
-        "status": stage.get("status", "pending"),
-        "workspace": data.get("workspace", ""),
-    }
-
+    results = []
+    loads = None
+    for sid in current_stages(data) or [current]:
+        stage = data["stages"].get(sid, {})
+        result = {
+            "stage": sid,
+            "agent": stage.get("assignedAgent") or stage.get("agent", sid),
+            "task": stage.get("task", ""),
+            "status": stage.get("status", "pending"),
+            "workspace": data.get("workspace", ""),
+        }
+        if is_pool(result["agent"]):
+            if loads is None:
+                loads = agent_loads(args.project, data)
+            result["pool"] = result["agent"]
+            result["agent"] = resolve_pool_agent(result["pool"], loads) or result["pool"]
+        results.append(result)
+
+    idx = pipeline_index(data, current)
+    grouped = idx >= 0 and len(pipeline_entries(data)[idx]) > 1
     if args.json:
-        print(json.dumps(result, indent=2, ensure_ascii=False))
-    else:
-        print(f"▶️  Next stage: {current}")
+        # Flat pipelines keep returning a single object; groups return every active stage.
+        print(json.dumps(results if grouped else results[0], indent=2, ensure_ascii=False))
+        return
+    for result in results:
+        print(f"▶️  Next stage: {result['stage']}")
         print(f"   Agent: {result['agent']}")
         print(f"   Status: {result['status']}")
         if result["workspace"]:
@@ -743,6 +3060,109 @@ def cmd_next(args):
             print(f"   Task: {result['task']}")
 
 
+# ── Agent pools ─────────────────────────────────────────────────────
+#
+# A stage may target a pool ("agent": "pool:code") instead of a fixed agent.
+# Pool membership comes from config: {"pools": {"code": ["code-agent", ...]}}.
+# At dispatch the pool resolves to the member with the fewest in-progress
+# stages across all projects, and the choice is recorded as "assignedAgent".
+
+POOL_PREFIX = "pool:"
+
+
+def is_pool(agent) -> bool:
+    return isinstance(agent, str) and agent.startswith(POOL_PREFIX)
+
+
+def pool_members(agent: str) -> list:
+    return list(load_config().get("pools", {}).get(agent[len(POOL_PREFIX):], []))
+
+
+def agent_matches(agent, wanted) -> bool:
+    """True if ``agent`` is one of ``wanted``, or a pool with a member in it."""
+    if is_pool(agent):
+        return bool(set(wanted).intersection(pool_members(agent)))
+    return agent in wanted
+
+
+def agent_loads(project: str, data: dict) -> dict:
+    """In-progress stage count per agent across all projects.
+
+    ``data`` is the caller's in-memory copy of ``project`` and is counted in
+    place of the on-disk version.
+    """
+    loads = {}
+
+    def count(stages):
+        for stage in stages.values():
+            if stage.get("status") == "in-progress":
+                agent = stage.get("assignedAgent") or stage.get("agent")
+                loads[agent] = loads.get(agent, 0) + 1
+
+    for other in get_store().projects():
+        if other.name != project:
+            count(other.stages)
+    count(data.get("stages", {}))
+    return loads
+
+
+def resolve_pool_agent(agent: str, loads: dict, allowed=None) -> str:
+    """Least-loaded member of a pool (ties go to config order). Bumps ``loads``."""
+    members = pool_members(agent)
+    if allowed is not None:
+        members = [m for m in members if m in allowed]
+    if not members:
+        return None
+    chosen = min(members, key=lambda m: loads.get(m, 0))
+    loads[chosen] = loads.get(chosen, 0) + 1
+    return chosen
+
+
+def assign_pool_agent(project: str, data: dict, stage: dict, loads: dict = None, allowed=None):
+    """Record the resolved pool member on a stage going in-progress. Returns it (or None)."""
+    if not is_pool(stage.get("agent")) or stage.get("assignedAgent"):
+        return stage.get("assignedAgent")
+    if loads is None:
+        loads = agent_loads(project, data)
+    chosen = resolve_pool_agent(stage["agent"], loads, allowed)
+    if chosen:
+        stage["assignedAgent"] = chosen
+    return chosen
+
+
+def dispatch_entry(data: dict, tid: str, output_tail: int = None) -> dict:
+    """Everything a dispatcher needs to hand a task to its agent.
+
+    Dependency outputs are read in full unless ``output_tail`` limits them to
+    their last N bytes; streamed outputs are also listed under depOutputRefs.
+    """
+    task = data["stages"][tid]
+    deps = task.get("dependsOn", [])
+    dep_outputs = {}
+    dep_refs = {}
+    for d in deps:
+        dep_task = dep_stage(data, d)
+        if dep_task.get("outputRef"):
+            dep_refs[d] = {
+                "path": os.path.join(TASKS_DIR, dep_task["outputRef"]),
+                "length": dep_task.get("outputLength", 0),
+            }
+        if dep_task.get("output"):
+            dep_outputs[d] = read_stage_output(dep_task, tail=output_tail)
+
+    entry = {
+        "taskId": tid,
+        "agent": task.get("assignedAgent") or task.get("agent", tid),
+        "task": task.get("task", ""),
+        "dependsOn": deps,
+        "depOutputs": dep_outputs,
+        "workspace": data.get("workspace", ""),
+    }
+    if dep_refs:
+        entry["depOutputRefs"] = dep_refs
+    return entry
+
+
 def cmd_ready(args):
     """Get all tasks whose dependencies are met (dag mode)."""
     data = load_project(args.project)
@@ -752,11 +3172,28 @@ def cmd_ready(args):
         print("Hint: 'ready' is for DAG mode. Use 'next' for linear pipelines.")
         return cmd_next(args)
 
+    # Show tasks whose lease has lapsed as dispatchable; the next claim persists it.
+    reclaim_expired_leases(data)
+
+    targets, closure, skipped = _target_filter(args, data)
+    if skipped:
+        # --skip-rest runs under the project lock (see main), so this save is safe.
+        data["updated"] = now_iso()
+        save_project(args.project, data)
+        print(f"⏭️  Skipped {len(skipped)} task{'s' if len(skipped) != 1 else ''} outside the target closure")
+    if memoize_enabled(data):
+        data = _ready_with_cache(args.project, data)
+
     if data["status"] == "completed":
         print("🎉 All tasks completed — nothing to dispatch")
         return
 
     ready = compute_ready_tasks(data)
+    if closure is not None:
+        ready = [tid for tid in ready if tid in closure]
+        if all(data["stages"][t]["status"] in ("done", "skipped") for t in targets):
+            print(f"🎯 Target{'s' if len(targets) > 1 else ''} {', '.join(targets)} complete — nothing to dispatch")
+            return
 
     if not ready:
         in_progress = [tid for tid, t in data["stages"].items() if t["status"] == "in-progress"]
@@ -766,25 +3203,14 @@ def cmd_ready(args):
             print("❌ No ready tasks (pipeline may be blocked)")
         return
 
-    results = []
-    for tid in ready:
-        task = data["stages"][tid]
-        deps = task.get("dependsOn", [])
-        dep_outputs = {}
-        for d in deps:
-            dep_task = data["stages"].get(d, {})
-            if dep_task.get("output"):
-                dep_outputs[d] = dep_task["output"]
-
-        entry = {
-            "taskId": tid,
-            "agent": task.get("agent", tid),
-            "task": task.get("task", ""),
-            "dependsOn": deps,
-            "depOutputs": dep_outputs,
-            "workspace": data.get("workspace", ""),
-        }
-        results.append(entry)
+    results = [dispatch_entry(data, tid, getattr(args, "output_tail", None)) for tid in ready]
+    loads = None
+    for entry in results:
+        if is_pool(entry["agent"]):
+            if loads is None:
+                loads = agent_loads(args.project, data)
+            entry["pool"] = entry["agent"]
+            entry["agent"] = resolve_pool_agent(entry["pool"], loads) or entry["pool"]
 
     if getattr(args, "json", False):
         print(json.dumps(results, indent=2, ensure_ascii=False))
@@ -792,7 +3218,8 @@ def cmd_ready(args):
         print(f"🟢 Ready to dispatch ({len(results)} task{'s' if len(results) > 1 else ''}):\n")
         for r in results:
             deps_str = f" ← [{', '.join(r['dependsOn'])}]" if r["dependsOn"] else ""
-            print(f"  📌 {r['taskId']} → agent: {r['agent']}{deps_str}")
+            pool_str = f" (from {r['pool']})" if r.get("pool") else ""
+            print(f"  📌 {r['taskId']} → agent: {r['agent']}{pool_str}{deps_str}")
             if r["workspace"]:
                 print(f"     Workspace: {r['workspace']}")
             if r["task"]:
@@ -804,6 +3231,152 @@ def cmd_ready(args):
             print()
 
 
+# ── Leases ──────────────────────────────────────────────────────────
+
+def reclaim_expired_leases(data: dict, now: datetime = None) -> list:
+    """Return in-progress tasks whose lease has expired to pending. Returns their IDs."""
+    now = now or datetime.now(timezone.utc)
+    reclaimed = []
+    for tid, stage in data.get("stages", {}).items():
+        lease = stage.get("lease")
+        if not lease or stage.get("status") != "in-progress":
+            continue
+        expires = parse_iso(lease.get("expiresAt"))
+        if expires is None or expires > now:
+            continue
+        stage["status"] = "pending"
+        stage["startedAt"] = None
+        stage.pop("assignedAgent", None)
+        del stage["lease"]
+        stage["logs"].append({
+            "time": now_iso(),
+            "event": f"lease expired (owner {lease.get('owner')}) → pending",
+        })
+        reclaimed.append(tid)
+    if reclaimed and is_dag(data):
+        check_dag_completion(data)
+    return reclaimed
+
+
+def _claimable_tasks(data: dict) -> list:
+    if is_dag(data):
+        return compute_ready_tasks(data)
+    return [sid for sid in current_stages(data) if data["stages"].get(sid, {}).get("status") == "pending"]
+
+
+def _lease_holder(data: dict, stage_id: str, owner: str) -> dict:
+    """Return the stage if ``owner`` holds its lease, otherwise exit with an error."""
+    if stage_id not in data["stages"]:
+        print(f"Error: stage '{stage_id}' not found", file=sys.stderr)
+        sys.exit(1)
+    stage = data["stages"][stage_id]
+    lease = stage.get("lease")
+    if not lease or stage["status"] != "in-progress":
+        print(f"Error: '{stage_id}' has no active lease", file=sys.stderr)
+        sys.exit(1)
+    if lease.get("owner") != owner:
+        print(f"Error: lease on '{stage_id}' is held by '{lease.get('owner')}', not '{owner}'", file=sys.stderr)
+        sys.exit(1)
+    return stage
+
+
+def cmd_claim(args):
+    """Atomically claim ready task(s) under a time-limited lease."""
+    data = load_project(args.project)
+    ensure_stage_mode(data, "claim")
+    lease_seconds = parse_duration(args.lease)
+    owner = args.owner or f"{socket.gethostname()}:{os.getpid()}"
+    now = datetime.now(timezone.utc)
+
+    reclaimed = reclaim_expired_leases(data, now)
+    _, closure, skipped = _target_filter(args, data)
+    cached = apply_cached_results(data)
+    candidates = _claimable_tasks(data)
+    if closure is not None:
+        candidates = [tid for tid in candidates if tid in closure]
+    wanted = set(args.agent.split(",")) if args.agent else None
+    if wanted:
+        candidates = [tid for tid in candidates if agent_matches(data["stages"][tid].get("agent", tid), wanted)]
+    picked = candidates[:max(args.count, 0)]
+
+    expires = (now + timedelta(seconds=lease_seconds)).isoformat()
+    results = []
+    loads = None
+    for tid in picked:
+        stage = data["stages"][tid]
+        if is_pool(stage.get("agent")):
+            if loads is None:
+                loads = agent_loads(args.project, data)
+            assign_pool_agent(args.project, data, stage, loads, wanted)
+        stage["status"] = "in-progress"
+        if not stage["startedAt"]:
+            stage["startedAt"] = now_iso()
+        stage["lease"] = {"owner": owner, "claimedAt": now_iso(), "expiresAt": expires}
+        stage["logs"].append({
+            "time": now_iso(),
+            "event": f"claimed by {owner} (lease until {expires})",
+        })
+        entry = dispatch_entry(data, tid)
+        entry["lease"] = stage["lease"]
+        results.append(entry)
+
+    if picked or reclaimed or skipped or cached:
+        if is_dag(data):
+            check_dag_completion(data)
+        data["updated"] = now_iso()
+        save_project(args.project, data)
+
+    if args.json:
+        print(json.dumps(results, indent=2, ensure_ascii=False))
+        return
+    if reclaimed:
+        print(f"♻️  Expired leases returned to pool: {', '.join(reclaimed)}")
+    if skipped:
+        print(f"⏭️  Skipped {len(skipped)} task{'s' if len(skipped) != 1 else ''} outside the target closure")
+    if cached:
+        print(f"⚡ Completed from result cache: {', '.join(cached)}")
+    if not results:
+        print("⏳ No claimable tasks")
+        return
+    for r in results:
+        print(f"🔒 {r['taskId']} → agent: {r['agent']}  owner: {owner}  lease until {expires}")
+        if r["task"]:
+            print(f"     Task: {r['task'][:80]}{'...' if len(r['task']) > 80 else ''}")
+
+
+def cmd_renew(args):
+    """Extend a lease held by --owner."""
+    data = load_project(args.project)
+    ensure_stage_mode(data, "renew")
+    stage = _lease_holder(data, args.stage, args.owner)
+    expires = (datetime.now(timezone.utc) + timedelta(seconds=parse_duration(args.lease))).isoformat()
+    stage["lease"]["expiresAt"] = expires
+    stage["lease"]["renewedAt"] = now_iso()
+    data["updated"] = now_iso()
+    save_project(args.project, data)
+    print(f"🔒 Lease on {args.stage} renewed until {expires}")
+
+
+def cmd_release(args):
+    """Give a claimed task back to the ready pool."""
+    data = load_project(args.project)
+    ensure_stage_mode(data, "release")
+    stage = _lease_holder(data, args.stage, args.owner)
+    del stage["lease"]
+    stage.pop("assignedAgent", None)
+    stage["status"] = "pending"
+    stage["startedAt"] = None
+    stage["logs"].append({
+        "time": now_iso(),
+        "event": f"released by {args.owner} → pending",
+    })
+    if is_dag(data):
+        check_dag_completion(data)
+    data["updated"] = now_iso()
+    save_project(args.project, data)
+    print(f"🔓 Released {args.stage} back to the pool")
+
+
 def cmd_log(args):
     """Append a log entry to a stage/task."""
     data = load_project(args.project)
@@ -814,17 +3387,313 @@ def cmd_log(args):
         print(f"Error: stage '{stage_id}' not found", file=sys.stderr)
         sys.exit(1)
 
-    data["stages"][stage_id]["logs"].append({
+    entry = {
         "time": now_iso(),
         "event": args.message,
-    })
-    data["updated"] = now_iso()
-    save_project(args.project, data)
+    }
+    if durability_settings()[0] == "grouped":
+        journal_append(args.project, {"op": "log", "stage": stage_id, "entry": entry, "time": entry["time"]})
+    else:
+        data["stages"][stage_id]["logs"].append(entry)
+        data["updated"] = now_iso()
+        save_project(args.project, data)
     print(f"📝 Log added to {stage_id}")
 
 
+# ── Stage output sidecars ───────────────────────────────────────────
+#
+# Appended/streamed output lives in <TASKS_DIR>/.team-tasks/outputs/<project>/
+# <stage>.out. The stage keeps "outputRef" (path relative to TASKS_DIR),
+# "outputLength" (bytes) and a tail preview in "output", so the project file
+# stays small and readers can fetch a byte range or the tail on demand.
+
+OUTPUT_PREVIEW_BYTES = 500
+
+
+def output_sidecar_ref(project: str, stage_id: str) -> str:
+    safe = stage_id.replace(os.sep, "_")
+    return os.path.join(STATE_DIR_NAME, "outputs", project, f"{safe}.out")
+
+
+def read_stage_output(stage: dict, base_dir=None, offset: int = 0, length: int = None,
+                      tail: int = None) -> str:
+    """Read a stage's output, or a slice of it, without loading a whole sidecar.
+
+    ``tail`` returns the last N bytes; otherwise ``offset``/``length`` select a
+    byte range. Inline (non-sidecar) outputs are sliced by character.
+    """
+    ref = stage.get("outputRef")
+    if not ref:
+        text = stage.get("output", "")
+        if tail is not None:
+            return text[-tail:] if tail else ""
+        return text[offset:offset + length if length is not None else None]
+
+    path = os.path.join(os.fspath(base_dir or TASKS_DIR), ref)
+    try:
+        with open(path, "rb") as f:
+            if tail is not None:
+                size = f.seek(0, os.SEEK_END)
+                f.seek(max(0, size - tail))
+                raw = f.read()
+            else:
+                f.seek(offset)
+                raw = f.read(-1 if length is None else length)
+    except OSError:
+        return stage.get("output", "")
+    # Byte ranges can split a multi-byte character at either edge.
+    return raw.decode("utf-8", errors="ignore")
+
+
+def _refresh_output_meta(stage: dict, base_dir=None):
+    path = os.path.join(os.fspath(base_dir or TASKS_DIR), stage["outputRef"])
+    size = os.path.getsize(path) if os.path.exists(path) else 0
+    preview = read_stage_output(stage, base_dir, tail=OUTPUT_PREVIEW_BYTES)
+    stage["outputLength"] = size
+    stage["output"] = ("…" + preview) if size > OUTPUT_PREVIEW_BYTES else preview
+
+
+def _append_output(project: str, stage_id: str, stage: dict, chunk: bytes):
+    """Append to the stage's sidecar, moving any inline output into it first."""
+    ref = stage.get("outputRef") or output_sidecar_ref(project, stage_id)
+    path = os.path.join(TASKS_DIR, ref)
+    os.makedirs(os.path.dirname(path), exist_ok=True)
+    if not stage.get("outputRef"):
+        with open(path, "wb") as f:
+            f.write((stage.get("output") or "").encode("utf-8"))
+        stage["outputRef"] = ref
+    with open(path, "ab") as f:
+        f.write(chunk)
+
+
+def _drop_output_sidecar(stage: dict):
+    ref = stage.pop("outputRef", None)
+    stage.pop("outputLength", None)
+    if ref:
+        try:
+            os.remove(os.path.join(TASKS_DIR, ref))
+        except OSError:
+            pass
+
+
+def _stream_result(args):
+    """Append stdin to a stage's output as it arrives, flushing metadata periodically."""
+    with project_lock(args.project):
+        data = load_project(args.project)
+        ensure_stage_mode(data, "result")
+        if args.stage not in data["stages"]:
+            print(f"Error: stage '{args.stage}' not found", file=sys.stderr)
+            sys.exit(1)
+
+    def flush(chunks):
+        # Only hold the project lock while persisting; other agents keep
+        # writing while this process waits on stdin.
+        with project_lock(args.project):
+            data = load_project(args.project)
+            stage = data["stages"][args.stage]
+            if chunks:
+                _append_output(args.project, args.stage, stage, b"".join(chunks))
+            elif not stage.get("outputRef"):
+                _append_output(args.project, args.stage, stage, b"")
+            _refresh_output_meta(stage)
+            data["updated"] = now_iso()
+            save_project(args.project, data)
+            return stage["outputLength"]
+
+    fd = sys.stdin.fileno()
+    pending, last_flush = [], datetime.now().timestamp()
+    while True:
+        chunk = os.read(fd, 65536)
+        if chunk:
+            pending.append(chunk)
+        now = datetime.now().timestamp()
+        if pending and (not chunk or now - last_flush >= args.flush_interval):
+            flush(pending)
+            pending, last_flush = [], now
+        if not chunk:
+            break
+    total = flush([])
+    print(f"✅ Streamed output for {args.stage} ({total} bytes)")
+
+
+# ── Result cache ────────────────────────────────────────────────────
+#
+# Opt-in memoization (``init --memoize`` or config "cache": {"enabled": true}).
+# The key hashes a task's agent, task text and the full outputs of its
+# upstream stages; a stage finishing "done" stores its output under that key.
+# Whenever tasks become dispatchable, a hit completes them on the spot with a
+# "cached" marker, which can cascade down the graph in one pass. Entries live
+# in .team-tasks/result-cache/ and are evicted least-recently-used (by mtime,
+# refreshed on every hit) once the cache exceeds "maxBytes".
+
+RESULT_CACHE_MAX_BYTES = 64 * 1024 * 1024
+
+
+def memoize_enabled(data: dict) -> bool:
+    if is_debate(data):
+        return False
+    return bool(data.get("memoize", load_config().get("cache", {}).get("enabled", False)))
+
+
+def _upstream_stages(data: dict, tid: str) -> list:
+    if is_dag(data):
+        return data["stages"][tid].get("dependsOn", [])
+    return pipeline_upstream(data, tid)
+
+
+def result_cache_key(data: dict, tid: str) -> str:
+    stage = data["stages"][tid]
+    h = hashlib.sha256(json.dumps([stage.get("agent", tid), stage.get("task", "")],
+                                  ensure_ascii=False).encode("utf-8"))
+    for dep in sorted(_upstream_stages(data, tid)):
+        h.update(b"\0" + dep.encode("utf-8") + b"\0")
+        h.update(read_stage_output(dep_stage(data, dep)).encode("utf-8"))
+    return h.hexdigest()
+
+
+def _result_cache_dir() -> str:
+    return os.path.join(TASKS_DIR, STATE_DIR_NAME, "result-cache")
+
+
+def _result_cache_entry(key: str) -> str:
+    return os.path.join(_result_cache_dir(), key[:2], f"{key}.json")
+
+
+def cache_lookup(key: str):
+    path = _result_cache_entry(key)
+    try:
+        with open(path, encoding="utf-8") as f:
+            entry = json.load(f)
+        os.utime(path)  # LRU: mtime is the last-used time
+    except (OSError, ValueError):
+        return None
+    return entry.get("output")
+
+
+def _iter_cache_entries():
+    root = _result_cache_dir()
+    if not os.path.isdir(root):
+        return
+    for shard in os.scandir(root):
+        if shard.is_dir():
+            for entry in os.scandir(shard.path):
+                if entry.name.endswith(".json"):
+                    st = entry.stat()
+                    yield st.st_mtime_ns, st.st_size, entry.path
+
+
+def _evict_result_cache(max_bytes: int):
+    entries = sorted(_iter_cache_entries())
+    total = sum(size for _, size, _ in entries)
+    for _, size, path in entries:
+        if total <= max_bytes:
+            break
+        try:
+            os.remove(path)
+        except FileNotFoundError:
+            pass
+        total -= size
+
+
+def store_cached_result(data: dict, tid: str):
+    """Remember a finished stage's output under its input hash."""
+    stage = data["stages"][tid]
+    output = read_stage_output(stage)
+    if not output:
+        return
+    key = result_cache_key(data, tid)
+    write_json_atomic(_result_cache_entry(key), {
+        "agent": stage.get("agent", tid),
+        "task": stage.get("task", ""),
+        "output": output,
+        "storedAt": now_iso(),
+    })
+    _evict_result_cache(load_config().get("cache", {}).get("maxBytes", RESULT_CACHE_MAX_BYTES))
+
+
+def apply_cached_results(data: dict) -> list:
+    """Complete every dispatchable task that has a cache hit; returns their ids."""
+    if not memoize_enabled(data):
+        return []
+    hits, tried = [], set()
+    while True:
+        progressed = False
+        for tid in _claimable_tasks(data):
+            if tid in tried:
+                continue
+            tried.add(tid)
+            key = result_cache_key(data, tid)
+            output = cache_lookup(key)
+            if output is None:
+                continue
+            stage = data["stages"][tid]
+            if stage.get("map") and is_dag(data):
+                try:
+                    plan_map_expansion(data, tid, output)
+                except ValueError:
+                    continue  # cached output cannot be fanned out here; run the task instead
+            _drop_output_sidecar(stage)
+            stage["status"] = "done"
+            stage["output"] = output
+            stage["startedAt"] = stage["completedAt"] = now_iso()
+            stage["cached"] = {"key": key[:16], "time": now_iso()}
+            stage["logs"].append({"time": now_iso(), "event": "status: pending → done (result cache hit)"})
+            if not is_dag(data):
+                advance_pipeline(data, tid)
+            elif stage.get("map"):
+                expand_map_task(data, tid)
+            hits.append(tid)
+            progressed = True
+        if not progressed:
+            break
+    if hits and is_dag(data):
+        check_dag_completion(data)
+    return hits
+
+
+def _ready_with_cache(project: str, data: dict) -> dict:
+    """ready is read-only, so take the lock only when there are cache hits to persist.
+
+    Safe under --skip-rest, where main() already holds the lock: project_lock
+    is re-entrant.
+    """
+    if not any(cache_lookup(result_cache_key(data, tid)) is not None for tid in _claimable_tasks(data)):
+        return data
+    with project_lock(project):
+        data = load_project(project)
+        reclaim_expired_leases(data)
+        cached = apply_cached_results(data)
+        if cached:
+            data["updated"] = now_iso()
+            save_project(project, data)
+            print(f"⚡ Completed from result cache: {', '.join(cached)}")
+    return data
+
+
+def cmd_cache(args):
+    """Show or clear the result cache."""
+    if args.clear:
+        removed = 0
+        for _, _, path in list(_iter_cache_entries()):
+            os.remove(path)
+            removed += 1
+        print(f"🧹 Removed {removed} cached result{'s' if removed != 1 else ''}")
+        return
+    entries = list(_iter_cache_entries())
+    max_bytes = load_config().get("cache", {}).get("maxBytes", RESULT_CACHE_MAX_BYTES)
+    enabled = load_config().get("cache", {}).get("enabled", False)
+    print(f"⚡ Result cache: {len(entries)} entries, {sum(e[1] for e in entries):,} / {max_bytes:,} bytes"
+          f"  (global default: {'on' if enabled else 'off'})")
+
+
 def cmd_result(args):
-    """Set stage/task output/result."""
+    """Set, append to, or stream stage/task output/result."""
+    if args.stdin:
+        return _stream_result(args)
+    if args.output is None:
+        print("Error: provide output text or use --stdin", file=sys.stderr)
+        sys.exit(1)
+
     data = load_project(args.project)
     ensure_stage_mode(data, "result")
     stage_id = args.stage
@@ -833,10 +3702,38 @@ def cmd_result(args):
         print(f"Error: stage '{stage_id}' not found", file=sys.stderr)
         sys.exit(1)
 
-    data["stages"][stage_id]["output"] = args.output
+    stage = data["stages"][stage_id]
+    if args.append:
+        _append_output(args.project, stage_id, stage, args.output.encode("utf-8"))
+        _refresh_output_meta(stage)
+        if durability_settings()[0] == "grouped":
+            journal_append(args.project, {"op": "output", "stage": stage_id,
+                                          "ref": stage["outputRef"], "time": now_iso()})
+            print(f"✅ Appended to {stage_id} ({stage['outputLength']} bytes total)")
+            return
+    else:
+        _drop_output_sidecar(stage)
+        stage["output"] = args.output
     data["updated"] = now_iso()
     save_project(args.project, data)
-    print(f"✅ Result saved for {stage_id}")
+    if args.append:
+        print(f"✅ Appended to {stage_id} ({stage['outputLength']} bytes total)")
+    else:
+        print(f"✅ Result saved for {stage_id}")
+
+
+def cmd_output(args):
+    """Print a stage's full output, a byte range, or its tail."""
+    data = load_project(args.project)
+    ensure_stage_mode(data, "output")
+    if args.stage not in data["stages"]:
+        print(f"Error: stage '{args.stage}' not found", file=sys.stderr)
+        sys.exit(1)
+    text = read_stage_output(data["stages"][args.stage], offset=args.offset,
+                             length=args.length, tail=args.tail)
+    sys.stdout.write(text)
+    if text and not text.endswith("\n"):
+        sys.stdout.write("\n")
 
 
 def cmd_reset(args):
@@ -855,21 +3752,33 @@ def cmd_reset(args):
     for stage_id in targets:
         if stage_id not in data["stages"]:
             continue
+        if data["stages"][stage_id].get("map"):
+            collapse_map_task(data, stage_id)
         data["stages"][stage_id]["status"] = "pending"
         data["stages"][stage_id]["startedAt"] = None
         data["stages"][stage_id]["completedAt"] = None
         data["stages"][stage_id]["output"] = ""
+        _drop_output_sidecar(data["stages"][stage_id])
+        data["stages"][stage_id].pop("lease", None)
+        data["stages"][stage_id].pop("assignedAgent", None)
+        data["stages"][stage_id].pop("cached", None)
+        data["stages"][stage_id].pop("cancelledBy", None)
         data["stages"][stage_id]["logs"].append({
             "time": now_iso(),
             "event": "reset to pending",
         })
+    restore_cancelled(data, targets)
 
     if not is_dag(data):
-        data["currentStage"] = data["pipeline"][0] if data.get("pipeline") else None
+        entries = pipeline_entries(data)
+        data["currentStage"] = entries[0][0] if entries else None
     data["status"] = "active"
+    cached = [] if args.no_cache else apply_cached_results(data)
     data["updated"] = now_iso()
     save_project(args.project, data)
     print(f"🔄 Reset: {', '.join(targets)}")
+    if cached:
+        print(f"⚡ Completed from result cache: {', '.join(cached)}")
 
 
 def cmd_history(args):
@@ -883,11 +3792,14 @@ def cmd_history(args):
         sys.exit(1)
 
     logs = data["stages"][stage_id]["logs"]
-    if not logs:
+    archived = data["stages"][stage_id].get("logArchive")
+    if not logs and not archived:
         print(f"No logs for {stage_id}")
         return
 
     print(f"📜 History for {stage_id}:")
+    if archived:
+        print(f"  ({archived['count']} earlier entries archived, {archived['first']} … {archived['last']})")
     for entry in logs:
         print(f"  [{entry['time']}] {entry['event']}")
 
@@ -907,10 +3819,12 @@ def cmd_graph(args):
         "done": "✅",
         "failed": "❌",
         "skipped": "⏭️",
+        "cancelled": "🚫",
     }
 
-    # Find roots (no deps)
-    roots = [tid for tid, t in data["stages"].items() if not t.get("dependsOn")]
+    # Find roots (no local deps; cross-project deps are shown inline)
+    roots = [tid for tid, t in data["stages"].items()
+             if not any(d in data["stages"] for d in t.get("dependsOn", []))]
     # Find what each task unblocks
     children = {tid: [] for tid in data["stages"]}
     for tid, t in data["stages"].items():
@@ -932,7 +3846,10 @@ def cmd_graph(args):
         icon = status_icons.get(task["status"], "❓")
         connector = "└─" if is_last else "├─"
         agent = task.get("agent", "?")
-        print(f"{prefix}{connector} {icon} {tid} [{agent}]")
+        external = [f"{status_icons.get(data['externalDeps'].get(d), '❓')} {d}"
+                    for d in task.get("dependsOn", []) if split_ref(data, d)]
+        ext_str = f" ⇠ {', '.join(external)}" if external else ""
+        print(f"{prefix}{connector} {icon} {tid} [{agent}]{ext_str}")
 
         kids = children.get(tid, [])
         for i, child in enumerate(kids):
@@ -958,30 +3875,1183 @@ def cmd_graph(args):
 def cmd_list(args):
     """List all projects."""
     os.makedirs(TASKS_DIR, exist_ok=True)
-    files = [f for f in os.listdir(TASKS_DIR) if f.endswith(".json")]
+    files = sorted(iter_project_files())
     if not files:
         print("No projects found.")
         return
 
-    for f in sorted(files):
-        name = f.replace(".json", "")
-        try:
-            with open(os.path.join(TASKS_DIR, f)) as fh:
-                data = json.load(fh)
-            goal = data.get("goal", "")[:50]
-            status = data.get("status", "unknown")
-            mode = data.get("mode", "linear")
-            done = sum(1 for t in data.get("stages", {}).values()
-                       if t.get("status") in ("done", "skipped"))
-            total = len(data.get("stages", {}))
-            print(f"  {name} [{status}] ({done}/{total}) mode={mode} {goal}")
-        except Exception:
+    store = get_store()
+    projects = {}
+    for name, path in files:
+        project = store.load(path, name)
+        if project is None:
             print(f"  {name} [error reading]")
+            continue
+        projects[name] = project
+
+    # Sub-projects are listed under their parent; rollups come from the
+    # parent's cached child summaries.
+    children = {}
+    for name, project in projects.items():
+        parent = project.data.get("parent")
+        if parent in projects:
+            children.setdefault(parent, []).append(name)
+
+    def show(name, depth):
+        project = projects[name]
+        total = len(project.stages)
+        prefix = "  " + "   " * (depth - 1) + "└─ " if depth else "  "
+        line = f"{prefix}{name} [{project.status}] ({project.done_count()}/{total}) mode={project.mode} {project.goal[:50]}".rstrip()
+        if project.data.get("children"):
+            done, subtotal = rollup_progress(rollup_summary(project.data)["counts"])
+            line += f"  🌳 rollup {done}/{subtotal}"
+        print(line)
+        for child in children.get(name, []):
+            show(child, depth + 1)
+
+    for name, project in projects.items():
+        if project.data.get("parent") not in projects:
+            show(name, 0)
+
+
+def cmd_migrate_layout(args):
+    """Switch TASKS_DIR between flat and hash-sharded layouts, online."""
+    target = args.to
+    current = storage_layout()
+    os.makedirs(TASKS_DIR, exist_ok=True)
+
+    # Flip the marker first: from here on every writer targets the new layout
+    # and every reader falls back to the old one, so agents can keep working
+    # while files are moved one at a time below.
+    if not args.dry_run and current != target:
+        write_json_atomic(state_path("layout.json"), {"layout": target, "shardWidth": SHARD_WIDTH})
+
+    moved = 0
+    for project, path in list(iter_project_files()):
+        if target == "sharded":
+            dest = os.path.join(TASKS_DIR, shard_for(project), f"{project}.json")
+        else:
+            dest = os.path.join(TASKS_DIR, f"{project}.json")
+        if path == dest:
+            continue
+        moved += 1
+        if args.dry_run:
+            print(f"  {path} → {dest}")
+            continue
+        os.makedirs(os.path.dirname(dest), exist_ok=True)
+        # Check-and-move under the project lock: save_project writes the new
+        # layout and drops the old copy under the same lock, so neither side
+        # can clobber (or lose) the other's file.
+        with project_lock(project):
+            if os.path.exists(dest):
+                # A writer already saved the project under the new layout.
+                if os.path.exists(path):
+                    os.remove(path)
+            elif os.path.exists(path):
+                os.replace(path, dest)
+
+    if target == "flat" and not args.dry_run:
+        for entry in os.scandir(TASKS_DIR):
+            if _SHARD_RE.match(entry.name) and entry.is_dir():
+                try:
+                    os.rmdir(entry.path)
+                except OSError:
+                    pass
+
+    verb = "Would move" if args.dry_run else "Moved"
+    print(f"🗂️  Layout: {current} → {target}. {verb} {moved} project file{'s' if moved != 1 else ''}.")
+
+
+# ── Local executor ──────────────────────────────────────────────────
+#
+# `run` executes tasks that carry a shell "command" (set with add/assign
+# --command) on this machine, make-style: up to -j processes at once, a slot
+# is refilled with the next ready task as soon as one exits. Each task is
+# claimed under a lease (so other dispatchers leave it alone) and its stdout +
+# stderr are appended to the stage output sidecar; the project lock is only
+# held for the short load/modify/save steps, never while commands run.
+
+class _RunningTask:
+    __slots__ = ("tid", "proc", "chunks", "last_flush", "started", "deadline", "tail")
+
+    def __init__(self, tid, proc, timeout):
+        self.tid = tid
+        self.proc = proc
+        self.chunks = []
+        self.tail = b""
+        self.started = self.last_flush = time.monotonic()
+        self.deadline = self.started + timeout if timeout else None
+
+
+def _runnable(data: dict, agents) -> list:
+    out = []
+    for tid in _claimable_tasks(data):
+        stage = data["stages"][tid]
+        if stage.get("command") and (not agents or agent_matches(stage.get("agent", tid), agents)):
+            out.append(tid)
+    return out
+
+
+def _run_start(project: str, owner: str, slots: int, lease_seconds: float, agents):
+    """Claim up to ``slots`` runnable tasks; returns [(tid, command, cwd)] and waiting agent tasks."""
+    with project_lock(project):
+        data = load_project(project)
+        changed = bool(reclaim_expired_leases(data))
+        cached = apply_cached_results(data)
+        picked = _runnable(data, agents)[:slots]
+        expires = (datetime.now(timezone.utc) + timedelta(seconds=lease_seconds)).isoformat()
+        started = []
+        loads = None
+        for tid in picked:
+            stage = data["stages"][tid]
+            if agents and is_pool(stage.get("agent")):
+                # Resolve within --agent before transition_stage picks from the whole pool.
+                if loads is None:
+                    loads = agent_loads(project, data)
+                assign_pool_agent(project, data, stage, loads, agents)
+            transition_stage(project, data, tid, "in-progress")
+            _drop_output_sidecar(stage)
+            stage["output"] = ""
+            stage["lease"] = {"owner": owner, "claimedAt": now_iso(), "expiresAt": expires}
+            stage["logs"].append({"time": now_iso(), "event": f"run: $ {stage['command']}"})
+            started.append((tid, stage["command"], data.get("workspace") or None))
+        if picked or changed or cached:
+            save_project(project, data)
+        waiting = [tid for tid in _claimable_tasks(data) if not data["stages"][tid].get("command")]
+    for tid in cached:
+        print(f"⚡ {tid}: completed from result cache")
+    return started, waiting
+
+
+def _run_flush(project: str, task: _RunningTask, lease_seconds: float, final_status: str = None,
+               note: str = None) -> dict:
+    """Persist buffered output (and renew the lease, or finish the task)."""
+    chunk = b"".join(task.chunks)
+    task.chunks = []
+    task.last_flush = time.monotonic()
+    with project_lock(project):
+        data = load_project(project)
+        stage = data["stages"].get(task.tid)
+        if stage is None:
+            return {}
+        if chunk or not stage.get("outputRef"):
+            _append_output(project, task.tid, stage, chunk)
+            _refresh_output_meta(stage)
+        last_line = task.tail.rstrip().rsplit(b"\n", 1)[-1].decode("utf-8", "replace")[:200]
+        if chunk and last_line:
+            stage["logs"].append({"time": now_iso(), "event": f"stdout: {last_line}"})
+        effects = {}
+        if final_status:
+            stage["logs"].append({"time": now_iso(), "event": note})
+            try:
+                effects = transition_stage(project, data, task.tid, final_status)
+            except ValueError as e:
+                # e.g. a map task whose output is not a JSON list: fail it, keep running the rest
+                stage["logs"].append({"time": now_iso(), "event": f"run: {e}"})
+                effects = transition_stage(project, data, task.tid, "failed")
+                effects["error"] = str(e)
+        elif stage.get("lease"):
+            stage["lease"]["expiresAt"] = (datetime.now(timezone.utc) + timedelta(seconds=lease_seconds)).isoformat()
+        data["updated"] = now_iso()
+        save_project(project, data)
+    return effects
+
+
+def _raise_interrupt(signum, frame):
+    raise KeyboardInterrupt
+
+
+def _stop_process(proc, kill: bool = False):
+    """Stop a task's whole process group, not just the shell wrapping it."""
+    if os.name == "posix":
+        try:
+            os.killpg(proc.pid, signal.SIGKILL if kill else signal.SIGTERM)
+        except ProcessLookupError:
+            pass
+    elif kill:
+        proc.kill()
+    else:
+        proc.terminate()
+    proc.wait()
+
+
+def cmd_run(args):
+    """Execute ready tasks that have a shell command, -j at a time."""
+    data = load_project(args.project)
+    ensure_stage_mode(data, "run")
+    if args.jobs < 1:
+        print("Error: -j must be at least 1", file=sys.stderr)
+        sys.exit(1)
+    lease_seconds = parse_duration(args.lease)
+    timeout = parse_duration(args.timeout) if args.timeout else None
+    agents = set(args.agent.split(",")) if args.agent else None
+    owner = f"run:{socket.gethostname()}:{os.getpid()}"
+
+    # Treat SIGTERM like Ctrl-C so running tasks go back to pending, not stale.
+    signal.signal(signal.SIGTERM, _raise_interrupt)
+    selector = selectors.DefaultSelector()
+    running = {}
+    finished = failed = 0
+    waiting = []
+
+    def fill():
+        nonlocal waiting
+        free = args.jobs - len(running)
+        if free <= 0:
+            return
+        started, waiting = _run_start(args.project, owner, free, lease_seconds, agents)
+        for tid, command, cwd in started:
+            proc = subprocess.Popen(command, shell=True, cwd=cwd, stdin=subprocess.DEVNULL,
+                                    stdout=subprocess.PIPE, stderr=subprocess.STDOUT,
+                                    start_new_session=(os.name == "posix"))
+            os.set_blocking(proc.stdout.fileno(), False)
+            task = _RunningTask(tid, proc, timeout)
+            running[tid] = task
+            selector.register(proc.stdout, selectors.EVENT_READ, task)
+            print(f"▶️  {tid}: $ {command}", flush=True)
+
+    def finish(task, status, note):
+        nonlocal finished, failed
+        selector.unregister(task.proc.stdout)
+        task.proc.stdout.close()
+        del running[task.tid]
+        effects = _run_flush(args.project, task, lease_seconds, status, note)
+        flush_xdep_updates()
+        if effects.get("error"):
+            status, note = "failed", effects["error"]
+        elapsed = _fmt_duration(time.monotonic() - task.started)
+        if status == "done":
+            finished += 1
+            print(f"✅ {task.tid} ({elapsed})", flush=True)
+        elif status == "pending":
+            print(f"⏸️  {task.tid}: {note} ({elapsed})", flush=True)
+        else:
+            failed += 1
+            print(f"❌ {task.tid}: {note} ({elapsed})", flush=True)
+        if effects.get("cancelled"):
+            print(f"🚫 Cancelled downstream: {', '.join(effects['cancelled'])}", flush=True)
+        if effects.get("cached"):
+            print(f"⚡ Completed from result cache: {', '.join(effects['cached'])}", flush=True)
+
+    interrupted = False
+    try:
+        fill()
+        while running:
+            for key, _ in selector.select(timeout=min(args.flush_interval, 1.0)):
+                task = key.data
+                chunk = os.read(key.fd, 65536)
+                if chunk:
+                    task.chunks.append(chunk)
+                    task.tail = (task.tail + chunk)[-4096:]
+                    if args.verbose:
+                        for line in chunk.decode("utf-8", "replace").splitlines():
+                            print(f"  [{task.tid}] {line}", flush=True)
+                    continue
+                # EOF: the command closed stdout; collect its exit status.
+                code = task.proc.wait()
+                if code == 0:
+                    finish(task, "done", "run: exit 0")
+                else:
+                    finish(task, "failed", f"run: exit {code}")
+                fill()
+            now = time.monotonic()
+            for task in list(running.values()):
+                if task.deadline and now > task.deadline:
+                    _stop_process(task.proc, kill=True)
+                    finish(task, "failed", f"run: timed out after {args.timeout}")
+                    fill()
+                elif now - task.last_flush >= args.flush_interval and (task.chunks or now - task.last_flush >= lease_seconds / 3):
+                    _run_flush(args.project, task, lease_seconds)
+    except KeyboardInterrupt:
+        interrupted = True
+    finally:
+        # Whatever ended the loop, leave no orphaned children or live leases behind.
+        leftover = list(running.values())
+        for task in leftover:
+            _stop_process(task.proc)
+        for task in leftover:
+            finish(task, "pending", "run: interrupted" if interrupted else "run: aborted")
+    if interrupted:
+        print("⏹️  Interrupted; running tasks returned to pending", file=sys.stderr)
+        sys.exit(130)
+
+    summary = f"🏁 Ran {finished + failed} task{'s' if finished + failed != 1 else ''}: {finished} done, {failed} failed"
+    print(summary)
+    if waiting:
+        print(f"⏳ Ready but without a command (needs an agent): {', '.join(waiting)}")
+    if failed:
+        sys.exit(1)
+
+
+# ── Retention / compaction ──────────────────────────────────────────
+#
+# Old stage logs and debater response history are moved into a gzip side
+# archive (.team-tasks/archive/<project>.jsonl.gz, one gzip member per run)
+# and replaced with a summary: {"count", "first", "last"} under
+# stage["logArchive"] / debater["responseArchive"]. The newest entry per list
+# is always kept so last-activity checks keep working.
+
+
+def retention_policy(max_age: str = None, max_entries: int = None):
+    """Return (max_age_seconds, max_entries), CLI values overriding config "retention"."""
+    cfg = load_config().get("retention", {})
+    if max_age is None and cfg.get("maxAgeDays") is not None:
+        max_age = f"{cfg['maxAgeDays']}d"
+    if max_entries is None:
+        max_entries = cfg.get("maxEntries")
+    return (parse_duration(max_age) if max_age else None), max_entries
+
+
+def archive_ref(project: str) -> str:
+    return f"{STATE_DIR_NAME}/archive/{project}.jsonl.gz"
+
+
+def _split_retained(entries: list, cutoff, max_entries):
+    """Split a time-ordered entry list into (archived, kept)."""
+    keep_from = 0
+    if cutoff is not None:
+        while keep_from < len(entries) - 1:
+            ts = parse_iso(Project.log_time(entries[keep_from]))
+            if ts is None or ts >= cutoff:
+                break
+            keep_from += 1
+    if max_entries is not None:
+        keep_from = max(keep_from, len(entries) - max(max_entries, 1))
+    return entries[:keep_from], entries[keep_from:]
+
+
+def _merge_archive_summary(summary: dict, archived: list) -> dict:
+    summary = dict(summary or {"count": 0})
+    summary["count"] += len(archived)
+    summary.setdefault("first", Project.log_time(archived[0]))
+    summary["last"] = Project.log_time(archived[-1])
+    return summary
+
+
+def compact_project(project: str, data: dict, max_age: float = None, max_entries: int = None,
+                    dry_run: bool = False) -> int:
+    """Archive old logs/responses out of ``data`` in place; return entries archived."""
+    cutoff = datetime.now(timezone.utc) - timedelta(seconds=max_age) if max_age is not None else None
+    records = []
+    for sid, stage in data.get("stages", {}).items():
+        archived, kept = _split_retained(stage.get("logs") or [], cutoff, max_entries)
+        if not archived:
+            continue
+        records.extend({"stage": sid, "kind": "log", "entry": e} for e in archived)
+        stage["logs"] = kept
+        summary = _merge_archive_summary(stage.get("logArchive"), archived)
+        resets = [Project.log_time(e) for e in archived if e.get("event") == "reset to pending"]
+        if resets:
+            summary["lastReset"] = resets[-1]
+        stage["logArchive"] = summary
+    for aid, debater in data.get("debaters", {}).items():
+        archived, kept = _split_retained(debater.get("responses") or [], cutoff, max_entries)
+        if not archived:
+            continue
+        records.extend({"debater": aid, "kind": "response", "entry": e} for e in archived)
+        debater["responses"] = kept
+        debater["responseArchive"] = _merge_archive_summary(debater.get("responseArchive"), archived)
+
+    if records and not dry_run:
+        path = os.path.join(TASKS_DIR, archive_ref(project))
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        # Archive first: a crash before the project save duplicates entries, never loses them.
+        with gzip.open(path, "at", encoding="utf-8") as f:
+            for rec in records:
+                f.write(json.dumps(rec, ensure_ascii=False) + "\n")
+            f.flush()
+        data["archiveRef"] = archive_ref(project)
+    return len(records)
+
+
+def _auto_compact(project: str, data: dict):
+    """Apply the configured retention policy on save when "retention.auto" is set."""
+    cfg = load_config().get("retention", {})
+    if not cfg.get("auto"):
+        return
+    max_age, max_entries = retention_policy()
+    if max_age is None and max_entries is None:
+        return
+    cutoff = datetime.now(timezone.utc) - timedelta(seconds=max_age) if max_age is not None else None
+    lists = [s.get("logs") or [] for s in data.get("stages", {}).values()]
+    lists += [d.get("responses") or [] for d in data.get("debaters", {}).values()]
+    for entries in lists:
+        if len(entries) < 2:
+            continue
+        if max_entries is not None and len(entries) > max_entries:
+            break
+        first = parse_iso(Project.log_time(entries[0])) if cutoff else None
+        if first and first < cutoff:
+            break
+    else:
+        return
+    compact_project(project, data, max_age, max_entries)
+
+
+def cmd_compact(args):
+    """Trim old logs/responses into a compressed archive across projects."""
+    max_age, max_entries = retention_policy(args.older_than, args.keep)
+    if max_age is None and max_entries is None:
+        print("Error: no retention policy; pass --older-than/--keep or set \"retention\" in config",
+              file=sys.stderr)
+        sys.exit(1)
+
+    if args.project:
+        targets = [(args.project, task_file(args.project))]
+        if not os.path.exists(targets[0][1]):
+            print(f"Error: project '{args.project}' not found", file=sys.stderr)
+            sys.exit(1)
+    else:
+        targets = list(iter_project_files())
+
+    total_entries = total_bytes = touched = 0
+    for project, _ in targets:
+        with project_lock(project):
+            data = load_project(project)
+            if args.dry_run:
+                before = len(json.dumps(data, indent=2, ensure_ascii=False).encode("utf-8"))
+            else:
+                before = os.path.getsize(task_file(project))
+            archived = compact_project(project, data, max_age, max_entries, dry_run=args.dry_run)
+            if not archived:
+                continue
+            if args.dry_run:
+                after = len(json.dumps(data, indent=2, ensure_ascii=False).encode("utf-8"))
+            else:
+                save_project(project, data, auto_compact=False)
+                after = os.path.getsize(task_file(project))
+        touched += 1
+        total_entries += archived
+        total_bytes += before - after
+        print(f"  {project}: {archived} entries, {_size_change(before - after)}")
+
+    verb = "Would archive" if args.dry_run else "Archived"
+    print(f"🗜️  {verb} {total_entries} entries from {touched}/{len(targets)} projects, "
+          f"{_size_change(total_bytes)}.")
+
+
+def _size_change(saved: int) -> str:
+    """Describe a byte delta; archive summaries can outweigh a small trim."""
+    if saved < 0:
+        return f"grew {-saved:,} bytes (archive summary outweighs the trimmed entries)"
+    return f"{saved:,} bytes reclaimed"
+
+
+# ── Export ──────────────────────────────────────────────────────────
+#
+# Everything here is a generator chain: one project file is parsed at a time
+# and rows are written as they are produced, so memory stays flat no matter
+# how many projects or how much history is exported.
+
+EXPORT_COLUMNS = {
+    "stages": ["project", "title", "mode", "stage", "agent", "assignedAgent", "status", "task",
+               "dependsOn", "startedAt", "completedAt", "durationSec", "logCount", "outputLength"],
+    "logs": ["project", "stage", "agent", "time", "event", "archived"],
+}
+
+
+def _iter_export_projects(names=None):
+    """Yield (name, data) one project at a time, bypassing the shared store cache."""
+    for name, path in sorted(iter_project_files()):
+        if names and name not in names:
+            continue
+        try:
+            with open(path, encoding="utf-8") as f:
+                data = json.load(f)
+        except (OSError, ValueError):
+            print(f"Warning: skipping unreadable project {name}", file=sys.stderr)
+            continue
+        apply_journal(data, read_journal(name))
+        yield name, data
+
+
+def _iter_archived_logs(project: str):
+    path = os.path.join(TASKS_DIR, archive_ref(project))
+    if not os.path.exists(path):
+        return
+    with gzip.open(path, "rt", encoding="utf-8") as f:
+        for line in f:
+            rec = json.loads(line)
+            if rec.get("kind") == "log":
+                yield rec["stage"], rec["entry"]
+
+
+def _stage_rows(projects):
+    for name, data in projects:
+        for sid, stage in data.get("stages", {}).items():
+            started = parse_iso(stage.get("startedAt"))
+            completed = parse_iso(stage.get("completedAt"))
+            yield {
+                "project": name,
+                "title": data.get("project", name),
+                "mode": get_mode(data),
+                "stage": sid,
+                "agent": stage.get("agent"),
+                "assignedAgent": stage.get("assignedAgent"),
+                "status": stage.get("status"),
+                "task": stage.get("task"),
+                "dependsOn": stage.get("dependsOn", []),
+                "startedAt": stage.get("startedAt"),
+                "completedAt": stage.get("completedAt"),
+                "durationSec": round((completed - started).total_seconds(), 3) if started and completed else None,
+                "logCount": len(stage.get("logs") or []) + stage.get("logArchive", {}).get("count", 0),
+                "outputLength": stage.get("outputLength", len(stage.get("output") or "")),
+            }, stage.get("completedAt") or stage.get("startedAt") or data.get("created")
+
+
+def _log_rows(projects, include_archived: bool):
+    for name, data in projects:
+        stages = data.get("stages", {})
+        sources = []
+        if include_archived:
+            sources.append((_iter_archived_logs(name), True))
+        sources.append((((sid, e) for sid, st in stages.items() for e in st.get("logs") or []), False))
+        for entries, archived in sources:
+            for sid, entry in entries:
+                ts = Project.log_time(entry)
+                yield {
+                    "project": name,
+                    "stage": sid,
+                    "agent": stages.get(sid, {}).get("agent"),
+                    "time": ts,
+                    "event": Project.log_event(entry),
+                    "archived": archived,
+                }, ts
+
+
+def cmd_export(args):
+    """Stream stage or log rows across projects as NDJSON or CSV."""
+    columns = EXPORT_COLUMNS[args.rows]
+    if args.columns:
+        wanted = [c.strip() for c in args.columns.split(",") if c.strip()]
+        unknown = [c for c in wanted if c not in columns]
+        if unknown:
+            print(f"Error: unknown column(s) {', '.join(unknown)}; available: {', '.join(columns)}",
+                  file=sys.stderr)
+            sys.exit(1)
+        columns = wanted
+    since, until = parse_iso(args.since), parse_iso(args.until)
+    for flag, raw, parsed in (("--since", args.since, since), ("--until", args.until, until)):
+        if raw and parsed is None:
+            print(f"Error: {flag} must be an ISO-8601 timestamp, got '{raw}'", file=sys.stderr)
+            sys.exit(1)
+
+    projects = _iter_export_projects(set(args.project) if args.project else None)
+    if args.rows == "stages":
+        rows = _stage_rows(projects)
+    else:
+        rows = _log_rows(projects, args.archived)
+
+    out = open(args.output, "w", encoding="utf-8", newline="") if args.output else sys.stdout
+    try:
+        if args.format == "csv":
+            writer = csv.writer(out)
+            writer.writerow(columns)
+        for row, ts in rows:
+            if since or until:
+                when = parse_iso(ts)
+                if when is None or (since and when < since) or (until and when >= until):
+                    continue
+            if args.format == "csv":
+                writer.writerow([";".join(v) if isinstance(v, list) else ("" if v is None else v)
+                                 for v in (row[c] for c in columns)])
+            else:
+                out.write(json.dumps({c: row[c] for c in columns}, ensure_ascii=False) + "\n")
+    except BrokenPipeError:
+        if args.output:
+            raise
+        # Downstream consumer (head, etc.) stopped reading. Point stdout at devnull so the
+        # flush at interpreter exit can't raise again; stderr stays open for real errors.
+        devnull = os.open(os.devnull, os.O_WRONLY)
+        os.dup2(devnull, sys.stdout.fileno())
+        sys.exit(1)
+    finally:
+        if args.output:
+            out.close()
+
+
+# ── Agent stats ─────────────────────────────────────────────────────
+
+STATS_ROLLUP_VERSION = 1
+STATS_WINDOWS = {
+    "hour": "%Y-%m-%d %H:00",
+    "day": "%Y-%m-%d",
+    "week": "%G-W%V",
+    "month": "%Y-%m",
+}
+
+
+def _stage_ready_time(data: dict, stage_id: str, stage: dict):
+    """When a stage became dispatchable: deps/previous stage done, project creation or last reset."""
+    ready_at = parse_iso(data.get("created"))
+    if is_dag(data):
+        upstream = stage.get("dependsOn", [])
+    else:
+        upstream = pipeline_upstream(data, stage_id)
+
+    for dep in upstream:
+        done_at = parse_iso(data["stages"].get(dep, {}).get("completedAt"))
+        if done_at is None:
+            return None
+        ready_at = max(ready_at, done_at) if ready_at else done_at
+
+    started = parse_iso(stage.get("startedAt"))
+    resets = [e.get("time") or e.get("timestamp") for e in stage.get("logs", [])
+              if e.get("event") == "reset to pending"]
+    resets.append(stage.get("logArchive", {}).get("lastReset"))
+    for reset in resets:
+        reset_at = parse_iso(reset)
+        if reset_at and (started is None or reset_at <= started):
+            ready_at = max(ready_at, reset_at) if ready_at else reset_at
+    return ready_at
+
+
+def _stage_timing_records(data: dict) -> list:
+    """Compact per-stage timing rows: [agent, status, ts, wait_s, run_s]."""
+    if is_debate(data):
+        return []
+    records = []
+    for stage_id, stage in data.get("stages", {}).items():
+        started = parse_iso(stage.get("startedAt"))
+        completed = parse_iso(stage.get("completedAt"))
+        if started is None and completed is None:
+            continue
+
+        wait = run = None
+        if started is not None:
+            ready_at = _stage_ready_time(data, stage_id, stage)
+            if ready_at is not None:
+                wait = max(0.0, (started - ready_at).total_seconds())
+            if completed is not None and stage.get("status") in ("done", "failed"):
+                run = max(0.0, (completed - started).total_seconds())
+
+        ts = (completed or started).timestamp()
+        agent = stage.get("assignedAgent") or stage.get("agent", stage_id)
+        records.append([agent, stage.get("status"), ts, wait, run])
+    return records
+
+
+def _refresh_stats_rollup(rebuild: bool = False):
+    """Bring the per-project timing rollup up to date; only re-parses changed files.
+
+    Returns (records, rescanned_count, total_count).
+    """
+    rollup_path = state_path("stats-rollup.json")
+    rollup = {"version": STATS_ROLLUP_VERSION, "files": {}}
+    if not rebuild and os.path.exists(rollup_path):
+        try:
+            with open(rollup_path) as f:
+                cached = json.load(f)
+            if cached.get("version") == STATS_ROLLUP_VERSION:
+                rollup = cached
+        except (OSError, ValueError):
+            pass
+
+    files = rollup["files"]
+    seen = set()
+    rescanned = 0
+    for name, path in iter_project_files():
+        try:
+            st = os.stat(path)
+        except OSError:
+            continue
+        seen.add(name)
+        entry = files.get(name)
+        if entry and entry["mtime_ns"] == st.st_mtime_ns and entry["size"] == st.st_size:
+            continue
+        project = get_store().load(path, name)
+        records = _stage_timing_records(project.data) if project else []
+        files[name] = {"mtime_ns": st.st_mtime_ns, "size": st.st_size, "records": records}
+        rescanned += 1
+
+    removed = [name for name in files if name not in seen]
+    for name in removed:
+        del files[name]
+    if rescanned or removed or not os.path.exists(rollup_path):
+        write_json_atomic(rollup_path, rollup)
+
+    records = [r for entry in files.values() for r in entry["records"]]
+    return records, rescanned, len(files)
+
+
+def _percentile(sorted_values: list, pct: float):
+    """Nearest-rank percentile of an already-sorted list."""
+    if not sorted_values:
+        return None
+    rank = max(1, math.ceil(pct / 100 * len(sorted_values)))
+    return sorted_values[rank - 1]
+
+
+def _fmt_duration(seconds) -> str:
+    if seconds is None:
+        return "-"
+    if seconds < 60:
+        return f"{seconds:.0f}s"
+    if seconds < 3600:
+        return f"{seconds / 60:.1f}m"
+    if seconds < 86400:
+        return f"{seconds / 3600:.1f}h"
+    return f"{seconds / 86400:.1f}d"
+
+
+def _summarize_samples(values: list) -> dict:
+    values = sorted(values)
+    return {
+        "n": len(values),
+        "p50": _percentile(values, 50),
+        "p95": _percentile(values, 95),
+        "p99": _percentile(values, 99),
+    }
+
+
+def cmd_stats(args):
+    """Per-agent wait/run latency, failure rate and throughput across all projects."""
+    records, rescanned, total = _refresh_stats_rollup(rebuild=args.rebuild)
+
+    since = parse_iso(args.since) if args.since else None
+    if args.since and since is None:
+        print(f"Error: invalid --since timestamp '{args.since}'", file=sys.stderr)
+        sys.exit(1)
+    agents = set(args.agent.split(",")) if args.agent else None
+    fmt = STATS_WINDOWS.get(args.window)
+
+    groups = {}
+    for agent, status, ts, wait, run in records:
+        if agents and agent not in agents:
+            continue
+        if since and ts < since.timestamp():
+            continue
+        bucket = datetime.fromtimestamp(ts, timezone.utc).strftime(fmt) if fmt else "all"
+        g = groups.setdefault((bucket, agent), {"wait": [], "run": [], "done": 0, "failed": 0})
+        if wait is not None:
+            g["wait"].append(wait)
+        if run is not None:
+            g["run"].append(run)
+        if status == "done":
+            g["done"] += 1
+        elif status == "failed":
+            g["failed"] += 1
+
+    rows = []
+    for (bucket, agent), g in sorted(groups.items()):
+        finished = g["done"] + g["failed"]
+        rows.append({
+            "window": bucket,
+            "agent": agent,
+            "done": g["done"],
+            "failed": g["failed"],
+            "failureRate": round(g["failed"] / finished, 4) if finished else None,
+            "throughput": g["done"],
+            "waitSeconds": _summarize_samples(g["wait"]),
+            "runSeconds": _summarize_samples(g["run"]),
+        })
+
+    if args.json:
+        print(json.dumps({
+            "window": args.window,
+            "projects": total,
+            "rescanned": rescanned,
+            "rows": rows,
+        }, indent=2, ensure_ascii=False))
+        return
+
+    print(f"📈 Agent stats — window: {args.window}  ({total} projects, {rescanned} rescanned)")
+    if not rows:
+        print("\n  No timing data yet.")
+        return
+
+    current = None
+    for r in rows:
+        if r["window"] != current:
+            current = r["window"]
+            print(f"\n  🗓️  {current}")
+        w, rn = r["waitSeconds"], r["runSeconds"]
+        fail = f"{r['failureRate'] * 100:.0f}%" if r["failureRate"] is not None else "-"
+        print(
+            f"    {r['agent']:<16} done={r['done']:<4} failed={r['failed']:<3} fail%={fail:<5}"
+            f" wait p50/p95/p99={_fmt_duration(w['p50'])}/{_fmt_duration(w['p95'])}/{_fmt_duration(w['p99'])}"
+            f"  run p50/p95/p99={_fmt_duration(rn['p50'])}/{_fmt_duration(rn['p95'])}/{_fmt_duration(rn['p99'])}"
+        )
+
+
+# ── Burndown ────────────────────────────────────────────────────────
+#
+# .team-tasks/burndown/<project>.bin holds per-project status counts as a
+# fixed-size file of three ring buffers of fixed-width records
+# (epoch u32 + one u32 count per STATUS_NAMES entry):
+#   raw    — one record per status change, newest BURNDOWN_TIERS[0] slots
+#   hourly — records evicted from raw, last one per hour (14 days)
+#   daily  — records evicted from hourly, last one per day (2 years)
+# Each save that changes a stage status appends one record with a handful of
+# pread/pwrite calls; the file never grows. The tiers cover disjoint, ever
+# older time ranges, so reading daily + hourly + raw gives one sorted series.
+
+BURNDOWN_TIERS = ((0, 240), (3600, 14 * 24), (86400, 730))  # (bucket seconds, slots)
+_BURNDOWN_MAGIC = b"TTB1"
+_BURNDOWN_HEADER = struct.Struct("<4s" + "II" * len(BURNDOWN_TIERS))
+_BURNDOWN_RECORD = struct.Struct("<I" + "I" * len(STATUS_NAMES))
+
+
+def burndown_path(project: str, base_dir=None) -> str:
+    return os.path.join(os.fspath(base_dir or TASKS_DIR), STATE_DIR_NAME, "burndown", f"{project}.bin")
+
+
+class _BurndownFile:
+    """Ring-buffer access to one project's burndown file (caller holds the project lock)."""
+
+    def __init__(self, fd: int):
+        self.fd = fd
+        header = os.pread(fd, _BURNDOWN_HEADER.size, 0)
+        if len(header) < _BURNDOWN_HEADER.size or header[:4] != _BURNDOWN_MAGIC:
+            self.rings = [[0, 0] for _ in BURNDOWN_TIERS]
+            size = _BURNDOWN_HEADER.size + _BURNDOWN_RECORD.size * sum(cap for _, cap in BURNDOWN_TIERS)
+            os.ftruncate(fd, 0)
+            os.ftruncate(fd, size)
+            self.write_header()
+        else:
+            values = _BURNDOWN_HEADER.unpack(header)[1:]
+            self.rings = [[values[i], values[i + 1]] for i in range(0, len(values), 2)]
+        self.offsets = []
+        offset = _BURNDOWN_HEADER.size
+        for _, cap in BURNDOWN_TIERS:
+            self.offsets.append(offset)
+            offset += cap * _BURNDOWN_RECORD.size
+
+    def write_header(self):
+        flat = [v for ring in self.rings for v in ring]
+        os.pwrite(self.fd, _BURNDOWN_HEADER.pack(_BURNDOWN_MAGIC, *flat), 0)
+
+    def _slot(self, tier: int, slot: int) -> int:
+        return self.offsets[tier] + slot * _BURNDOWN_RECORD.size
+
+    def read_slot(self, tier: int, slot: int) -> tuple:
+        return _BURNDOWN_RECORD.unpack(os.pread(self.fd, _BURNDOWN_RECORD.size, self._slot(tier, slot)))
+
+    def write_slot(self, tier: int, slot: int, record: tuple):
+        os.pwrite(self.fd, _BURNDOWN_RECORD.pack(*record), self._slot(tier, slot))
+
+    def newest(self, tier: int):
+        head, count = self.rings[tier]
+        if not count:
+            return None
+        return self.read_slot(tier, (head + count - 1) % BURNDOWN_TIERS[tier][1])
+
+    def push(self, tier: int, record: tuple):
+        """Add a record to a tier, downsampling whatever falls off into the next one."""
+        bucket, cap = BURNDOWN_TIERS[tier]
+        head, count = self.rings[tier]
+        newest = self.newest(tier) if bucket else None
+        if newest and newest[0] // bucket == record[0] // bucket:
+            self.write_slot(tier, (head + count - 1) % cap, record)  # latest sample in the bucket wins
+            return
+        evicted = None
+        if count < cap:
+            self.write_slot(tier, (head + count) % cap, record)
+            self.rings[tier][1] = count + 1
+        else:
+            evicted = self.read_slot(tier, head)
+            self.write_slot(tier, head, record)
+            self.rings[tier][0] = (head + 1) % cap
+        if evicted and tier + 1 < len(BURNDOWN_TIERS):
+            self.push(tier + 1, evicted)
+
+    def series(self) -> list:
+        """Every stored record, oldest first."""
+        out = []
+        for tier in reversed(range(len(BURNDOWN_TIERS))):
+            head, count = self.rings[tier]
+            cap = BURNDOWN_TIERS[tier][1]
+            out.extend(self.read_slot(tier, (head + i) % cap) for i in range(count))
+        return out
+
+
+def _status_vector(data: dict) -> tuple:
+    counts = [0] * len(STATUS_NAMES)
+    codes = {name: i for i, name in enumerate(STATUS_NAMES)}
+    for stage in data.get("stages", {}).values():
+        code = codes.get(stage.get("status", "pending"))
+        if code is not None:
+            counts[code] += 1
+    return tuple(counts)
+
+
+def record_burndown(project: str, data: dict, before):
+    """Append a burndown sample if a stage status changed. Called by save_project."""
+    if is_debate(data) or not data.get("stages") or not hasattr(os, "pwrite"):
+        return  # non-POSIX platforms have no pread/pwrite: no burndown
+    if before is not None and before == _stage_statuses(data):
+        return
+    path = burndown_path(project)
+    os.makedirs(os.path.dirname(path), exist_ok=True)
+    fd = os.open(path, os.O_RDWR | os.O_CREAT, 0o644)
+    try:
+        ring = _BurndownFile(fd)
+        counts = _status_vector(data)
+        newest = ring.newest(0)
+        if newest and newest[1:] == counts:
+            return
+        ring.push(0, (int(time.time()),) + counts)
+        ring.write_header()
+    finally:
+        os.close(fd)
+
+
+def read_burndown(project: str, base_dir=None) -> list:
+    """[(epoch, {status: count}), ...] oldest first; empty if nothing was recorded."""
+    try:
+        fd = os.open(burndown_path(project, base_dir), os.O_RDONLY)
+    except FileNotFoundError:
+        return []
+    try:
+        if os.pread(fd, 4, 0) != _BURNDOWN_MAGIC:
+            return []
+        records = _BurndownFile(fd).series()
+    finally:
+        os.close(fd)
+    return [(r[0], dict(zip(STATUS_NAMES, r[1:]))) for r in records]
+
+
+def cmd_burndown(args):
+    """Emit a project's status-count time series (for charts)."""
+    load_project(args.project)  # existence check with the usual error
+    samples = read_burndown(args.project)
+    since = parse_iso(args.since) if args.since else None
+    if args.since and since is None:
+        print(f"Error: --since must be an ISO-8601 timestamp, got '{args.since}'", file=sys.stderr)
+        sys.exit(1)
+    if since:
+        samples = [s for s in samples if s[0] >= since.timestamp()]
+    bucket = {"raw": 0, "hour": 3600, "day": 86400}[args.every]
+    if bucket:
+        resampled = {}
+        for ts, counts in samples:
+            resampled[ts // bucket] = (ts // bucket * bucket, counts)  # last sample per bucket
+        samples = list(resampled.values())
+
+    rows = []
+    for ts, counts in samples:
+        row = {"time": datetime.fromtimestamp(ts, timezone.utc).isoformat()}
+        row.update(counts)
+        row["remaining"] = counts["pending"] + counts["in-progress"]
+        rows.append(row)
+    columns = ["time"] + STATUS_NAMES + ["remaining"]
+
+    if args.format == "json":
+        print(json.dumps(rows, indent=2, ensure_ascii=False))
+        return
+    if args.format == "csv":
+        writer = csv.writer(sys.stdout)
+        writer.writerow(columns)
+        for row in rows:
+            writer.writerow([row[c] for c in columns])
+        return
+    if not rows:
+        print(f"No burndown samples for '{args.project}' yet.")
+        return
+    shown = [c for c in STATUS_NAMES if any(r[c] for r in rows)] + ["remaining"]
+    print(f"📉 Burndown: {args.project} ({len(rows)} sample{'s' if len(rows) != 1 else ''}, every {args.every})")
+    print("  " + f"{'time':<20}" + "".join(f"{c:>13}" for c in shown))
+    for row in rows:
+        print("  " + f"{row['time'][:16].replace('T', ' '):<20}" + "".join(f"{row[c]:>13}" for c in shown))
+
+
+# ── Makespan simulation ─────────────────────────────────────────────
+#
+# Discrete-event simulation of the remaining work in a project. Each agent
+# (or pool) is a server with N slots and a FIFO queue; task durations are
+# drawn from that agent's historical run times (stats rollup). Done/skipped
+# tasks count as finished at t=0. Several runs give a makespan distribution.
+
+
+def _parse_concurrency(text: str) -> dict:
+    caps = {}
+    for item in filter(None, (part.strip() for part in (text or "").split(","))):
+        agent, sep, n = item.partition("=")
+        if not sep or not n.isdigit() or int(n) < 1:
+            print(f"Error: --concurrency expects agent=N[,agent=N...], got '{item}'", file=sys.stderr)
+            sys.exit(1)
+        caps[agent] = int(n)
+    return caps
+
+
+def _simulation_graph(data: dict):
+    """Return (ids, agents, deps, remaining) for the not-yet-finished part of a project."""
+    stages = data["stages"]
+    if is_dag(data):
+        ids = list(stages)
+        # Other projects' tasks are outside the simulation; treat them as available.
+        deps = [[d for d in stages[t].get("dependsOn") or [] if not split_ref(data, d)] for t in ids]
+    else:
+        ids = [s for s in pipeline_stages(data) if s in stages]
+        deps = [pipeline_upstream(data, t) for t in ids]
+    index = {t: i for i, t in enumerate(ids)}
+    finished = [stages[t].get("status") in ("done", "skipped") for t in ids]
+    agents = [stages[t].get("agent", t) for t in ids]
+    dep_idx = [[index[d] for d in ds if d in index and not finished[index[d]]] for ds in deps]
+    missing = [t for t, ds in zip(ids, deps) if any(d not in index for d in ds)]
+    if missing:
+        print(f"Error: tasks with unknown dependencies cannot be simulated: {', '.join(missing[:5])}",
+              file=sys.stderr)
+        sys.exit(1)
+    remaining = [i for i in range(len(ids)) if not finished[i]]
+    return ids, agents, dep_idx, remaining
+
+
+def _simulate_once(ids, agents, dep_idx, remaining, samples, caps, rng):
+    """One simulation run; returns (makespan, busy, waits, max_queue)."""
+    unmet = {i: len(dep_idx[i]) for i in remaining}
+    rdeps = {i: [] for i in remaining}
+    for i in remaining:
+        for d in dep_idx[i]:
+            rdeps[d].append(i)
+
+    queues = {}
+    running = dict.fromkeys(caps, 0)
+    busy = dict.fromkeys(caps, 0.0)
+    max_queue = dict.fromkeys(caps, 0)
+    waits = {}
+    events = []
+    seq = 0
+
+    def start(i, now):
+        nonlocal seq
+        agent = agents[i]
+        running[agent] += 1
+        duration = rng.choice(samples[agent])
+        busy[agent] += duration
+        heapq.heappush(events, (now + duration, seq, i))
+        seq += 1
+
+    def enqueue(i, now):
+        agent = agents[i]
+        if running[agent] < caps[agent]:
+            waits[i] = 0.0
+            start(i, now)
+        else:
+            q = queues.setdefault(agent, deque())
+            q.append((i, now))
+            max_queue[agent] = max(max_queue[agent], len(q))
+
+    for i in remaining:
+        if unmet[i] == 0:
+            enqueue(i, 0.0)
+
+    now = 0.0
+    while events:
+        now, _, i = heapq.heappop(events)
+        agent = agents[i]
+        running[agent] -= 1
+        q = queues.get(agent)
+        if q:
+            j, queued_at = q.popleft()
+            waits[j] = now - queued_at
+            start(j, now)
+        for j in rdeps[i]:
+            unmet[j] -= 1
+            if unmet[j] == 0:
+                enqueue(j, now)
+    if len(waits) < len(remaining):
+        print("Error: dependency cycle; some tasks can never start", file=sys.stderr)
+        sys.exit(1)
+    return now, busy, waits, max_queue
+
+
+def cmd_simulate(args):
+    """Predict makespan, utilisation and queueing for the remaining work."""
+    if args.runs < 1 or args.default_concurrency < 1:
+        print("Error: --runs and --default-concurrency must be at least 1", file=sys.stderr)
+        sys.exit(1)
+    data = load_project(args.project)
+    ensure_stage_mode(data, "simulate")
+    ids, agents, dep_idx, remaining = _simulation_graph(data)
+    if not remaining:
+        print(f"✅ Nothing left to run in {args.project}.")
+        return
+
+    history = {}
+    for agent, _, _, _, run in _refresh_stats_rollup()[0]:
+        if run is not None:
+            history.setdefault(agent, []).append(run)
+    fallback = sorted(r for runs in history.values() for r in runs)
+    default = parse_duration(args.default_duration) if args.default_duration else None
+    if default is None:
+        default = _percentile(fallback, 50) if fallback else 600.0
+
+    overrides = _parse_concurrency(args.concurrency)
+    samples, caps, sources = {}, {}, {}
+    for agent in sorted({agents[i] for i in remaining}):
+        members = pool_members(agent) if is_pool(agent) else [agent]
+        runs = [r for m in members + ([agent] if is_pool(agent) else []) for r in history.get(m, [])]
+        samples[agent] = runs or [default]
+        sources[agent] = len(runs)
+        caps[agent] = overrides.get(agent, args.default_concurrency * len(members))
+
+    rng = random.Random(args.seed)
+    makespans = []
+    busy_total = dict.fromkeys(caps, 0.0)
+    wait_total = [0.0] * len(ids)
+    queue_peak = dict.fromkeys(caps, 0)
+    for _ in range(args.runs):
+        makespan, busy, waits, max_queue = _simulate_once(ids, agents, dep_idx, remaining, samples, caps, rng)
+        makespans.append(makespan)
+        for agent in caps:
+            if makespan > 0:
+                busy_total[agent] += busy[agent] / (caps[agent] * makespan)
+            queue_peak[agent] = max(queue_peak[agent], max_queue[agent])
+        for i, w in waits.items():
+            wait_total[i] += w
+
+    makespans.sort()
+    per_agent = []
+    for agent in sorted(caps):
+        agent_waits = [wait_total[i] / args.runs for i in remaining if agents[i] == agent]
+        per_agent.append({
+            "agent": agent,
+            "tasks": len(agent_waits),
+            "concurrency": caps[agent],
+            "samples": sources[agent],
+            "utilisation": round(busy_total[agent] / args.runs, 4),
+            "avgQueueWaitSeconds": round(sum(agent_waits) / len(agent_waits), 3),
+            "peakQueue": queue_peak[agent],
+        })
+    hot = sorted(remaining, key=lambda i: -wait_total[i])[:args.top]
+    hot_spots = [{"task": ids[i], "agent": agents[i], "avgWaitSeconds": round(wait_total[i] / args.runs, 3)}
+                 for i in hot if wait_total[i] > 0]
+    result = {
+        "project": args.project,
+        "tasks": len(remaining),
+        "runs": args.runs,
+        "makespanSeconds": {
+            "p10": round(_percentile(makespans, 10), 3),
+            "p50": round(_percentile(makespans, 50), 3),
+            "p90": round(_percentile(makespans, 90), 3),
+        },
+        "agents": per_agent,
+        "hotSpots": hot_spots,
+    }
+
+    if args.json:
+        print(json.dumps(result, indent=2, ensure_ascii=False))
+        return
+
+    m = result["makespanSeconds"]
+    print(f"⏱️  Simulated {len(remaining)} remaining tasks in {args.project} ({args.runs} runs)")
+    print(f"  Makespan p10/p50/p90: {_fmt_duration(m['p10'])}/{_fmt_duration(m['p50'])}/{_fmt_duration(m['p90'])}")
+    print("\n  Agents:")
+    for a in per_agent:
+        note = "" if a["samples"] else f"  (no history, assumed {_fmt_duration(default)})"
+        print(f"    {a['agent']:<16} x{a['concurrency']:<3} tasks={a['tasks']:<5} util={a['utilisation'] * 100:5.1f}%"
+              f"  avg wait={_fmt_duration(a['avgQueueWaitSeconds'])}  peak queue={a['peakQueue']}{note}")
+    if hot_spots:
+        print("\n  Queue hot spots:")
+        for h in hot_spots:
+            print(f"    {h['task']:<24} ({h['agent']}) waits {_fmt_duration(h['avgWaitSeconds'])}")
 
 
 # ── Main ────────────────────────────────────────────────────────────
 
 def main():
+    global _hooks_enqueued
     parser = argparse.ArgumentParser(description="Team Tasks — multi-agent pipeline & DAG manager")
     sub = parser.add_subparsers(dest="command", help="Command")
 
@@ -994,14 +5064,25 @@ def main():
     p.add_argument("--pipeline", "-p", help="Comma-separated agent order (linear mode only)")
     p.add_argument("--workspace", "-w", help="Shared workspace path for all agents")
     p.add_argument("--force", "-f", action="store_true", help="Overwrite existing project")
+    p.add_argument("--parent", help="Parent project; this project's progress rolls up into it")
+    p.add_argument("--memoize", action="store_true", help="Reuse cached results for tasks whose inputs are unchanged")
+    p.add_argument("--on-failure", choices=FAILURE_POLICIES,
+                   help="Failure policy (default: config failurePolicy, else block)")
 
     # add (dag only)
     p = sub.add_parser("add", help="Add a task to DAG project")
     p.add_argument("project", help="Project name")
     p.add_argument("task_id", help="Task ID (unique)")
     p.add_argument("--agent", "-a", help="Agent to assign (defaults to task_id)")
-    p.add_argument("--depends", "-d", help="Comma-separated dependency task IDs")
+    p.add_argument("--depends", "-d", help="Comma-separated dependency task IDs (project:task for other projects)")
     p.add_argument("--desc", help="Task description")
+    p.add_argument("--command", dest="shell_command", help="Shell command; lets 'run' execute the task locally")
+    p.add_argument("--map", action="store_true", help="Fan out: output (a JSON list) becomes one task per item")
+    p.add_argument("--item-agent", help="Agent for generated item tasks (default: this task's agent)")
+    p.add_argument("--item-task", help="Item task template; {item} and {index} are substituted")
+    p.add_argument("--reduce-id", help="ID of the generated reduce task (default: <task_id>.reduce)")
+    p.add_argument("--reduce-agent", help="Agent for the reduce task (default: this task's agent)")
+    p.add_argument("--reduce-task", help="Reduce task description")
 
     # add-debater (debate only)
     p = sub.add_parser("add-debater", help="Add a debater to debate project")
@@ -1016,33 +5097,69 @@ def main():
                    help="Round action")
     p.add_argument("agent_id", nargs="?", help="Debater agent ID (collect only)")
     p.add_argument("content", nargs="?", help="Response/review text (collect only)")
+    p.add_argument("--cluster", action="store_true",
+                   help="Condense synthesis by clustering similar responses (synthesize only)")
+    p.add_argument("--threshold", type=float, default=0.25,
+                   help="Similarity threshold 0-1 for --cluster (default: 0.25)")
 
     # status
     p = sub.add_parser("status", help="Show project status")
     p.add_argument("project", help="Project name")
     p.add_argument("--json", "-j", action="store_true", help="Output raw JSON")
+    p.add_argument("--if-changed-since", type=int, metavar="VERSION",
+                   help=f"Exit {NOT_MODIFIED_EXIT} without output if the project is still at VERSION")
 
     # assign
     p = sub.add_parser("assign", help="Set task for a stage")
     p.add_argument("project", help="Project name")
     p.add_argument("stage", help="Stage/task ID")
     p.add_argument("task", help="Task description")
+    p.add_argument("--command", dest="shell_command", help="Shell command for 'run' to execute ('' removes it)")
 
     # update
     p = sub.add_parser("update", help="Update stage/task status")
     p.add_argument("project", help="Project name")
     p.add_argument("stage", help="Stage/task ID")
-    p.add_argument("status", help="New status: pending|in-progress|done|failed|skipped")
+    p.add_argument("status", help="New status: pending|in-progress|done|failed|skipped|cancelled")
 
     # next (linear)
     p = sub.add_parser("next", help="Get next stage (linear) or ready tasks (dag)")
     p.add_argument("project", help="Project name")
     p.add_argument("--json", "-j", action="store_true", help="Output JSON")
+    p.add_argument("--if-changed-since", type=int, metavar="VERSION",
+                   help=f"Exit {NOT_MODIFIED_EXIT} without output if the project is still at VERSION")
 
     # ready (dag)
     p = sub.add_parser("ready", help="Get all dispatchable tasks (dag mode)")
     p.add_argument("project", help="Project name")
     p.add_argument("--json", "-j", action="store_true", help="Output JSON")
+    p.add_argument("--output-tail", type=int, help="Include only the last N bytes of each dependency output")
+    p.add_argument("--target", "-t", help="Only tasks that feed these task IDs (comma-separated)")
+    p.add_argument("--skip-rest", action="store_true", help="With --target, mark tasks outside the closure skipped")
+    p.add_argument("--if-changed-since", type=int, metavar="VERSION",
+                   help=f"Exit {NOT_MODIFIED_EXIT} without output if the project is still at VERSION")
+
+    # claim / renew / release
+    p = sub.add_parser("claim", help="Atomically claim ready task(s) under a lease")
+    p.add_argument("project", help="Project name")
+    p.add_argument("--target", "-t", help="Only claim tasks that feed these task IDs (comma-separated)")
+    p.add_argument("--skip-rest", action="store_true", help="With --target, mark tasks outside the closure skipped")
+    p.add_argument("--agent", "-a", help="Only claim tasks for these agent IDs (comma-separated)")
+    p.add_argument("--owner", "-o", help="Lease owner ID (default: <hostname>:<pid>)")
+    p.add_argument("--lease", "-l", default="10m", help="Lease duration, e.g. 30s, 10m, 2h (default: 10m)")
+    p.add_argument("--count", "-n", type=int, default=1, help="Max tasks to claim (default: 1)")
+    p.add_argument("--json", "-j", action="store_true", help="Output JSON")
+
+    p = sub.add_parser("renew", help="Extend a task lease")
+    p.add_argument("project", help="Project name")
+    p.add_argument("stage", help="Stage/task ID")
+    p.add_argument("--owner", "-o", required=True, help="Lease owner ID")
+    p.add_argument("--lease", "-l", default="10m", help="New lease duration from now (default: 10m)")
+
+    p = sub.add_parser("release", help="Release a claimed task back to pending")
+    p.add_argument("project", help="Project name")
+    p.add_argument("stage", help="Stage/task ID")
+    p.add_argument("--owner", "-o", required=True, help="Lease owner ID")
 
     # log
     p = sub.add_parser("log", help="Add log entry")
@@ -1054,13 +5171,26 @@ def main():
     p = sub.add_parser("result", help="Set stage/task output")
     p.add_argument("project", help="Project name")
     p.add_argument("stage", help="Stage/task ID")
-    p.add_argument("output", help="Output/result text")
+    p.add_argument("output", nargs="?", help="Output/result text")
+    p.add_argument("--append", action="store_true", help="Append to existing output instead of replacing it")
+    p.add_argument("--stdin", action="store_true", help="Stream output from stdin, appending as it arrives")
+    p.add_argument("--flush-interval", type=float, default=2.0,
+                   help="Seconds between project updates while streaming (default: 2)")
+
+    # output
+    p = sub.add_parser("output", help="Read stage/task output (range or tail)")
+    p.add_argument("project", help="Project name")
+    p.add_argument("stage", help="Stage/task ID")
+    p.add_argument("--offset", type=int, default=0, help="Start byte offset")
+    p.add_argument("--length", type=int, help="Number of bytes to read")
+    p.add_argument("--tail", type=int, help="Read only the last N bytes")
 
     # reset
     p = sub.add_parser("reset", help="Reset stage/task(s)")
     p.add_argument("project", help="Project name")
     p.add_argument("stage", nargs="?", help="Stage to reset (or --all)")
     p.add_argument("--all", "-a", action="store_true", help="Reset all")
+    p.add_argument("--no-cache", action="store_true", help="Don't complete reset tasks from the result cache")
 
     # history
     p = sub.add_parser("history", help="Show stage/task log history")
@@ -1072,13 +5202,116 @@ def main():
     p.add_argument("project", help="Project name")
 
     # list
-    sub.add_parser("list", help="List all projects")
+    sub.add_parser("list", help="List all projects (sub-projects under their parent)")
+
+    # parent
+    p = sub.add_parser("parent", help="Set or clear a project's parent project")
+    p.add_argument("project", help="Project name")
+    p.add_argument("parent", nargs="?", help="Parent project name")
+    p.add_argument("--clear", action="store_true", help="Make the project top-level again")
+
+    # migrate-layout
+    p = sub.add_parser("migrate-layout", help="Switch TASKS_DIR between flat and sharded layouts")
+    p.add_argument("--to", choices=["flat", "sharded"], required=True, help="Target layout")
+    p.add_argument("--dry-run", action="store_true", help="Show what would move without changing anything")
+
+    # export
+    p = sub.add_parser("export", help="Stream stage/log rows across projects as NDJSON or CSV")
+    p.add_argument("--rows", choices=["stages", "logs"], default="stages", help="One row per stage or per log event")
+    p.add_argument("--format", "-f", choices=["ndjson", "csv"], default="ndjson", help="Output format")
+    p.add_argument("--columns", "-c", help="Comma-separated columns to emit (default: all)")
+    p.add_argument("--project", "-p", action="append", help="Only export this project (repeatable)")
+    p.add_argument("--since", help="Only rows at/after this ISO timestamp")
+    p.add_argument("--until", help="Only rows before this ISO timestamp")
+    p.add_argument("--archived", action="store_true", help="Include compacted log archives (--rows logs)")
+    p.add_argument("--output", "-o", help="Write to file instead of stdout")
+
+    # run
+    p = sub.add_parser("run", help="Execute ready tasks that have a shell command (process pool)")
+    p.add_argument("project", help="Project name")
+    p.add_argument("--jobs", "-j", type=int, default=os.cpu_count() or 1, help="Parallel processes (default: CPU count)")
+    p.add_argument("--agent", "-a", help="Only run tasks for these agent IDs, or pools they belong to (comma-separated)")
+    p.add_argument("--timeout", help="Kill and fail a task after this long (e.g. 30m)")
+    p.add_argument("--lease", default="5m", help="Lease held on running tasks, renewed while they run")
+    p.add_argument("--flush-interval", type=float, default=2.0, help="Seconds between output flushes")
+    p.add_argument("--verbose", "-v", action="store_true", help="Echo task output to the terminal")
+
+    # simulate
+    p = sub.add_parser("simulate", help="Simulate remaining makespan from historical agent durations")
+    p.add_argument("project", help="Project name")
+    p.add_argument("--concurrency", "-c", help="Per-agent slots, e.g. code-agent=3,test-agent=2")
+    p.add_argument("--default-concurrency", type=int, default=1, help="Slots per agent (per pool member) otherwise")
+    p.add_argument("--default-duration", help="Duration for agents with no history (default: global median)")
+    p.add_argument("--runs", "-n", type=int, default=20, help="Number of simulation runs")
+    p.add_argument("--seed", type=int, help="Random seed for reproducible runs")
+    p.add_argument("--top", type=int, default=5, help="Number of queue hot spots to show")
+    p.add_argument("--json", "-j", action="store_true", help="Output JSON")
+
+    # compact
+    p = sub.add_parser("compact", help="Archive old logs/responses (all projects by default)")
+    p.add_argument("project", nargs="?", help="Only compact this project")
+    p.add_argument("--older-than", help="Archive entries older than this (e.g. 30d)")
+    p.add_argument("--keep", type=int, help="Keep at most N newest entries per stage/debater")
+    p.add_argument("--dry-run", action="store_true", help="Report without changing files")
+
+    # cache
+    p = sub.add_parser("cache", help="Show or clear the result memoization cache")
+    p.add_argument("--clear", action="store_true", help="Remove all cached results")
+
+    # hooks
+    p = sub.add_parser("hooks", help="Transition hooks: list, status, work (drain queue), retry")
+    p.add_argument("action", nargs="?", choices=["status", "list", "work", "retry"], default="status")
+    p.add_argument("project", nargs="?", help="Include this project's hooks (list)")
+    p.add_argument("--once", action="store_true", help="work: run due jobs once and exit")
+    p.add_argument("--concurrency", type=int, help="work: parallel hook processes (default: hookWorker.concurrency or 4)")
+    p.add_argument("--limit", type=int, default=10, help="status: failed jobs to show")
+
+    # stale
+    p = sub.add_parser("stale", help="List active stages idle longer than a threshold (activity index)")
+    p.add_argument("--older-than", default="10m", help="Idle threshold (default: 10m)")
+    p.add_argument("--agent", "-a", help="Comma-separated agent IDs to include")
+    p.add_argument("--rebuild", action="store_true", help="Rebuild the index from a full scan first")
+    p.add_argument("--json", "-j", action="store_true", help="Output JSON")
+
+    # xdeps
+    p = sub.add_parser("xdeps", help="Show the cross-project dependency index")
+    p.add_argument("project", nargs="?", help="Only edges touching this project")
+    p.add_argument("--rebuild", action="store_true", help="Rescan all projects and re-sync cached upstream statuses")
+    p.add_argument("--json", "-j", action="store_true", help="Output JSON")
+
+    # commit-stats
+    p = sub.add_parser("commit-stats", help="Show durability mode and group-commit metrics")
+    p.add_argument("--json", "-j", action="store_true", help="Output JSON")
+
+    # burndown
+    p = sub.add_parser("burndown", help="Emit a project's status-count time series")
+    p.add_argument("project", help="Project name")
+    p.add_argument("--every", choices=["raw", "hour", "day"], default="hour",
+                   help="Resolution: every change, or last sample per hour/day (default: hour)")
+    p.add_argument("--since", help="Only samples at/after this ISO timestamp")
+    p.add_argument("--format", "-f", choices=["table", "json", "csv"], default="table", help="Output format")
+
+    # stats
+    p = sub.add_parser("stats", help="Per-agent latency/throughput analytics across projects")
+    p.add_argument("--window", "-w", choices=["hour", "day", "week", "month", "all"], default="day",
+                   help="Time bucket for aggregation (default: day)")
+    p.add_argument("--agent", "-a", help="Comma-separated agent IDs to include")
+    p.add_argument("--since", help="Only include stages finished/started after this ISO timestamp")
+    p.add_argument("--rebuild", action="store_true", help="Discard the cached rollup and rescan all projects")
+    p.add_argument("--json", "-j", action="store_true", help="Output JSON")
 
     args = parser.parse_args()
     if not args.command:
         parser.print_help()
         sys.exit(1)
 
+    # Commands that read-modify-write a project run under its lock so
+    # concurrent agents/dispatchers cannot lose each other's updates.
+    locked = {
+        "init", "add", "add-debater", "round", "assign", "update",
+        "log", "result", "reset", "claim", "renew", "release", "parent",
+    }
+
     cmds = {
         "init": cmd_init,
         "add": cmd_add,
@@ -1091,12 +5324,51 @@ def main():
         "ready": cmd_ready,
         "log": cmd_log,
         "result": cmd_result,
+        "output": cmd_output,
         "reset": cmd_reset,
         "history": cmd_history,
         "graph": cmd_graph,
         "list": cmd_list,
+        "parent": cmd_parent,
+        "stats": cmd_stats,
+        "burndown": cmd_burndown,
+        "migrate-layout": cmd_migrate_layout,
+        "commit-stats": cmd_commit_stats,
+        "hooks": cmd_hooks,
+        "cache": cmd_cache,
+        "compact": cmd_compact,
+        "export": cmd_export,
+        "simulate": cmd_simulate,
+        "run": cmd_run,
+        "stale": cmd_stale,
+        "xdeps": cmd_xdeps,
+        "claim": cmd_claim,
+        "renew": cmd_renew,
+        "release": cmd_release,
     }
-    cmds[args.command](args)
+    if getattr(args, "skip_rest", False):
+        locked.add(args.command)
+
+    exit_if_unchanged(args)
+    if args.command in locked and not getattr(args, "stdin", False):
+        with project_lock(args.project):
+            cmds[args.command](args)
+    else:
+        cmds[args.command](args)
+
+    # Grouped durability: commit journaled ops after the project lock is released.
+    # Each project leaves the set once committed, so later main() calls in the
+    # same process (library callers, stress_test --mode inproc) don't re-wait.
+    for project in sorted(_pending_group_commits):
+        group_commit(project)
+        _pending_group_commits.discard(project)
+    # Cross-project unblocking, also outside the command's lock.
+    flush_xdep_updates()
+
+    if _hooks_enqueued:
+        _hooks_enqueued = False
+        if args.command != "hooks":
+            spawn_hook_worker()
 
 
 if __name__ == "__main__":